@@ -1,7 +1,16 @@
 """
 Redis protocol implementation for asyncio (PEP 3156)
 """
+from .caching import *
+from .cluster import *
 from .connection import *
 from .exceptions import *
+from .migration import *
 from .pool import *
 from .protocol import *
+from .pubsub import *
+from .queues import *
+from .replication import *
+from .sentinel import *
+from .sharding import *
+from .streams import *
@@ -0,0 +1,501 @@
+from .connection import Connection
+from .exceptions import Error, ErrorReply
+from .log import logger
+from .protocol import _read_only_commands
+from .sharding import _get_keys
+
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from functools import wraps
+import asyncio
+import logging
+import sys
+
+
+__all__ = ('NearCache', 'TTLCache')
+
+
+def _sizeof(value):
+    """ Estimate the memory used by a cached value. """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, set, tuple, frozenset)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class _BaseCache:
+    """
+    Counters and connection bookkeeping, shared by the caches.
+    """
+    #: Commands that are cached by default.
+    DEFAULT_COMMANDS = ('get', 'hget', 'hgetall_asdict', 'smembers_asset')
+
+    #: Connections don't enable ``CLIENT TRACKING`` when this is None.
+    client_id = None
+
+    def _init_counters(self):
+        self._connections = set() # Connections that use this cache.
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    @property
+    def hits(self):
+        """ Number of replies served from the cache. """
+        return self._hits
+
+    @property
+    def misses(self):
+        """ Number of cacheable commands that were sent to the server. """
+        return self._misses
+
+    @property
+    def invalidations(self):
+        """ Number of invalidated keys. """
+        return self._invalidations
+
+    @property
+    def evictions(self):
+        """ Number of entries dropped because the cache was full. """
+        return self._evictions
+
+    def _register(self, connection):
+        self._connections.add(connection)
+
+    def _unregister(self, connection):
+        self._connections.discard(connection)
+
+
+class NearCache(_BaseCache):
+    """
+    Client side cache for the replies of read commands, with server assisted
+    invalidation. (Requires Redis 6.)
+
+    The cache has its own connection, subscribed to ``__redis__:invalidate``.
+    Connections created with ``near_cache=...`` enable ``CLIENT TRACKING`` with
+    their invalidation messages redirected to that connection. Cache hits
+    don't touch the network; a key is dropped from the cache as soon as Redis
+    reports that it was modified.
+
+    When the invalidation connection is lost, the cache is cleared and
+    bypassed until it has reconnected.
+
+    The cached values are shared between callers, so don't modify them.
+
+    ::
+
+        cache = yield from NearCache.create(host='localhost', port=6379, max_entries=1000)
+        pool = yield from Pool.create(host='localhost', port=6379, poolsize=10, near_cache=cache)
+        result = yield from pool.hgetall_asdict('config') # Cached.
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, host='localhost', port=6379, *, password=None, max_entries=10000,
+               max_memory=None, commands=_BaseCache.DEFAULT_COMMANDS, check_interval=1, loop=None):
+        """
+        :param host: Address, either host or unix domain socket path
+        :type host: str
+        :param port: TCP port. If port is 0 then host assumed to be unix socket path
+        :type port: int
+        :param password: Redis database password
+        :type password: bytes
+        :param max_entries: Maximum number of cached replies.
+        :type max_entries: int
+        :param max_memory: (optional) Maximum estimated size of the cache in bytes.
+        :type max_memory: int
+        :param commands: Names of the (read-only) commands to cache. Their first argument should be the key.
+        :type commands: list
+        :param check_interval: Seconds between checks of the invalidation connection.
+        :type check_interval: float
+        :param loop: (optional) asyncio event loop.
+        """
+        self = cls()
+        self._host = host
+        self._port = port
+        self._password = password
+        self._max_entries = max_entries
+        self._max_memory = max_memory
+        self._check_interval = check_interval
+        self._loop = loop or asyncio.get_event_loop()
+        self.commands = frozenset(commands)
+
+        self._entries = OrderedDict() # Maps (command, db, key, args, kwargs) to (value, size).
+        self._keys = {} # Maps the key (bytes) to the set of its entries.
+        self._in_flight = {} # Maps the key (bytes) to the tokens of the pending reads.
+        self._memory = 0
+        self._init_counters()
+
+        #: ID of the invalidation connection. None while it's not connected.
+        self.client_id = None
+
+        yield from self._connect()
+        self._listen_task = asyncio.async(self._listen(), loop=self._loop)
+        return self
+
+    def __repr__(self):
+        return 'NearCache(host=%r, port=%r, entries=%r)' % (self._host, self._port, len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def memory(self):
+        """ Estimated size of the cached values in bytes. """
+        return self._memory
+
+    @property
+    def active(self):
+        """ True when the invalidation connection is up, and the cache is used. """
+        return self.client_id is not None and self._connection.protocol.is_connected
+
+    @asyncio.coroutine
+    def _connect(self):
+        self._connection = yield from Connection.create(host=self._host, port=self._port,
+                                password=self._password, auto_reconnect=False, loop=self._loop)
+        client_id = yield from self._connection.client_id()
+
+        # Invalidations are applied right when they are parsed.
+        self._subscription = yield from self._connection.start_subscribe()
+        self._subscription.add_handler('__redis__:invalidate', self._handle_invalidation)
+        yield from self._subscription.subscribe(['__redis__:invalidate'])
+
+        self.clear()
+        self.client_id = client_id
+
+        # Connections that redirected to our previous ID don't send
+        # invalidations anymore. Make them reconnect.
+        for connection in list(self._connections):
+            if connection.transport:
+                connection.transport.close()
+
+    @asyncio.coroutine
+    def _listen(self):
+        while True:
+            while self._connection.protocol.is_connected:
+                yield from asyncio.sleep(self._check_interval, loop=self._loop)
+
+            # We could have missed invalidations: start over.
+            logger.log(logging.WARNING, 'Near cache invalidation connection lost')
+            self.client_id = None
+            self.clear()
+            self._connection.close()
+
+            try:
+                yield from self._connect()
+            except (Error, ErrorReply) as e:
+                logger.log(logging.WARNING, 'Near cache reconnect failed: %r' % e)
+                yield from asyncio.sleep(self._check_interval, loop=self._loop)
+
+    def _handle_invalidation(self, reply):
+        # The message is an array of keys, or nil when the database was flushed.
+        value = reply.value
+        if value is None:
+            self.clear()
+            return
+
+        for key in value:
+            self.invalidate(key)
+
+    def invalidate(self, key):
+        """
+        Drop all cached replies for this key (bytes).
+        """
+        self._invalidations += 1
+
+        # Replies for reads that are in flight can be older than this invalidation.
+        self._in_flight.pop(key, None)
+
+        for cache_key in self._keys.pop(key, ()):
+            value, size = self._entries.pop(cache_key)
+            self._memory -= size
+
+    def clear(self):
+        """
+        Drop all cached replies.
+        """
+        self._entries.clear()
+        self._keys.clear()
+        self._in_flight.clear()
+        self._memory = 0
+
+    def _store(self, key, cache_key, value):
+        size = _sizeof(value) + _sizeof(cache_key)
+        if self._max_memory is not None and size > self._max_memory:
+            return
+
+        self._entries[cache_key] = (value, size)
+        self._keys.setdefault(key, set()).add(cache_key)
+        self._memory += size
+
+        # Evict the least recently used entries.
+        while len(self._entries) > self._max_entries or (
+                    self._max_memory is not None and self._memory > self._max_memory):
+            cache_key, (value, size) = self._entries.popitem(last=False)
+            self._memory -= size
+            self._evictions += 1
+
+            keys = self._keys[cache_key[2]]
+            keys.discard(cache_key)
+            if not keys:
+                del self._keys[cache_key[2]]
+
+    def _wrap(self, protocol, name):
+        """
+        Return command `name` of this protocol, with caching.
+        """
+        method = getattr(protocol, name)
+
+        if name not in self.commands:
+            return method
+
+        @wraps(method)
+        @asyncio.coroutine
+        def call(*a, **kw):
+            if not self.active:
+                return (yield from method(*a, **kw))
+
+            if 'key' in kw:
+                key = kw['key']
+                args = a
+            else:
+                key = a[0]
+                args = a[1:]
+            key = protocol.encode_from_native(key)
+            cache_key = (name, protocol.db, key, args, tuple(sorted(kw.items())))
+
+            try:
+                value, size = self._entries[cache_key]
+            except KeyError:
+                pass
+            else:
+                self._entries.move_to_end(cache_key)
+                self._hits += 1
+                return value
+
+            self._misses += 1
+            token = object()
+            self._in_flight.setdefault(key, set()).add(token)
+            try:
+                value = yield from method(*a, **kw)
+
+                # Only store the reply when the key was not invalidated in
+                # the meantime.
+                if token in self._in_flight.get(key, ()):
+                    self._store(key, cache_key, value)
+                return value
+            finally:
+                tokens = self._in_flight.get(key)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._in_flight[key]
+        return call
+
+    def close(self):
+        """
+        Stop the invalidation connection and clear the cache.
+        """
+        self._listen_task.cancel()
+        self._connection.close()
+        self.client_id = None
+        self.clear()
+
+
+class TTLCache(_BaseCache):
+    """
+    Local read-through cache for keys that match the given patterns. Cached
+    replies expire after the TTL of their pattern. (For Redis versions
+    without ``CLIENT TRACKING``. Changes made by other clients are only
+    seen after the TTL.)
+
+    Writes made through a connection that uses this cache invalidate the
+    cached replies of their keys. (Writes inside transactions and scripts are
+    not seen.) Concurrent misses for the same reply share one request.
+
+    The cached values are shared between callers, so don't modify them.
+
+    ::
+
+        cache = TTLCache({ 'config:*': 5, 'flags:*': (1, 100) })
+        pool = yield from Pool.create(host='localhost', port=6379, poolsize=10, near_cache=cache)
+        result = yield from pool.hgetall_asdict('config:main') # Cached for 5 seconds.
+    """
+    def __init__(self, patterns, *, max_entries=1000, commands=_BaseCache.DEFAULT_COMMANDS, loop=None):
+        """
+        :param patterns: Dictionary mapping glob-style key patterns to either a
+                         TTL in seconds, or a ``(ttl, max_entries)`` tuple.
+                         Keys are matched against the first pattern that fits.
+                         (Patterns have the native type of the keys.)
+        :type patterns: dict
+        :param max_entries: Default maximum number of cached replies per pattern.
+        :type max_entries: int
+        :param commands: Names of the (read-only) commands to cache. Their first argument should be the key.
+        :type commands: list
+        :param loop: (optional) asyncio event loop.
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        self.commands = frozenset(commands)
+
+        # One LRU per pattern: (pattern, ttl, max_entries, OrderedDict),
+        # the dict maps (command, db, key, args, kwargs) to (value, expiry time).
+        self._regions = []
+        for pattern, value in patterns.items():
+            ttl, max_size = value if isinstance(value, tuple) else (value, max_entries)
+            self._regions.append((pattern, ttl, max_size, OrderedDict()))
+
+        self._keys = {} # Maps the key (bytes) to the set of its entries.
+        self._pending = {} # Maps (command, db, key, args, kwargs) to the Future of the request.
+        self._coalesced = 0
+        self._init_counters()
+
+    def __repr__(self):
+        return 'TTLCache(patterns=%r, entries=%r)' % ([ r[0] for r in self._regions ], len(self))
+
+    def __len__(self):
+        return sum(len(r[3]) for r in self._regions)
+
+    @property
+    def coalesced(self):
+        """ Number of misses that waited for a request that was already in flight. """
+        return self._coalesced
+
+    def _get_region(self, key):
+        """ Return the region of the first pattern that matches this (native) key. """
+        for region in self._regions:
+            if fnmatchcase(key, region[0]):
+                return region
+
+    def invalidate(self, key):
+        """
+        Drop all cached replies for this key (bytes).
+        """
+        self._invalidations += 1
+
+        for cache_key in self._keys.pop(key, ()):
+            for region in self._regions:
+                region[3].pop(cache_key, None)
+
+        # Requests that are in flight can return the old value. Don't share
+        # them with new readers.
+        for cache_key in [ k for k in self._pending if k[2] == key ]:
+            del self._pending[cache_key]
+
+    def clear(self):
+        """
+        Drop all cached replies.
+        """
+        for region in self._regions:
+            region[3].clear()
+        self._keys.clear()
+        self._pending.clear()
+
+    def _store(self, region, key, cache_key, value):
+        _, ttl, max_size, entries = region
+        entries[cache_key] = (value, self._loop.time() + ttl)
+        self._keys.setdefault(key, set()).add(cache_key)
+
+        while len(entries) > max_size:
+            cache_key, _ = entries.popitem(last=False)
+            self._evictions += 1
+            self._forget(cache_key)
+
+    def _forget(self, cache_key):
+        keys = self._keys.get(cache_key[2])
+        if keys is not None:
+            keys.discard(cache_key)
+            if not keys:
+                del self._keys[cache_key[2]]
+
+    def _wrap(self, protocol, name):
+        """
+        Return command `name` of this protocol, with caching for reads, or
+        invalidation for writes.
+        """
+        method = getattr(protocol, name)
+
+        if name in self.commands:
+            return self._wrap_read(protocol, name, method)
+        elif name in _read_only_commands:
+            return method
+        else:
+            return self._wrap_write(protocol, name, method)
+
+    def _wrap_read(self, protocol, name, method):
+        @wraps(method)
+        @asyncio.coroutine
+        def call(*a, **kw):
+            if 'key' in kw:
+                native_key = kw['key']
+                args = a
+            else:
+                native_key = a[0]
+                args = a[1:]
+
+            region = self._get_region(native_key)
+            if region is None:
+                return (yield from method(*a, **kw))
+
+            key = protocol.encode_from_native(native_key)
+            cache_key = (name, protocol.db, key, args, tuple(sorted(kw.items())))
+            entries = region[3]
+
+            try:
+                value, expires = entries[cache_key]
+            except KeyError:
+                pass
+            else:
+                if expires > self._loop.time():
+                    entries.move_to_end(cache_key)
+                    self._hits += 1
+                    return value
+
+                del entries[cache_key]
+                self._forget(cache_key)
+
+            # Join the request for this reply that's already in flight.
+            f = self._pending.get(cache_key)
+            if f is not None:
+                self._coalesced += 1
+                return (yield from asyncio.shield(f, loop=self._loop))
+
+            self._misses += 1
+            f = asyncio.async(method(*a, **kw), loop=self._loop)
+            self._pending[cache_key] = f
+
+            def done(f):
+                # Store only when no write invalidated it in the meantime.
+                if self._pending.get(cache_key) is f:
+                    del self._pending[cache_key]
+                    if not f.cancelled() and not f.exception():
+                        self._store(region, key, cache_key, f.result())
+            f.add_done_callback(done)
+
+            return (yield from asyncio.shield(f, loop=self._loop))
+        return call
+
+    def _wrap_write(self, protocol, name, method):
+        @wraps(method)
+        @asyncio.coroutine
+        def call(*a, **kw):
+            # (bulk_load can write to any key.)
+            if name in ('flushdb', 'flushall', 'bulk_load'):
+                keys = None
+            else:
+                keys, a, kw = _get_keys(name, a, kw)
+                keys = [ protocol.encode_from_native(k) for k in keys ]
+
+            try:
+                return (yield from method(*a, **kw))
+            finally:
+                # (After the write, so that reads which were sent before it
+                # are not stored.)
+                if keys is None:
+                    self.clear()
+                else:
+                    for k in keys:
+                        self.invalidate(k)
+        return call
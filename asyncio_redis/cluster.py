@@ -0,0 +1,339 @@
+from .encoders import UTF8Encoder
+from .exceptions import Error, ErrorReply
+from .log import logger
+from .pool import Pool
+from .protocol import RedisProtocol, Script, _all_commands
+from .sharding import _FanOutPool, _get_keys
+
+from functools import wraps
+import asyncio
+import logging
+
+
+__all__ = ('ClusterPool', 'key_slot')
+
+
+#: Number of hash slots in a Redis Cluster.
+CLUSTER_SLOTS = 16384
+
+
+def _make_crc16_table():
+    """ Lookup table for CRC16-CCITT (XMODEM), as used by Redis Cluster. """
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xffff)
+    return table
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data):
+    """ CRC16-CCITT (XMODEM) checksum of `data` (bytes). """
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xffff) ^ _CRC16_TABLE[((crc >> 8) ^ byte) & 0xff]
+    return crc
+
+
+def key_slot(key):
+    """
+    Return the hash slot of a key (bytes). When the key contains a
+    ``{hashtag}``, only the part between the first ``{`` and the next ``}``
+    is hashed.
+    """
+    start = key.find(b'{')
+    if start != -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+
+    return crc16(key) % CLUSTER_SLOTS
+
+
+class ClusterPool(_FanOutPool):
+    """
+    Redis Cluster client. Keeps a :class:`~asyncio_redis.Pool` for every
+    master node, and a cache of the slot map, fetched with ``CLUSTER SLOTS``.
+
+    Commands are proxied like in a normal pool; the node is chosen by the hash
+    slot of the key argument(s). ``MOVED`` redirections update the slot map,
+    ``ASK`` redirections are followed by sending ``ASKING`` and the command
+    once to the other node, and ``TRYAGAIN`` errors (during resharding) are
+    retried after a short delay.
+
+    ``mget_aslist``, ``delete``, ``mset``, ``sinter_asset``, ``sunion_asset``
+    and ``sdiff_asset`` accept keys from different slots; they are split per
+    slot, executed concurrently and the results are combined.
+
+    ::
+
+        pool = yield from ClusterPool.create(nodes=[ ('redis1', 7000), ('redis2', 7000) ], poolsize=10)
+        result = yield from pool.set('key', 'value')
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, nodes, *, encoder=None, loop=None, max_redirects=16,
+               retry_interval=.05, connect_timeout=5, **kwargs):
+        """
+        Create a new cluster connection pool instance.
+
+        :param nodes: List of ``(host, port)`` tuples. The slot map is fetched
+                      from the first one that can be reached.
+        :type nodes: list
+        :param encoder: Encoder to use for encoding to or decoding from redis bytes to a native type.
+        :type encoder: :class:`~asyncio_redis.encoders.BaseEncoder` instance.
+        :param loop: (optional) asyncio event loop.
+        :param max_redirects: Maximum number of redirections and retries per command.
+        :type max_redirects: int
+        :param retry_interval: Seconds to wait before retrying after ``TRYAGAIN``.
+        :type retry_interval: float
+        :param connect_timeout: Seconds to wait for a node to accept connections.
+        :type connect_timeout: float
+
+        All other keyword arguments (``password``, ``poolsize``, ...) are
+        passed to :func:`Pool.create <asyncio_redis.Pool.create>` for every
+        node.
+        """
+        self = cls()
+        self._encoder = encoder or UTF8Encoder()
+        self._loop = loop or asyncio.get_event_loop()
+        self._max_redirects = max_redirects
+        self._retry_interval = retry_interval
+        self._connect_timeout = connect_timeout
+        self._pool_kwargs = kwargs
+
+        self._startup_nodes = [ self._node_name(host, port) for host, port in nodes ]
+        self._pools = {} # Maps 'host:port' to Pool.
+        self._pending_pools = {} # Maps 'host:port' to the task that creates the Pool.
+        self._slots = [ None ] * CLUSTER_SLOTS # Maps slot to 'host:port'.
+        self._refresh_f = None
+
+        yield from self.refresh_slots()
+        return self
+
+    def __repr__(self):
+        return 'ClusterPool(nodes=%r)' % (sorted(self._pools), )
+
+    @staticmethod
+    def _node_name(host, port):
+        return '%s:%s' % (host, port)
+
+    @property
+    def nodes(self):
+        """ Dictionary which maps node names to :class:`~asyncio_redis.Pool` instances. """
+        return dict(self._pools)
+
+    @asyncio.coroutine
+    def _get_pool(self, name):
+        """ Return the pool for this node, connecting to it when required. """
+        try:
+            return self._pools[name]
+        except KeyError:
+            if name not in self._pending_pools:
+                self._pending_pools[name] = asyncio.async(self._create_pool(name), loop=self._loop)
+            return (yield from self._pending_pools[name])
+
+    @asyncio.coroutine
+    def _create_pool(self, name):
+        host, port = name.rsplit(':', 1)
+        try:
+            pool = yield from asyncio.wait_for(
+                    Pool.create(host=host, port=int(port), encoder=self._encoder,
+                                loop=self._loop, **self._pool_kwargs),
+                    self._connect_timeout, loop=self._loop)
+            self._pools[name] = pool
+            return pool
+        finally:
+            del self._pending_pools[name]
+
+    @asyncio.coroutine
+    def refresh_slots(self):
+        """
+        Fetch the slot map again. Concurrent calls share the same request.
+        """
+        if self._refresh_f is None or self._refresh_f.done():
+            self._refresh_f = asyncio.async(self._refresh_slots(), loop=self._loop)
+        yield from self._refresh_f
+
+    def _refresh_slots_in_background(self):
+        if self._refresh_f is None or self._refresh_f.done():
+            self._refresh_f = asyncio.async(self._refresh_slots(), loop=self._loop)
+            self._refresh_f.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, f):
+        if not f.cancelled() and f.exception():
+            logger.log(logging.WARNING, 'Refreshing cluster slot map failed: %r' % f.exception())
+
+    @asyncio.coroutine
+    def _refresh_slots(self):
+        # Ask the known nodes first, then the startup nodes.
+        candidates = list(self._pools) + [ n for n in self._startup_nodes if n not in self._pools ]
+        last_exception = None
+
+        for name in candidates:
+            try:
+                pool = yield from self._get_pool(name)
+                reply = yield from pool.cluster_slots()
+            except (OSError, asyncio.TimeoutError, Error, ErrorReply) as e:
+                last_exception = e
+                logger.log(logging.INFO, 'Fetching cluster slots from %s failed: %r' % (name, e))
+                continue
+
+            slots = [ None ] * CLUSTER_SLOTS
+            for start, end, (host, port), replicas in reply.slots:
+                # An empty host means: the node that we're talking to.
+                node = self._node_name(host or name.rsplit(':', 1)[0], port)
+                yield from self._get_pool(node)
+
+                for slot in range(start, end + 1):
+                    slots[slot] = node
+            self._slots = slots
+
+            # Close the connections to nodes that don't own slots anymore.
+            masters = set(slots)
+            for node in list(self._pools):
+                if node not in masters:
+                    self._pools.pop(node).close()
+            return
+
+        raise Error('Could not fetch the cluster slot map from any node: %r' % (last_exception, ))
+
+    def _group_keys(self, keys):
+        # Redis Cluster only accepts multi-key commands for keys in the same
+        # hash slot, so split by slot. The groups of one node are sent
+        # concurrently, which pipelines them on the node's connections.
+        groups = {}
+        for k in keys:
+            groups.setdefault(key_slot(self._encoder.encode_from_native(k)), []).append(k)
+
+        for slot in groups:
+            if self._slots[slot] is None:
+                raise Error('Hash slot %i is not served by any node.' % slot)
+
+        return [ (self._slots[slot], group) for slot, group in groups.items() ]
+
+    @asyncio.coroutine
+    def _get_node_pool(self, node):
+        return (yield from self._get_pool(node))
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.evalsha_many)
+    def evalsha_many(self, sha, calls):
+        calls = [ (list(keys or []), list(args or [])) for keys, args in calls ]
+        results = yield from super().evalsha_many(sha, calls)
+
+        # Calls for slots that moved are sent again one by one, following the
+        # redirections.
+        for i, r in enumerate(results):
+            if isinstance(r, ErrorReply) and r.args[0].startswith(('MOVED ', 'ASK ', 'TRYAGAIN')):
+                try:
+                    reply = yield from self.evalsha(sha, *calls[i])
+                    results[i] = yield from reply.return_value()
+                except (Error, ErrorReply) as e:
+                    results[i] = e
+
+        return results
+
+    @asyncio.coroutine
+    def _execute(self, name, a, kw):
+        """
+        Run command on the node that owns the slot, following redirections.
+        """
+        keys, a, kw = _get_keys(name, a, kw)
+
+        if not keys:
+            raise Error('Command %s has no key to choose a node in a ClusterPool.' % name)
+
+        slots = set(key_slot(self._encoder.encode_from_native(k)) for k in keys)
+        if len(slots) > 1:
+            raise Error('Keys of command %s map to different hash slots.' % name)
+
+        slot = slots.pop()
+        node = self._slots[slot]
+        asking = False
+
+        if node is None:
+            raise Error('Hash slot %i is not served by any node.' % slot)
+
+        for i in range(self._max_redirects):
+            pool = yield from self._get_pool(node)
+
+            try:
+                if asking:
+                    return (yield from self._execute_asking(pool, name, a, kw))
+                else:
+                    return (yield from getattr(pool, name)(*a, **kw))
+            except ErrorReply as e:
+                message = e.args[0]
+
+                if message.startswith('MOVED '):
+                    # The slot has a new owner. Update the map, and refresh
+                    # the rest of the map in the background.
+                    _, slot, node = message.split()
+                    self._slots[int(slot)] = node
+                    asking = False
+                    self._refresh_slots_in_background()
+
+                elif message.startswith('ASK '):
+                    # The slot is being migrated, only this command goes to the other node.
+                    _, slot, node = message.split()
+                    asking = True
+
+                elif message.startswith('TRYAGAIN'):
+                    yield from asyncio.sleep(self._retry_interval, loop=self._loop)
+
+                else:
+                    raise
+
+        raise Error('Too many cluster redirections for command %s.' % name)
+
+    @asyncio.coroutine
+    def _execute_asking(self, pool, name, a, kw):
+        """
+        Send ASKING, followed by the command, on the same connection.
+        """
+        asking, result = yield from pool.pipelined(('asking', (), {}), (name, a, kw))
+
+        if isinstance(asking, BaseException):
+            raise asking
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def __getattr__(self, name):
+        """
+        Proxy to the pool of the node that owns the slot of this command.
+        """
+        # Only proxy commands.
+        if name not in _all_commands:
+            raise AttributeError(name)
+
+        @wraps(getattr(RedisProtocol, name))
+        def call(*a, **kw):
+            return self._execute(name, a, kw)
+        return call
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.register_script)
+    def register_script(self, script:str) -> Script:
+        if not self._pools:
+            raise Error('ClusterPool has no nodes.')
+
+        # Register the script on every master.
+        for pool in list(self._pools.values()):
+            result = yield from pool.register_script(script)
+
+        # Run it on the node that owns the keys passed to `run`.
+        return Script(result.sha, script, lambda: self.evalsha, lambda: self.eval, lambda: self.evalsha_many)
+
+    def close(self):
+        """
+        Close all the connections to all the nodes.
+        """
+        for pool in self._pools.values():
+            pool.close()
+
+        self._pools = {}
@@ -1,6 +1,8 @@
 import socket
+from .exceptions import ErrorReply, NotConnectedError
 from .log import logger
 from .protocol import RedisProtocol, _all_commands
+from functools import wraps
 import asyncio
 import logging
 
@@ -22,7 +24,11 @@ class Connection:
     @classmethod
     @asyncio.coroutine
     def create(cls, host='localhost', port=6379, *, password=None, db=0,
-               encoder=None, auto_reconnect=True, loop=None, protocol_class=RedisProtocol):
+               encoder=None, auto_reconnect=True, loop=None, protocol_class=RedisProtocol,
+               tcp_nodelay=True, keepalive=False, keepalive_idle=None,
+               keepalive_interval=None, keepalive_count=None,
+               rcvbuf=None, sndbuf=None, client_name=None, sentinel=None,
+               near_cache=None):
         """
         :param host: Address, either host or unix domain socket path
         :type host: str
@@ -39,6 +45,31 @@ class Connection:
         :param loop: (optional) asyncio event loop.
         :type protocol_class: :class:`~asyncio_redis.RedisProtocol`
         :param protocol_class: (optional) redis protocol implementation
+        :param tcp_nodelay: Disable Nagle's algorithm on the TCP socket.
+        :type tcp_nodelay: bool
+        :param keepalive: Enable TCP keepalive probes (SO_KEEPALIVE).
+        :type keepalive: bool
+        :param keepalive_idle: (optional) Seconds of idle time before the first keepalive probe.
+        :type keepalive_idle: int
+        :param keepalive_interval: (optional) Seconds between keepalive probes.
+        :type keepalive_interval: int
+        :param keepalive_count: (optional) Failed probes before the connection is dropped.
+        :type keepalive_count: int
+        :param rcvbuf: (optional) Size of the socket receive buffer (SO_RCVBUF) in bytes.
+        :type rcvbuf: int
+        :param sndbuf: (optional) Size of the socket send buffer (SO_SNDBUF) in bytes.
+        :type sndbuf: int
+        :param client_name: (optional) Connection name, set with ``CLIENT SETNAME`` on every connect.
+        :type client_name: Native Python type as defined by the ``encoder`` parameter
+        :param sentinel: (optional) Ask this sentinel for the address of the
+                         primary on every (re)connect, instead of using `host`
+                         and `port`, and check with ``ROLE`` that the node is
+                         still the primary.
+        :type sentinel: :class:`~asyncio_redis.Sentinel`
+        :param near_cache: (optional) Cache the replies of read commands on this
+                           client. (A :class:`~asyncio_redis.NearCache` also
+                           enables ``CLIENT TRACKING`` to keep the cache up to date.)
+        :type near_cache: :class:`~asyncio_redis.NearCache` or :class:`~asyncio_redis.TTLCache`
         """
         assert port >= 0, "Unexpected port value: %r" % (port, )
         connection = cls()
@@ -49,19 +80,35 @@ class Connection:
         connection._retry_interval = .5
         connection._closed = False
         connection._closing = False
+        connection._reconnecting = False
 
         connection._auto_reconnect = auto_reconnect
 
+        connection._tcp_nodelay = tcp_nodelay
+        connection._keepalive = keepalive
+        connection._keepalive_idle = keepalive_idle
+        connection._keepalive_interval = keepalive_interval
+        connection._keepalive_count = keepalive_count
+        connection._rcvbuf = rcvbuf
+        connection._sndbuf = sndbuf
+        connection._sentinel = sentinel
+        connection._near_cache = near_cache
+
         # Create protocol instance
         def connection_lost():
-            if connection._auto_reconnect and not connection._closing:
+            if connection._auto_reconnect and not connection._closing and not connection._reconnecting:
                 asyncio.async(connection._reconnect(), loop=connection._loop)
 
         # Create protocol instance
         connection.protocol = protocol_class(password=password, db=db, encoder=encoder,
-                        connection_lost_callback=connection_lost, loop=connection._loop)
+                        connection_lost_callback=connection_lost, loop=connection._loop,
+                        client_name=client_name)
 
         # Connect
+        if sentinel:
+            sentinel._register(connection)
+        if near_cache is not None:
+            near_cache._register(connection)
         yield from connection._reconnect()
 
         return connection
@@ -88,29 +135,115 @@ class Connection:
         """
         Set up Redis connection.
         """
+        # (Losing the connection while we're here should not start a second
+        # reconnect.)
+        self._reconnecting = True
+        try:
+            yield from self._connect()
+        finally:
+            self._reconnecting = False
+
+    @asyncio.coroutine
+    def _connect(self):
         while True:
             try:
+                if self._sentinel:
+                    self.host, self.port = yield from self._sentinel.get_primary_address()
+
+                if self._near_cache is not None:
+                    self.protocol.tracking_redirect = self._near_cache.client_id
+
                 logger.log(logging.INFO, 'Connecting to redis')
                 if self.port:
-                    yield from self._loop.create_connection(lambda: self.protocol, self.host, self.port, flags=socket.TCP_NODELAY)
+                    transport, _ = yield from self._loop.create_connection(lambda: self.protocol, self.host, self.port)
                 else:
-                    yield from self._loop.create_unix_connection(lambda: self.protocol, self.host)
+                    transport, _ = yield from self._loop.create_unix_connection(lambda: self.protocol, self.host)
+                self._set_socket_options(transport)
+
+                if self._sentinel and not (yield from self._is_primary()):
+                    # The node has been demoted, but the sentinels didn't
+                    # tell us yet. Drop the connection without triggering
+                    # another reconnect, and ask the sentinels again.
+                    logger.log(logging.WARNING, 'Redis at %s:%s is not the primary anymore' % (self.host, self.port))
+                    self._sentinel._forget_primary_address(self.host, self.port)
+                    transport.close()
+                    raise OSError('Not the primary')
+
                 self._reset_retry_interval()
                 return
-            except OSError:
+            except (OSError, NotConnectedError):
                 # Sleep and try again
                 self._increase_retry_interval()
                 interval = self._get_retry_interval()
                 logger.log(logging.INFO, 'Connecting to redis failed. Retrying in %i seconds' % interval)
                 yield from asyncio.sleep(interval, loop=self._loop)
 
+    @asyncio.coroutine
+    def _is_primary(self):
+        """
+        Check with ``ROLE`` whether we are connected to a primary.
+        (Connections with subscriptions are not checked; ``ROLE`` can't run in
+        pubsub mode and subscribing to a replica works fine.)
+        """
+        if self.protocol.in_pubsub:
+            return True
+
+        try:
+            reply = yield from self.protocol.role()
+        except ErrorReply:
+            # Redis < 2.8.12 has no ROLE command.
+            return True
+        return reply.role == 'master'
+
+    def _set_socket_options(self, transport):
+        """
+        Apply the socket options to the socket of a newly connected transport.
+        (TCP specific options are skipped for unix domain sockets.)
+        """
+        sock = transport.get_extra_info('socket')
+        if sock is None:
+            return
+
+        if self.port:
+            if self._tcp_nodelay:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            if self._keepalive:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+                # These are not available on every platform.
+                for name, value in (('TCP_KEEPIDLE', self._keepalive_idle),
+                                    ('TCP_KEEPINTVL', self._keepalive_interval),
+                                    ('TCP_KEEPCNT', self._keepalive_count)):
+                    if value is not None and hasattr(socket, name):
+                        sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+        if self._rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._rcvbuf)
+
+        if self._sndbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._sndbuf)
+
     def __getattr__(self, name):
         # Only proxy commands.
         if name not in _all_commands:
             raise AttributeError
 
+        if self._near_cache is not None:
+            return self._near_cache._wrap(self.protocol, name)
+
         return getattr(self.protocol, name)
 
+    @asyncio.coroutine
+    @wraps(RedisProtocol.transaction)
+    def transaction(self, func, watch_keys=None, retries=10, backoff=.001):
+        return (yield from self.protocol.transaction(func, watch_keys, retries, backoff))
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.pipelined)
+    def pipelined(self, *calls):
+        return (yield from self.protocol.pipelined(*calls))
+
     def __repr__(self):
         return 'Connection(host=%r, port=%r)' % (self.host, self.port)
 
@@ -120,5 +253,10 @@ class Connection:
         """
         self._closing = True
 
+        if self._sentinel:
+            self._sentinel._unregister(self)
+        if self._near_cache is not None:
+            self._near_cache._unregister(self)
+
         if self.protocol.transport:
             self.protocol.transport.close()
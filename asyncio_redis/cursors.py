@@ -16,9 +16,9 @@ class Cursor:
     Cursor for walking through the results of a :func:`scan
     <asyncio_redis.RedisProtocol.scan>` query.
     """
-    def __init__(self, name, scanfunc):
+    def __init__(self, name, scanfunc, position=0):
         self._queue = deque()
-        self._cursor = 0
+        self._cursor = position
         self._name = name
         self._scanfunc = scanfunc
         self._done = False
@@ -30,6 +30,15 @@ class Cursor:
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self._name)
 
+    @property
+    def position(self):
+        """
+        Position of the scan in Redis, which can be used to resume it later.
+        (The items that were fetched from Redis, but not returned yet, are
+        not included. After :func:`fetchmany`, there are none.)
+        """
+        return self._cursor
+
     @asyncio.coroutine
     def _fetch_more(self):
         """ Get next chunk of keys from Redis """
@@ -60,6 +69,19 @@ class Cursor:
         if self._queue:
             return self._queue.popleft()
 
+    @asyncio.coroutine
+    def fetchmany(self):
+        """
+        Coroutine that returns the next chunk of items, as returned by Redis.
+        (About ``count`` items.) It returns an empty list after the last item.
+        """
+        while not self._queue and not self._done:
+            yield from self._fetch_more()
+
+        results = list(self._queue)
+        self._queue.clear()
+        return results
+
     @asyncio.coroutine
     def fetchall(self):
         """ Coroutine that reads all the items in one list. """
@@ -4,7 +4,9 @@ __all__ = (
         'ErrorReply',
         'NoAvailableConnectionsInPoolError',
         'NoRunningScriptError',
+        'NoScriptError',
         'NotConnectedError',
+        'PartialFailureError',
         'ScriptKilledError',
         'TimeoutError',
         'TransactionError',
@@ -57,3 +59,22 @@ class ScriptKilledError(Error):
 
 class NoRunningScriptError(Error):
     """ script_kill was called while no script was running. """
+
+
+class NoScriptError(Error):
+    """ evalsha was called for a script that is not in the script cache. """
+
+
+class PartialFailureError(Error):
+    """
+    A command that was split over several nodes failed on some of them.
+    """
+    def __init__(self, message, errors, results):
+        super().__init__(message)
+
+        #: Dictionary which maps node names to the exception of that node.
+        self.errors = errors
+
+        #: Dictionary which maps the names of the nodes that succeeded to a
+        #: list of (keys, result) tuples.
+        self.results = results
@@ -0,0 +1,178 @@
+from .exceptions import ErrorReply
+from .log import logger
+
+import asyncio
+import logging
+
+
+__all__ = ('KeyspaceMigration', )
+
+
+class KeyspaceMigration:
+    """
+    Copy keys from one Redis instance to another, whatever their type, with
+    ``SCAN``, ``DUMP`` and ``RESTORE``.
+
+    The keys of the source are scanned in chunks of `count` keys. For every
+    chunk, the ``DUMP`` and ``PTTL`` commands are pipelined, and the values
+    are written to the destination with pipelined ``RESTORE`` commands (with
+    their time to live), while the next chunk is read from the source.
+
+    When a `checkpoint_key` is given, the position of the scan is stored in
+    the destination after every chunk, and an interrupted migration resumes
+    from there. (The key is removed at the end.) Because ``SCAN`` can return
+    a key more than once, use `replace` when resuming.
+
+    Keys are passed through the encoders of the source and the destination,
+    so use :class:`~asyncio_redis.encoders.BytesEncoder` when keys are not
+    valid UTF-8.
+
+    ::
+
+        migration = KeyspaceMigration(source_pool, destination_pool, count=1000,
+                                      replace=True, checkpoint_key='migration-position')
+        yield from migration.run()
+        print(migration.migrated, migration.failed)
+    """
+    def __init__(self, source, destination, *, match=None, count=1000, replace=False,
+                 checkpoint_key=None, position=None, loop=None):
+        """
+        :param source: Connection or pool to read the keys from.
+        :param destination: Connection or pool to write the keys to.
+        :param match: (optional) Pattern of the keys to migrate.
+        :type match: Native Python type as defined by the ``encoder`` parameter
+        :param count: ``COUNT`` of every ``SCAN``.
+        :type count: int
+        :param replace: Overwrite keys which exist in the destination. (Otherwise, they are counted as failed.)
+        :type replace: bool
+        :param checkpoint_key: (optional) Key in the destination for the position of the scan.
+        :type checkpoint_key: Native Python type as defined by the ``encoder`` parameter
+        :param position: (optional) Position of the scan to start from, instead of the stored checkpoint.
+        :type position: int
+        :param loop: (optional) asyncio event loop.
+        """
+        self._source = source
+        self._destination = destination
+        self._match = match
+        self._count = count
+        self._replace = replace
+        self._checkpoint_key = checkpoint_key
+        self._position = position
+        self._loop = loop or asyncio.get_event_loop()
+
+        # Metrics.
+        self._migrated = 0
+        self._skipped = 0
+        self._failed = 0
+
+    def __repr__(self):
+        return 'KeyspaceMigration(match=%r, position=%r, migrated=%r)' % (self._match, self._position, self._migrated)
+
+    @property
+    def migrated(self):
+        """ Number of keys that were restored in the destination. """
+        return self._migrated
+
+    @property
+    def skipped(self):
+        """ Number of keys that were deleted or expired before they were dumped. """
+        return self._skipped
+
+    @property
+    def failed(self):
+        """ Number of keys for which ``RESTORE`` returned an error. """
+        return self._failed
+
+    @property
+    def position(self):
+        """
+        Position of the scan after the last chunk that was written to the
+        destination. (0 when it's finished.)
+        """
+        return self._position
+
+    @asyncio.coroutine
+    def run(self):
+        """
+        Migrate all the keys. Returns the number of migrated keys.
+        """
+        if self._position is None:
+            self._position = 0
+
+            if self._checkpoint_key is not None:
+                checkpoint = yield from self._destination.get(self._checkpoint_key)
+                if checkpoint:
+                    self._position = int(checkpoint)
+                    logger.log(logging.INFO, 'Resuming migration at position %i' % self._position)
+
+        cursor = yield from self._source.scan(match=self._match, cursor=self._position)
+        cursor.count = self._count
+        restore_task = None
+
+        try:
+            while True:
+                keys = yield from cursor.fetchmany()
+                if not keys:
+                    break
+
+                values = yield from self._dump(keys)
+
+                # Wait until the previous chunk is written, before writing
+                # this one, so that the checkpoints stay in order.
+                if restore_task:
+                    yield from restore_task
+
+                restore_task = asyncio.async(self._restore(values, cursor.position), loop=self._loop)
+
+            if restore_task:
+                yield from restore_task
+        finally:
+            if restore_task:
+                restore_task.cancel()
+
+        if self._checkpoint_key is not None:
+            yield from self._destination.delete([ self._checkpoint_key ])
+
+        return self._migrated
+
+    @asyncio.coroutine
+    def _dump(self, keys):
+        """ Return a list of (key, ttl, serialized_value) tuples for these keys. """
+        dumps = asyncio.gather(* [ self._source.dump(key) for key in keys ], loop=self._loop)
+        ttls = asyncio.gather(* [ self._source.pttl(key) for key in keys ], loop=self._loop)
+        dumps, ttls = yield from asyncio.gather(dumps, ttls, loop=self._loop)
+
+        values = []
+        for key, value, ttl in zip(keys, dumps, ttls):
+            # PTTL returns -2 for keys that don't exist, and -1 for keys
+            # without expiration.
+            if value is None or ttl == -2:
+                self._skipped += 1
+            else:
+                values.append((key, max(ttl, 0), value))
+        return values
+
+    @asyncio.coroutine
+    def _restore(self, values, position):
+        results = yield from asyncio.gather(
+                * [ self._destination.restore(key, ttl, value, replace=self._replace) for key, ttl, value in values ],
+                loop=self._loop, return_exceptions=True)
+
+        for (key, ttl, value), result in zip(values, results):
+            if isinstance(result, ErrorReply):
+                self._failed += 1
+                logger.log(logging.WARNING, 'Restoring key %r failed: %r' % (key, result))
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                self._migrated += 1
+
+        # Position 0 means that the scan is finished. The checkpoint is
+        # removed then.
+        if self._checkpoint_key is not None and position:
+            value = str(position)
+            if isinstance(self._checkpoint_key, bytes):
+                value = value.encode('ascii')
+            yield from self._destination.set(self._checkpoint_key, value)
+
+        self._position = position
@@ -1,6 +1,7 @@
 from .connection import Connection
 from .exceptions import NoAvailableConnectionsInPoolError
-from .protocol import RedisProtocol, Script
+from .protocol import RedisProtocol, Script, _all_commands, _blocking_commands, _coalescable_commands, _read_only_commands
+from .pubsub import PubSubHub
 
 from functools import wraps
 import asyncio
@@ -14,8 +15,15 @@ class Pool:
     Pool of connections. Each
     Takes care of setting up the connection and connection pooling.
 
-    When poolsize > 1 and some connections are in use because of transactions
-    or blocking requests, the other are preferred.
+    When poolsize > 1 and some connections are in use because of transactions,
+    the other are preferred.
+
+    Blocking commands (``blpop``, ``brpop``, ``brpoplpush``, ``xread`` and
+    ``xreadgroup``) don't take connections of the pool: they run on a second
+    set of connections, which grows when all of them are waiting, so that
+    long polling never leaves other commands without a connection. Up to
+    `poolsize` idle connections of this set are kept open for the next
+    blocking calls.
 
     ::
 
@@ -26,7 +34,11 @@ class Pool:
     @asyncio.coroutine
     def create(cls, host='localhost', port=6379, *, password=None, db=0,
                encoder=None, poolsize=1, auto_reconnect=True, loop=None,
-               protocol_class=RedisProtocol):
+               protocol_class=RedisProtocol, tcp_nodelay=True, keepalive=False,
+               keepalive_idle=None, keepalive_interval=None,
+               keepalive_count=None, rcvbuf=None, sndbuf=None, client_name=None,
+               sentinel=None, near_cache=None, coalesce_reads=False,
+               max_blocking_connections=None):
         """
         Create a new connection pool instance.
 
@@ -47,20 +59,72 @@ class Pool:
         :param loop: (optional) asyncio event loop.
         :type protocol_class: :class:`~asyncio_redis.RedisProtocol`
         :param protocol_class: (optional) redis protocol implementation
+        :param client_name: (optional) Name for the connections, set with ``CLIENT SETNAME``.
+        :type client_name: Native Python type as defined by the ``encoder`` parameter
+        :param sentinel: (optional) Connect to the primary reported by this
+                         sentinel. The connections follow failovers.
+        :type sentinel: :class:`~asyncio_redis.Sentinel`
+        :param near_cache: (optional) Client side cache, shared by all the connections.
+        :type near_cache: :class:`~asyncio_redis.NearCache` or :class:`~asyncio_redis.TTLCache`
+        :param coalesce_reads: When a read-only command with the same arguments
+                               is already in flight, wait for its result instead of
+                               sending another request. (Only for commands that
+                               return a plain value, like ``get`` or
+                               ``hgetall_asdict``; don't modify the shared results.)
+        :type coalesce_reads: bool
+        :param max_blocking_connections: (optional) Maximum number of
+                                         connections for blocking commands. By
+                                         default, there is no limit.
+        :type max_blocking_connections: int
+
+        The socket options ``tcp_nodelay``, ``keepalive``, ``keepalive_idle``,
+        ``keepalive_interval``, ``keepalive_count``, ``rcvbuf`` and ``sndbuf``
+        are passed to every connection; see
+        :func:`Connection.create <asyncio_redis.Connection.create>`.
         """
         self = cls()
         self._host = host
         self._port = port
         self._poolsize = poolsize
+        self._loop = loop or asyncio.get_event_loop()
+
+        self._coalesce_reads = coalesce_reads
+        self._in_flight = {} # Maps (command, args, kwargs) to the Future of the request.
+        self._coalesced_calls = 0
+
+        self._pubsub_hub_f = None
+
+        # Connections for blocking commands.
+        self._blocking_connections = []
+        self._busy_blocking_connections = set() # The ones that are taken by a call.
+        self._opening_blocking_connections = 0 # Reserved slots for connections that are being created.
+        self._max_blocking_connections = max_blocking_connections
+
+        # Metrics of both sets of connections.
+        self._calls = 0
+        self._rejected_calls = 0
+        self._blocking_calls = 0
+        self._rejected_blocking_calls = 0
+        self._blocking_connections_opened = 0
+
+        # Options for the connections of this pool, and of the pubsub hub.
+        self._connection_kwargs = dict(
+                            password=password, db=db, encoder=encoder,
+                            auto_reconnect=auto_reconnect,
+                            protocol_class=protocol_class,
+                            tcp_nodelay=tcp_nodelay, keepalive=keepalive,
+                            keepalive_idle=keepalive_idle,
+                            keepalive_interval=keepalive_interval,
+                            keepalive_count=keepalive_count,
+                            rcvbuf=rcvbuf, sndbuf=sndbuf,
+                            client_name=client_name, sentinel=sentinel)
 
         # Create connections
         self._connections = []
 
         for i in range(poolsize):
-            connection = yield from Connection.create(host=host, port=port,
-                            password=password, db=db, encoder=encoder,
-                            auto_reconnect=auto_reconnect, loop=loop,
-                            protocol_class=protocol_class)
+            connection = yield from Connection.create(host=host, port=port, loop=loop,
+                            near_cache=near_cache, **self._connection_kwargs)
             self._connections.append(connection)
 
         return self
@@ -87,6 +151,57 @@ class Pool:
         """
         return sum([ 1 for c in self._connections if c.protocol.is_connected ])
 
+    @property
+    def coalesced_calls(self):
+        """
+        Number of calls that got the result of an identical request that was
+        already in flight. (When ``coalesce_reads`` is enabled.)
+        """
+        return self._coalesced_calls
+
+    @property
+    def blocking_connections(self):
+        """
+        Number of connections for blocking commands.
+        """
+        return len(self._blocking_connections)
+
+    @property
+    def blocking_connections_in_use(self):
+        """
+        Number of connections that are waiting in a blocking command.
+        """
+        return len(self._busy_blocking_connections)
+
+    @property
+    def lane_stats(self):
+        """
+        Dictionary with the metrics of the connections for normal commands
+        (``'commands'``) and of the connections for blocking commands
+        (``'blocking'``): the number of ``connections``, how many are
+        ``in_use`` and ``connected``, the number of ``calls``, and the number
+        of calls that were ``rejected`` because no connection was available.
+        (``'blocking'`` also has the number of connections that were
+        ``opened``.)
+        """
+        return {
+            'commands': {
+                'connections': len(self._connections),
+                'in_use': self.connections_in_use,
+                'connected': self.connections_connected,
+                'calls': self._calls,
+                'rejected': self._rejected_calls,
+            },
+            'blocking': {
+                'connections': len(self._blocking_connections),
+                'in_use': self.blocking_connections_in_use,
+                'connected': sum([ 1 for c in self._blocking_connections if c.protocol.is_connected ]),
+                'calls': self._blocking_calls,
+                'rejected': self._rejected_blocking_calls,
+                'opened': self._blocking_connections_opened,
+            },
+        }
+
     def _get_free_connection(self):
         """
         Return the next protocol instance that's not in use.
@@ -110,32 +225,250 @@ class Pool:
         Proxy to a protocol. (This will choose a protocol instance that's not
         busy in a blocking request or transaction.)
         """
+        if self._coalesce_reads and name in _all_commands:
+            if name in _coalescable_commands:
+                return self._coalesced(name)
+
+            # A read that was sent before a write, or while it was in flight,
+            # can return older data. Don't let reads that follow this write
+            # join it.
+            if name not in _read_only_commands:
+                self._in_flight.clear()
+                return self._invalidating(name)
+
+        if name in _blocking_commands:
+            return self._blocking(name)
+
+        return self._proxy(name)
+
+    def _invalidating(self, name):
+        """
+        Return write command `name`, which clears the coalesced reads again
+        when it's done.
+        """
+        method = self._blocking(name) if name in _blocking_commands else self._proxy(name)
+
+        @wraps(method)
+        @asyncio.coroutine
+        def call(*a, **kw):
+            try:
+                return (yield from method(*a, **kw))
+            finally:
+                self._in_flight.clear()
+        return call
+
+    def _proxy(self, name):
         connection = self._get_free_connection()
 
         if connection:
+            self._calls += 1
             return getattr(connection, name)
         else:
+            self._rejected_calls += 1
             raise NoAvailableConnectionsInPoolError('No available connections in the pool: size=%s, in_use=%s, connected=%s' % (
                                 self.poolsize, self.connections_in_use, self.connections_connected))
 
 
+    def _coalesced(self, name):
+        """
+        Return command `name`, sharing the result of identical calls that are
+        in flight.
+        """
+        @wraps(getattr(RedisProtocol, name))
+        @asyncio.coroutine
+        def call(*a, **kw):
+            try:
+                key = (name, a, tuple(sorted(kw.items())))
+                f = self._in_flight.get(key)
+            except TypeError:
+                # Unhashable arguments, like lists.
+                return (yield from self._proxy(name)(*a, **kw))
+
+            if f is None:
+                f = asyncio.async(self._proxy(name)(*a, **kw), loop=self._loop)
+                self._in_flight[key] = f
+
+                def done(f):
+                    if self._in_flight.get(key) is f:
+                        del self._in_flight[key]
+                f.add_done_callback(done)
+            else:
+                self._coalesced_calls += 1
+
+            # (Shield, so that a caller that gets cancelled doesn't cancel the
+            # request for the others.)
+            return (yield from asyncio.shield(f, loop=self._loop))
+        return call
+
+    def _blocking(self, name):
+        """
+        Return command `name`, running on a connection for blocking commands.
+        """
+        @wraps(getattr(RedisProtocol, name))
+        @asyncio.coroutine
+        def call(*a, **kw):
+            connection = yield from self._get_blocking_connection()
+            self._blocking_calls += 1
+
+            try:
+                return (yield from getattr(connection, name)(*a, **kw))
+            finally:
+                self._release_blocking_connection(connection)
+        return call
+
+    @asyncio.coroutine
+    def _get_blocking_connection(self):
+        """
+        Return a connection for a blocking command. Open a new one when all
+        of them are in use.
+        """
+        for c in self._blocking_connections[:]:
+            if c not in self._busy_blocking_connections:
+                if c.protocol.is_connected:
+                    self._busy_blocking_connections.add(c)
+                    return c
+                else:
+                    # Don't let disconnected connections take a place.
+                    self._blocking_connections.remove(c)
+                    c.close()
+
+        if (self._max_blocking_connections is not None and
+                len(self._blocking_connections) + self._opening_blocking_connections >= self._max_blocking_connections):
+            self._rejected_blocking_calls += 1
+            raise NoAvailableConnectionsInPoolError('No available connections for blocking commands in the pool: max=%s, in_use=%s' % (
+                                self._max_blocking_connections, self.blocking_connections_in_use))
+
+        # Reserve the place while connecting, so that concurrent calls don't
+        # exceed the maximum.
+        self._opening_blocking_connections += 1
+        try:
+            connection = yield from Connection.create(host=self._host, port=self._port, loop=self._loop,
+                                                      **self._connection_kwargs)
+        finally:
+            self._opening_blocking_connections -= 1
+
+        self._blocking_connections.append(connection)
+        self._busy_blocking_connections.add(connection)
+        self._blocking_connections_opened += 1
+        return connection
+
+    def _release_blocking_connection(self, connection):
+        """
+        Close this connection when it was disconnected, or when more than
+        `poolsize` connections for blocking commands are idle.
+        """
+        self._busy_blocking_connections.discard(connection)
+
+        if connection in self._blocking_connections:
+            idle = len(self._blocking_connections) - len(self._busy_blocking_connections)
+            if idle > self._poolsize or not connection.protocol.is_connected:
+                self._blocking_connections.remove(connection)
+                connection.close()
+
     # Proxy the register_script method, so that the returned object will
     # execute on any available connection in the pool.
     @asyncio.coroutine
     @wraps(RedisProtocol.register_script)
     def register_script(self, script:str) -> Script:
         # Call register_script from the Protocol.
-        script = yield from self.__getattr__('register_script')(script)
-        assert isinstance(script, Script)
+        script = yield from self._proxy('register_script')(script)
+
+        # Every connection loads it again when it reconnects. (The server
+        # could have been restarted.)
+        for c in self._connections:
+            c.protocol._scripts[script.sha] = script.code
 
         # Return a new script instead that runs it on any connection of the pool.
-        return Script(script.sha, script.code, lambda: self.evalsha)
+        return Script(script.sha, script.code, lambda: self.evalsha, lambda: self.eval,
+                      lambda: self.evalsha_many)
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.transaction)
+    def transaction(self, func, watch_keys=None, retries=10, backoff=.001):
+        # The connection stays pinned to this transaction until it's done,
+        # including the retries and the delays in between.
+        return (yield from self._proxy('transaction')(func, watch_keys, retries, backoff))
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.pipelined)
+    def pipelined(self, *calls):
+        # The commands can be writes, so don't let coalesced reads span them.
+        # (See `_invalidating`.)
+        self._in_flight.clear()
+        try:
+            return (yield from self._proxy('pipelined')(*calls))
+        finally:
+            self._in_flight.clear()
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.publish_many)
+    def publish_many(self, messages, wait=True):
+        # Spread the messages over all the free connections. Messages for the
+        # same channel go to the same connection, so that they stay in order.
+        # (Sorted by id, to keep the mapping when the connections rotate.)
+        connections = sorted((c for c in self._connections if c.protocol.is_connected and not c.protocol.in_use), key=id)
+        if not connections:
+            raise NoAvailableConnectionsInPoolError('No available connections in the pool: size=%s, in_use=%s, connected=%s' % (
+                                self.poolsize, self.connections_in_use, self.connections_connected))
+
+        groups = [ [] for c in connections ] # Lists of (index, message) per connection.
+        for i, message in enumerate(messages):
+            groups[hash(message[0]) % len(connections)].append((i, message))
+
+        groups = [ (c, group) for c, group in zip(connections, groups) if group ]
+        results = yield from asyncio.gather(*[
+                        c.publish_many([ m for i, m in group ], wait=wait) for c, group in groups ], loop=self._loop)
+
+        if wait:
+            counts = [ None ] * sum(len(group) for c, group in groups)
+            for (c, group), group_counts in zip(groups, results):
+                for (i, m), count in zip(group, group_counts):
+                    counts[i] = count
+            return counts
+
+    @asyncio.coroutine
+    def get_pubsub_hub(self, connections=1, max_buffered=1000):
+        """
+        Return the :class:`~asyncio_redis.PubSubHub` of this pool. It is
+        created on the first call, with `connections` subscriber connections
+        of its own. (The connections of the pool stay available for other
+        commands.)
+
+        ::
+
+            hub = yield from pool.get_pubsub_hub()
+            subscription = yield from hub.start_subscribe()
+            yield from subscription.subscribe(['our-channel'])
+        """
+        if self._pubsub_hub_f is None:
+            self._pubsub_hub_f = asyncio.async(PubSubHub.create(
+                    self._host, self._port, connections=connections, max_buffered=max_buffered,
+                    loop=self._loop, **self._connection_kwargs), loop=self._loop)
+
+        f = self._pubsub_hub_f
+        try:
+            return (yield from asyncio.shield(f, loop=self._loop))
+        except Exception:
+            # Try again on the next call.
+            if self._pubsub_hub_f is f and f.done():
+                self._pubsub_hub_f = None
+            raise
 
     def close(self):
         """
         Close all the connections in the pool.
         """
-        for c in self._connections:
+        for c in self._connections + self._blocking_connections:
             c.close()
 
         self._connections = []
+        self._blocking_connections = []
+        self._busy_blocking_connections = set()
+
+        if self._pubsub_hub_f:
+            f = self._pubsub_hub_f
+            if f.done() and not f.cancelled() and not f.exception():
+                f.result().close()
+            else:
+                f.cancel()
+            self._pubsub_hub_f = None
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 import asyncio
+import hashlib
 import logging
+import random
 import types
 
 from asyncio.futures import Future
-from asyncio.queues import Queue
 from asyncio.streams import StreamReader
 
 try:
@@ -22,6 +23,7 @@ from .exceptions import (
         Error,
         ErrorReply,
         NoRunningScriptError,
+        NoScriptError,
         NotConnectedError,
         ScriptKilledError,
         TimeoutError,
@@ -30,15 +32,21 @@ from .exceptions import (
 from .log import logger
 from .replies import (
         BlockingPopReply,
+        BulkLoadReply,
         ClientListReply,
+        ClusterSlotsReply,
         ConfigPairReply,
         DictReply,
         EvalScriptReply,
         InfoReply,
         ListReply,
         PubSubReply,
+        RoleReply,
         SetReply,
         StatusReply,
+        StreamEntriesReply,
+        StreamsReply,
+        TransactionReply,
         ZRangeReply,
 )
 
@@ -49,9 +57,11 @@ __all__ = (
     'RedisProtocol',
     'HiRedisProtocol',
     'Transaction',
+    'TransactionWrites',
     'Subscription',
     'Script',
 
+    'OverflowPolicy',
     'ZAggregate',
     'ZScoreBoundary',
 )
@@ -96,6 +106,26 @@ class ZAggregate: # TODO: use the Python 3.4 enum type.
     MAX = 'MAX'
 
 
+class OverflowPolicy:
+    """
+    What a :class:`Subscription` does with incoming messages when its buffer is
+    full.
+    """
+    #: Stop parsing incoming data until the consumer has made space. Once the
+    #: read buffer is full, reading from the socket is paused. (TCP backpressure.)
+    BLOCK = 'block'
+
+    #: Drop the oldest buffered messages to make space.
+    DROP_OLDEST = 'drop_oldest'
+
+    #: Drop the incoming message.
+    DROP_NEWEST = 'drop_newest'
+
+    #: Drop the incoming message and close the connection. (When the
+    #: connection reconnects, the subscriptions are restored.)
+    DISCONNECT = 'disconnect'
+
+
 class PipelinedCall:
     """ Track record for call that is being executed in a protocol. """
     __slots__ = ('cmd', 'is_blocking')
@@ -105,6 +135,35 @@ class PipelinedCall:
         self.is_blocking = is_blocking
 
 
+class PipelinedBatch:
+    """
+    Commands of :func:`RedisProtocol.pipelined`, which are held until all of
+    them are ready, and then written together.
+    """
+    def __init__(self, protocol, count):
+        self.protocol = protocol
+        self.commands = [ None ] * count # (answer_f, args) tuples.
+        self.pending = count
+
+    def add(self, index, answer_f, args):
+        self.commands[index] = (answer_f, args)
+        self.skip(index)
+
+    def skip(self, index):
+        """ Call when the command at `index` is ready, or won't be sent. """
+        self.pending -= 1
+
+        if self.pending == 0:
+            commands = [ c for c in self.commands if c ]
+
+            if self.protocol.is_connected:
+                self.protocol._queue.extend(answer_f for answer_f, args in commands)
+                self.protocol._send_command(*[ args for answer_f, args in commands ])
+            else:
+                for answer_f, args in commands:
+                    answer_f.set_exception(NotConnectedError())
+
+
 class MultiBulkReply:
     """
     Container for a multi bulk reply.
@@ -156,7 +215,7 @@ class MultiBulkReply:
 
     def _decode(self, result):
         """ Decode bytes to native Python types. """
-        if isinstance(result, (StatusReply, int, float, MultiBulkReply)):
+        if isinstance(result, (StatusReply, int, float, MultiBulkReply, ErrorReply)):
             # Note that MultiBulkReplies can be nested. e.g. in the 'scan' operation.
             return result
         elif isinstance(result, bytes):
@@ -241,6 +300,9 @@ class PostProcessors:
                 (NativeType, NoneType): cls.bytes_to_native_or_none,
                 InfoReply: cls.bytes_to_info,
                 ClientListReply: cls.bytes_to_clientlist,
+                ClusterSlotsReply: cls.multibulk_as_cluster_slots,
+                RoleReply: cls.multibulk_as_role,
+                (tuple, NoneType): cls.multibulk_as_address_or_none,
                 str: cls.bytes_to_str,
                 bool: cls.int_to_bool,
                 BlockingPopReply: cls.multibulk_as_blocking_pop_reply,
@@ -248,10 +310,13 @@ class PostProcessors:
 
                 StatusReply: cls.bytes_to_status_reply,
                 (StatusReply, NoneType): cls.bytes_to_status_reply_or_none,
+                (bytes, NoneType): None,
                 int: None,
                 (int, NoneType): None,
                 ConfigPairReply: cls.multibulk_as_configpair,
                 ListOf(bool): cls.multibulk_as_boolean_list,
+                StreamEntriesReply: cls.multibulk_as_stream_entries,
+                StreamsReply: cls.multibulk_as_streams,
                 _ScanPart: cls.multibulk_as_scanpart,
                 EvalScriptReply: cls.any_to_evalscript,
 
@@ -347,6 +412,109 @@ class PostProcessors:
         items = yield from ListReply(items_bulk).aslist()
         return _ScanPart(int(new_cursor_pos), items)
 
+    @asyncio.coroutine
+    def multibulk_as_cluster_slots(protocol, result):
+        """
+        Process CLUSTER SLOTS result. Every item is a nested multi bulk reply:
+        [start, end, [host, port, id], [replica-host, replica-port, id], ...]
+        """
+        assert isinstance(result, MultiBulkReply)
+        slots = []
+
+        for slot_range in (yield from result._read(decode=False, count=result.count)):
+            items = yield from slot_range._read(decode=False, count=slot_range.count)
+            addresses = []
+
+            for node in items[2:]:
+                # Newer Redis versions append the node ID and metadata.
+                node_items = yield from node._read(decode=False, count=node.count)
+                addresses.append((node_items[0].decode('ascii'), int(node_items[1])))
+
+            slots.append((int(items[0]), int(items[1]), addresses[0], addresses[1:]))
+
+        return ClusterSlotsReply(slots)
+
+    @asyncio.coroutine
+    def multibulk_as_role(protocol, result):
+        """
+        Process ROLE result. The layout depends on the role:
+        master: [role, offset, [[host, port, offset], ...]]
+        slave: [role, master-host, master-port, state, offset]
+        sentinel: [role, [master-name, ...]]
+        """
+        assert isinstance(result, MultiBulkReply)
+        items = yield from result._read(decode=False, count=result.count)
+        role = items[0].decode('ascii')
+
+        if role == 'master':
+            replicas = []
+            for replica in (yield from items[2]._read(decode=False, count=items[2].count)):
+                host, port, offset = yield from replica._read(decode=False, count=3)
+                replicas.append((host.decode('ascii'), int(port), int(offset)))
+            return RoleReply(role, offset=items[1], replicas=replicas)
+
+        elif role == 'slave':
+            return RoleReply(role, offset=items[4], master=(items[1].decode('ascii'), items[2]),
+                             state=items[3].decode('ascii'))
+
+        else:
+            names = yield from items[1]._read(decode=False, count=items[1].count)
+            return RoleReply(role, master_names=[ n.decode('utf-8') for n in names ])
+
+    @asyncio.coroutine
+    def multibulk_as_stream_entries(protocol, result):
+        """
+        Process stream entries: [[id, [field, value, ...]], ...] into a
+        StreamEntriesReply. (The fields of deleted entries are None.
+        Older Redis versions return nil instead of the entry from XCLAIM,
+        these are left out.)
+        """
+        assert isinstance(result, MultiBulkReply)
+        decode = protocol.decode_to_native
+        entries = []
+
+        for entry in (yield from result._read(decode=False, count=result.count)):
+            if entry is None:
+                continue
+
+            id, fields = yield from entry._read(decode=False, count=2)
+
+            if fields is not None:
+                items = yield from fields._read(decode=False, count=fields.count)
+                fields = dict(zip(map(decode, items[::2]), map(decode, items[1::2])))
+
+            entries.append((id.decode('ascii'), fields))
+
+        return StreamEntriesReply(entries)
+
+    @asyncio.coroutine
+    def multibulk_as_streams(protocol, result):
+        """
+        Process XREAD result: [[stream, entries], ...] into a StreamsReply,
+        which maps the stream names to their entries. (Empty on timeout.)
+        """
+        streams = {}
+        if result is None:
+            return StreamsReply(streams)
+
+        assert isinstance(result, MultiBulkReply)
+        for stream in (yield from result._read(decode=False, count=result.count)):
+            name, entries = yield from stream._read(decode=False, count=2)
+            entries = yield from PostProcessors.multibulk_as_stream_entries(protocol, entries)
+            streams[protocol.decode_to_native(name)] = entries.entries
+
+        return StreamsReply(streams)
+
+    @asyncio.coroutine
+    def multibulk_as_address_or_none(protocol, result):
+        """ Process [host, port] reply into a (host, port) tuple. """
+        if result is None:
+            return None
+
+        assert isinstance(result, MultiBulkReply)
+        host, port = yield from result._read(decode=False, count=2)
+        return (host.decode('ascii'), int(port))
+
     @asyncio.coroutine
     def bytes_to_info(protocol, result):
         assert isinstance(result, bytes)
@@ -536,16 +704,21 @@ class CommandCreator:
             try:
                 return {
                     BlockingPopReply: ":class:`BlockingPopReply <asyncio_redis.replies.BlockingPopReply>`",
+                    BulkLoadReply: ":class:`BulkLoadReply <asyncio_redis.replies.BulkLoadReply>`",
                     ConfigPairReply: ":class:`ConfigPairReply <asyncio_redis.replies.ConfigPairReply>`",
                     DictReply: ":class:`DictReply <asyncio_redis.replies.DictReply>`",
                     InfoReply: ":class:`InfoReply <asyncio_redis.replies.InfoReply>`",
                     ClientListReply: ":class:`InfoReply <asyncio_redis.replies.ClientListReply>`",
+                    ClusterSlotsReply: ":class:`ClusterSlotsReply <asyncio_redis.replies.ClusterSlotsReply>`",
+                    RoleReply: ":class:`RoleReply <asyncio_redis.replies.RoleReply>`",
                     ListReply: ":class:`ListReply <asyncio_redis.replies.ListReply>`",
                     MultiBulkReply: ":class:`MultiBulkReply <asyncio_redis.replies.MultiBulkReply>`",
                     NativeType: "Native Python type, as defined by :attr:`~asyncio_redis.encoders.BaseEncoder.native_type`",
                     NoneType: "None",
                     SetReply: ":class:`SetReply <asyncio_redis.replies.SetReply>`",
                     StatusReply: ":class:`StatusReply <asyncio_redis.replies.StatusReply>`",
+                    StreamEntriesReply: ":class:`StreamEntriesReply <asyncio_redis.replies.StreamEntriesReply>`",
+                    StreamsReply: ":class:`StreamsReply <asyncio_redis.replies.StreamsReply>`",
                     ZRangeReply: ":class:`ZRangeReply <asyncio_redis.replies.ZRangeReply>`",
                     ZScoreBoundary: ":class:`ZScoreBoundary <asyncio_redis.replies.ZScoreBoundary>`",
                     EvalScriptReply: ":class:`EvalScriptReply <asyncio_redis.replies.EvalScriptReply>`",
@@ -563,6 +736,7 @@ class CommandCreator:
 
                     list: 'list',
                     set: 'set',
+                    tuple: 'tuple',
                     dict: 'dict',
 
                     # XXX: Because of circulare references, we cannot use the real types here.
@@ -690,11 +864,24 @@ _SMALL_INTS = list(str(i).encode('ascii') for i in range(1000))
 # List of all command methods.
 _all_commands = []
 
+# List of the command methods that don't modify data. (Those can run on a replica.)
+_read_only_commands = []
+
+# List of the read-only command methods that return a plain value, which can
+# be shared between callers. (Not a streaming reply or cursor.)
+_coalescable_commands = []
+
+# List of the command methods that block the connection until data arrives.
+# (A pool sends those over connections of their own.)
+_blocking_commands = []
+
 
 class _command:
     """ Mark method as command (to be passed through CommandCreator for the
     creation of a protocol method) """
     creator = CommandCreator
+    read_only = False
+    blocking = False
 
     def __init__(self, method):
         self.method = method
@@ -713,6 +900,24 @@ class _query_command(_command):
         super().__init__(method)
 
 
+def _read_only(command):
+    """
+    Mark command as read-only: it doesn't modify the data set, and can be
+    sent to a replica. (Apply on top of `_command` or `_query_command`.)
+    """
+    command.read_only = True
+    return command
+
+
+def _blocking(command):
+    """
+    Mark command as blocking: it can wait for a long time before the server
+    replies. (Apply on top of `_command` or `_query_command`.)
+    """
+    command.blocking = True
+    return command
+
+
 class _RedisProtocolMeta(type):
     """
     Metaclass for `RedisProtocol` which applies the _command decorator.
@@ -727,9 +932,29 @@ class _RedisProtocolMeta(type):
                     # Register command.
                     _all_commands.append(attr_name + suffix)
 
+                    if value.blocking:
+                        _blocking_commands.append(attr_name + suffix)
+
+                    if value.read_only:
+                        _read_only_commands.append(attr_name + suffix)
+
+                        if not value.blocking and (suffix or creator.return_type not in (ListReply, SetReply, DictReply,
+                                    ZRangeReply, Cursor, SetCursor, DictCursor, ZCursor, _ScanPart)):
+                            _coalescable_commands.append(attr_name + suffix)
+
         return type.__new__(cls, name, bases, attrs)
 
 
+def _sizeof_item(item):
+    """ Number of bytes of a raw pubsub item. (Nested items are added up.) """
+    if isinstance(item, bytes):
+        return len(item)
+    elif isinstance(item, list):
+        return sum(_sizeof_item(i) for i in item)
+    else:
+        return 0
+
+
 class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     """
     The Redis Protocol implementation.
@@ -746,12 +971,16 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     :type encoder: :class:`~asyncio_redis.encoders.BaseEncoder` instance.
     :param db: Redis database
     :type db: int
+    :param client_name: (optional) Connection name, set with ``CLIENT SETNAME``
+                        every time the connection is made.
+    :type client_name: Native Python type as defined by the ``encoder`` parameter
     :param enable_typechecking: When ``True``, check argument types for all
                                 redis commands. Normally you want to have this
                                 enabled.
     :type enable_typechecking: bool
     """
-    def __init__(self, *, password=None, db=0, encoder=None, connection_lost_callback=None, enable_typechecking=True, loop=None):
+    def __init__(self, *, password=None, db=0, encoder=None, connection_lost_callback=None, enable_typechecking=True, loop=None,
+                 client_name=None):
         if encoder is None:
             encoder = UTF8Encoder()
 
@@ -759,9 +988,17 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         assert isinstance(encoder, BaseEncoder)
         assert encoder.native_type, 'Encoder.native_type not defined'
         assert not password or isinstance(password, encoder.native_type)
+        assert not client_name or isinstance(client_name, encoder.native_type)
 
         self.password = password
         self.db = db
+        self.client_name = client_name
+
+        #: When set to the ID of another connection, ``CLIENT TRACKING`` is
+        #: enabled on every connect, with invalidation messages redirected to
+        #: that connection. (See :class:`~asyncio_redis.NearCache`.)
+        self.tracking_redirect = None
+
         self._connection_lost_callback = connection_lost_callback
         self._loop = loop or asyncio.get_event_loop()
 
@@ -773,9 +1010,19 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         self.transport = None
         self._queue = deque() # Input parser queues
-        self._messages_queue = None # Pubsub queue
         self._is_connected = False # True as long as the underlying transport is connected.
 
+        # Replies that nobody waits for are delivered to this cancelled
+        # future, which ignores them. (See `publish_many`.)
+        self._discard_f = Future(loop=self._loop)
+        self._discard_f.cancel()
+        self._initialized_f = None # Future, done when the connection setup commands have been answered.
+        self._select_f = None # Future of the SELECT in the connection setup.
+        self._select_error = None # Set when the database could not be selected.
+
+        # Scripts which are loaded again on every connect. (Maps sha to code.)
+        self._scripts = {}
+
         # Pubsub state
         self._in_pubsub = False
         self._subscription = None
@@ -786,6 +1033,8 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         self._in_transaction = False
         self._transaction = None
         self._transaction_response_queue = None # Transaction answer queue
+        self._watching = False # True while `transaction` runs.
+        self._in_bulk_load = False
 
         self._line_received_handlers = {
             b'+': self._handle_status_reply,
@@ -802,30 +1051,95 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         # Pipelined calls
         self._pipelined_calls = set() # Set of all the pipelined calls.
+        self._batches = { } # Maps the tasks of `pipelined` calls to (PipelinedBatch, index).
 
         # Start parsing reader stream.
         self._reader = StreamReader(loop=self._loop)
         self._reader.set_transport(transport)
         self._reader_f = asyncio.async(self._reader_coroutine(), loop=self._loop)
 
-        @asyncio.coroutine
-        def initialize():
-            # If a password or database was been given, first connect to that one.
-            if self.password:
-                yield from self.auth(self.password)
+        self._initialized_f = self._initialize()
+        self._initialized_f.add_done_callback(self._initialize_done)
+
+    def _initialize(self):
+        """
+        Send all the connection setup commands (AUTH, SELECT, CLIENT SETNAME,
+        CLIENT TRACKING, SCRIPT LOAD and the pubsub subscriptions) in one write, so that
+        (re)connecting only costs one round trip.
+
+        Returns a future that is done when all the replies have been received.
+        Commands from the user are held back until then. (See `_query`.) The
+        future doesn't fail: errors are logged, and the commands are sent
+        anyway. (They can fix the problem, like a new ``AUTH``.) Only when
+        the database could not be selected, commands fail until a successful
+        ``AUTH`` (which selects it again) or ``SELECT``, so that they never
+        run against the wrong database.
+        """
+        commands = []
+
+        # If a password or database was been given, first connect to that one.
+        if self.password:
+            commands.append([b'auth', self.encode_from_native(self.password)])
+
+        select_index = None
+        if self.db:
+            select_index = len(commands)
+            commands.append([b'select', self._encode_int(self.db)])
+
+        if self.client_name:
+            commands.append([b'client', b'setname', self.encode_from_native(self.client_name)])
+
+        if self.tracking_redirect is not None:
+            commands.append([b'client', b'tracking', b'on', b'redirect', self._encode_int(self.tracking_redirect)])
+
+        for code in self._scripts.values():
+            commands.append([b'script', b'load', code.encode('utf-8')])
+
+        futures = []
+        for c in commands:
+            f = Future(loop=self._loop)
+            self._queue.append(f)
+            futures.append(f)
+
+        self._select_f = futures[select_index] if select_index is not None else None
+        self._select_error = None
+
+        data = [ self._encode_command(c) for c in commands ]
+
+        # If we are in pubsub mode, send channel subscriptions again. (The
+        # replies to these are handled by the pubsub reply handler, so they
+        # don't get a future.)
+        if self._in_pubsub:
+            if self._pubsub_channels:
+                data.append(self._encode_command([b'subscribe'] + list(map(self.encode_from_native, self._pubsub_channels))))
+
+            if self._pubsub_patterns:
+                data.append(self._encode_command([b'psubscribe'] + list(map(self.encode_from_native, self._pubsub_patterns))))
+
+        if data:
+            self.transport.write(b''.join(data))
 
-            if self.db:
-                yield from self.select(self.db)
+        return asyncio.gather(*futures, loop=self._loop, return_exceptions=True)
 
-            #  If we are in pubsub mode, send channel subscriptions again.
-            if self._in_pubsub:
-                if self._pubsub_channels:
-                    yield from self._subscribe(self._subscription, list(self._pubsub_channels)) # TODO: unittest this
+    def _initialize_done(self, f):
+        if not f.cancelled():
+            for result in f.result():
+                if isinstance(result, Exception):
+                    logger.log(logging.WARNING, 'Redis connection initialization failed: %r' % result)
 
-                if self._pubsub_patterns:
-                    yield from self._psubscribe(self._subscription, list(self._pubsub_patterns))
+            if self._select_f is not None and not self._select_f.cancelled() and self._select_f.exception():
+                self._select_error = self._select_f.exception()
 
-        asyncio.async(initialize(), loop=self._loop)
+    @asyncio.coroutine
+    def _wait_for_initialization(self, command=None):
+        """
+        Wait for the connection setup commands to finish. Raise when the
+        database could not be selected, except for AUTH and SELECT.
+        """
+        yield from self._initialized_f
+
+        if self._select_error is not None and command not in (b'auth', b'select'):
+            raise self._select_error
 
     def data_received(self, data):
         """ Process data received from Redis server.  """
@@ -902,7 +1216,8 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     @property
     def in_use(self):
         """ True when this protocol is in use. """
-        return self.in_blocking_call or self.in_pubsub or self.in_transaction
+        return (self.in_blocking_call or self.in_pubsub or self.in_transaction or
+                self._watching or self._in_bulk_load)
 
     @property
     def is_connected(self):
@@ -974,41 +1289,90 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
             cb(None)
             return
 
+        # Pubsub messages are parsed completely and delivered to the
+        # subscription right here. (No task or MultiBulkReply per message,
+        # and they stay in the order of arrival.)
+        if self._in_pubsub:
+            items = yield from self._read_pubsub_items(count)
+            space_f = self._handle_pubsub_message(items)
+
+            # The subscription is full, and blocks. Don't parse anything
+            # until there is space again. (The stream reader pauses reading
+            # from the transport when its own buffer is full.)
+            if space_f:
+                yield from space_f
+            return
+
         reply = MultiBulkReply(self, count, loop=self._loop)
 
         # Return the empty queue immediately as an answer.
-        if self._in_pubsub:
-            asyncio.async(self._handle_pubsub_multibulk_reply(reply), loop=self._loop)
-        else:
-            cb(reply)
+        cb(reply)
 
         # Wait for all multi bulk reply content.
         for i in range(count):
             yield from self._handle_item(reply._feed_received)
 
     @asyncio.coroutine
-    def _handle_pubsub_multibulk_reply(self, multibulk_reply):
-        # Read first item of the multi bulk reply raw.
-        type = yield from multibulk_reply._read(decode=False, _one=True)
+    def _read_pubsub_items(self, count):
+        """
+        Read the items of a pubsub message, without decoding. Nested multi
+        bulk replies (like the keys in a client side caching invalidation)
+        become lists.
+        """
+        items = []
+        for i in range(count):
+            c = yield from self._reader.readexactly(1)
+            if c == b'*':
+                nested_count = int((yield from self._reader.readline()).rstrip(b'\r\n'))
+                if nested_count == -1:
+                    items.append(None)
+                else:
+                    items.append((yield from self._read_pubsub_items(nested_count)))
+            elif c:
+                yield from self._line_received_handlers[c](items.append)
+            else:
+                raise ConnectionLostError(None)
+        return items
+
+    def _handle_pubsub_message(self, items):
+        """
+        Put a parsed pubsub message in the buffer of the subscription.
+        Returns a future when the parser has to wait for space in the buffer.
+        """
+        type = items[0]
         assert type in (b'message', b'subscribe', b'unsubscribe', b'pmessage', b'psubscribe', b'punsubscribe')
 
+        def decode(value):
+            return self.decode_to_native(value) if isinstance(value, bytes) else value
+
         if type == b'message':
-            channel, value = yield from multibulk_reply._read(count=2)
-            yield from self._subscription._messages_queue.put(PubSubReply(channel, value))
+            channel, value = items[1:]
+            reply = PubSubReply(decode(channel), decode(value))
 
         elif type == b'pmessage':
-            pattern, channel, value = yield from multibulk_reply._read(count=3)
-            yield from self._subscription._messages_queue.put(PubSubReply(channel, value, pattern=pattern))
+            pattern, channel, value = items[1:]
+            reply = PubSubReply(decode(channel), decode(value), pattern=decode(pattern))
+
+        else:
+            # We can safely ignore 'subscribe'/'unsubscribe' replies at this point,
+            # they don't contain anything really useful.
+            return
 
-        # We can safely ignore 'subscribe'/'unsubscribe' replies at this point,
-        # they don't contain anything really useful.
+        return self._subscription._put(reply, _sizeof_item(channel) + _sizeof_item(value))
 
     # Redis operations.
 
-    def _send_command(self, args):
+    def _send_command(self, *commands):
+        """
+        Send Redis request commands, in one write.
+        Every command should be a list of bytes to be written to the transport.
+        """
+        self.transport.write(b''.join(self._encode_command(args) for args in commands))
+
+    def _encode_command(self, args):
         """
-        Send Redis request command.
-        `args` should be a list of bytes to be written to the transport.
+        Serialize a Redis request command to bytes.
+        `args` should be a list of bytes.
         """
         # Create write buffer.
         data = []
@@ -1027,8 +1391,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         for arg in args:
             data += [ b'$', self._encode_int(len(arg)), b'\r\n', arg, b'\r\n' ]
 
-        # Flush the last part
-        self.transport.write(b''.join(data))
+        return b''.join(data)
 
     @asyncio.coroutine
     def _get_answer(self, answer_f, _bypass=False, call=None):
@@ -1059,13 +1422,13 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """
         f = self._queue.popleft()
 
-        if isinstance(answer, Exception):
-            f.set_exception(answer)
-        elif f.cancelled():
+        if f.cancelled():
             # Received an answer from Redis, for a query which `Future` got
-            # already cancelled. Don't call set_result, that would raise an
-            # `InvalidStateError` otherwise.
+            # already cancelled. Don't call set_result or set_exception, that
+            # would raise an `InvalidStateError` otherwise.
             pass
+        elif isinstance(answer, Exception):
+            f.set_exception(answer)
         else:
             f.set_result(answer)
 
@@ -1082,15 +1445,23 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         if not self._is_connected:
             raise NotConnectedError
 
+        # Wait for the connection setup commands to finish. (This raises
+        # when SELECT was refused, e.g. because AUTH failed.)
+        yield from self._wait_for_initialization(args[0])
+
         call = PipelinedCall(args[0], set_blocking)
         self._pipelined_calls.add(call)
 
-        # Add a new future to our answer queue.
+        # Add a new future to our answer queue, and send the command. (Unless
+        # it's part of a `pipelined` call, then it's sent with the others.)
         answer_f = Future(loop=self._loop)
-        self._queue.append(answer_f)
+        batch = self._batches.pop(asyncio.Task.current_task(loop=self._loop), None)
 
-        # Send command
-        self._send_command(args)
+        if batch:
+            batch[0].add(batch[1], answer_f, args)
+        else:
+            self._queue.append(answer_f)
+            self._send_command(args)
 
         # Receive answer.
         result = yield from self._get_answer(answer_f, _bypass=_bypass, call=call)
@@ -1099,16 +1470,31 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     # Internal
 
     @_query_command
+    @asyncio.coroutine
     def auth(self, password:NativeType) -> StatusReply:
         """ Authenticate to the server """
         self.password = password
-        return self._query(b'auth', self.encode_from_native(password))
+        result = yield from self._query(b'auth', self.encode_from_native(password))
+
+        # When the database could not be selected during the connection
+        # setup (because of a wrong password), select it now.
+        if self._select_error is not None and not self._in_transaction:
+            yield from self._query(b'select', self._encode_int(self.db))
+            self._select_error = None
+
+        return result
 
     @_query_command
+    @asyncio.coroutine
     def select(self, db:int) -> StatusReply:
         """ Change the selected database for the current connection """
         self.db = db
-        return self._query(b'select', self._encode_int(db))
+        result = yield from self._query(b'select', self._encode_int(db))
+
+        if not self._in_transaction:
+            self._select_error = None
+
+        return result
 
     # Strings
 
@@ -1168,16 +1554,38 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         Returns True if value is successfully set """
         return self._query(b'setnx', self.encode_from_native(key), self.encode_from_native(value))
 
+    @_read_only
     @_query_command
     def get(self, key:NativeType) -> (NativeType, NoneType):
         """ Get the value of a key """
         return self._query(b'get', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def mget(self, keys:ListOf(NativeType)) -> ListReply:
         """ Returns the values of all specified keys. """
         return self._query(b'mget', *map(self.encode_from_native, keys))
 
+    @_query_command
+    def mset(self, values:dict) -> StatusReply:
+        """
+        Set multiple keys to multiple values
+
+        ::
+
+            yield from protocol.mset({ 'key': 'value', 'other_key': 'other_value' })
+        """
+        data = [ ]
+        for k,v in values.items():
+            assert isinstance(k, self.native_type)
+            assert isinstance(v, self.native_type)
+
+            data.append(self.encode_from_native(k))
+            data.append(self.encode_from_native(v))
+
+        return self._query(b'mset', *data)
+
+    @_read_only
     @_query_command
     def strlen(self, key:NativeType) -> int:
         """ Returns the length of the string value stored at key. An error is
@@ -1214,11 +1622,13 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Decrement the integer value of a key by the given number """
         return self._query(b'decrby', self.encode_from_native(key), self._encode_int(increment))
 
+    @_read_only
     @_query_command
     def randomkey(self) -> NativeType:
         """ Return a random key from the keyspace """
         return self._query(b'randomkey')
 
+    @_read_only
     @_query_command
     def exists(self, key:NativeType) -> bool:
         """ Determine if a key exists """
@@ -1268,11 +1678,13 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Perform a bitwise NOT operation between multiple keys. """
         return self._query(b'bitop', b'not', self.encode_from_native(destkey), self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def bitcount(self, key:NativeType, start:int=0, end:int=-1) -> int:
         """ Count the number of set bits (population counting) in a string. """
         return self._query(b'bitcount', self.encode_from_native(key), self._encode_int(start), self._encode_int(end))
 
+    @_read_only
     @_query_command
     def getbit(self, key:NativeType, offset:int) -> bool:
         """ Returns the bit value at offset in the string value stored at key """
@@ -1286,6 +1698,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
     # Keys
 
+    @_read_only
     @_query_command
     def keys(self, pattern:NativeType) -> ListReply:
         """
@@ -1295,11 +1708,26 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """
         return self._query(b'keys', self.encode_from_native(pattern))
 
-#    @_query_command
-#    def dump(self, key:NativeType):
-#        """ Return a serialized version of the value stored at the specified key. """
-#        # Dump does not work yet. It shouldn't be decoded using utf-8'
-#        raise NotImplementedError('Not supported.')
+    @_read_only
+    @_query_command
+    def dump(self, key:NativeType) -> (bytes, NoneType):
+        """
+        Return a serialized version of the value stored at the specified key,
+        or None when the key doesn't exist. (The value is not decoded.)
+        """
+        return self._query(b'dump', self.encode_from_native(key))
+
+    @_query_command
+    def restore(self, key:NativeType, ttl:int, serialized_value:bytes, replace:bool=False) -> StatusReply:
+        """
+        Create a key from a value that was serialized with :func:`dump
+        <asyncio_redis.RedisProtocol.dump>`.
+
+        :param ttl: Time to live in milliseconds, or 0 for no expiration.
+        :param replace: Overwrite an existing key. (Otherwise, that's an error.)
+        """
+        return self._query(b'restore', self.encode_from_native(key), self._encode_int(ttl), serialized_value,
+                           *([ b'replace' ] if replace else []))
 
     @_query_command
     def expire(self, key:NativeType, seconds:int) -> int:
@@ -1326,11 +1754,13 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Remove the expiration from a key """
         return self._query(b'persist', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def ttl(self, key:NativeType) -> int:
         """ Get the time to live for a key """
         return self._query(b'ttl', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def pttl(self, key:NativeType) -> int:
         """ Get the time to live for a key in milliseconds """
@@ -1353,27 +1783,32 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Removes and returns a random element from the set value stored at key. """
         return self._query(b'spop', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def srandmember(self, key:NativeType, count:int=1) -> SetReply:
         """ Get one or multiple random members from a set
         (Returns a list of members, even when count==1) """
         return self._query(b'srandmember', self.encode_from_native(key), self._encode_int(count))
 
+    @_read_only
     @_query_command
     def sismember(self, key:NativeType, value:NativeType) -> bool:
         """ Determine if a given value is a member of a set """
         return self._query(b'sismember', self.encode_from_native(key), self.encode_from_native(value))
 
+    @_read_only
     @_query_command
     def scard(self, key:NativeType) -> int:
         """ Get the number of members in a set """
         return self._query(b'scard', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def smembers(self, key:NativeType) -> SetReply:
         """ Get all the members in a set """
         return self._query(b'smembers', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def sinter(self, keys:ListOf(NativeType)) -> SetReply:
         """ Intersect multiple sets """
@@ -1384,6 +1819,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Intersect multiple sets and store the resulting set in a key """
         return self._query(b'sinterstore', self.encode_from_native(destination), *map(self.encode_from_native, keys))
 
+    @_read_only
     @_query_command
     def sdiff(self, keys:ListOf(NativeType)) -> SetReply:
         """ Subtract multiple sets """
@@ -1395,6 +1831,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         return self._query(b'sdiffstore', self.encode_from_native(destination),
                 *map(self.encode_from_native, keys))
 
+    @_read_only
     @_query_command
     def sunion(self, keys:ListOf(NativeType)) -> SetReply:
         """ Add multiple sets """
@@ -1432,6 +1869,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Append a value to a list, only if the list exists """
         return self._query(b'rpushx', self.encode_from_native(key), self.encode_from_native(value))
 
+    @_read_only
     @_query_command
     def llen(self, key:NativeType) -> int:
         """ Returns the length of the list stored at key. """
@@ -1442,6 +1880,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Remove elements from a list """
         return self._query(b'lrem', self.encode_from_native(key), self._encode_int(count), self.encode_from_native(value))
 
+    @_read_only
     @_query_command
     def lrange(self, key, start:int=0, stop:int=-1) -> ListReply:
         """ Get a range of elements from a list. """
@@ -1467,11 +1906,13 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Remove the last element in a list, append it to another list and return it """
         return self._query(b'rpoplpush', self.encode_from_native(source), self.encode_from_native(destination))
 
+    @_read_only
     @_query_command
     def lindex(self, key:NativeType, index:int) -> (NativeType, NoneType):
         """ Get an element from a list by its index """
         return self._query(b'lindex', self.encode_from_native(key), self._encode_int(index))
 
+    @_blocking
     @_query_command
     def blpop(self, keys:ListOf(NativeType), timeout:int=0) -> BlockingPopReply:
         """ Remove and get the first element in a list, or block until one is available.
@@ -1479,6 +1920,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         the timeout was exceeded and Redis returns `None`. """
         return self._blocking_pop(b'blpop', keys, timeout=timeout)
 
+    @_blocking
     @_query_command
     def brpop(self, keys:ListOf(NativeType), timeout:int=0) -> BlockingPopReply:
         """ Remove and get the last element in a list, or block until one is available.
@@ -1489,6 +1931,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     def _blocking_pop(self, command, keys, timeout:int=0):
         return self._query(command, *([ self.encode_from_native(k) for k in keys ] + [self._encode_int(timeout)]), set_blocking=True)
 
+    @_blocking
     @_command
     @asyncio.coroutine
     def brpoplpush(self, source:NativeType, destination:NativeType, timeout:int=0) -> NativeType:
@@ -1534,6 +1977,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         return self._query(b'zadd', self.encode_from_native(key), *data)
 
+    @_read_only
     @_query_command
     def zrange(self, key:NativeType, start:int=0, stop:int=-1) -> ZRangeReply:
         """
@@ -1557,6 +2001,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         return self._query(b'zrange', self.encode_from_native(key),
                     self._encode_int(start), self._encode_int(stop), b'withscores')
 
+    @_read_only
     @_query_command
     def zrevrange(self, key:NativeType, start:int=0, stop:int=-1) -> ZRangeReply:
         """
@@ -1580,6 +2025,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         return self._query(b'zrevrange', self.encode_from_native(key),
                     self._encode_int(start), self._encode_int(stop), b'withscores')
 
+    @_read_only
     @_query_command
     def zrangebyscore(self, key:NativeType,
                 min:ZScoreBoundary=ZScoreBoundary.MIN_VALUE,
@@ -1591,6 +2037,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
                     b'limit', self._encode_int(offset), self._encode_int(limit),
                     b'withscores')
 
+    @_read_only
     @_query_command
     def zrevrangebyscore(self, key:NativeType,
                 max:ZScoreBoundary=ZScoreBoundary.MAX_VALUE,
@@ -1616,12 +2063,14 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         return self._query(b'zremrangebyrank', self.encode_from_native(key),
                     self._encode_int(min), self._encode_int(max))
 
+    @_read_only
     @_query_command
     def zcount(self, key:NativeType, min:ZScoreBoundary, max:ZScoreBoundary) -> int:
         """ Count the members in a sorted set with scores within the given values """
         return self._query(b'zcount', self.encode_from_native(key),
                     self._encode_zscore_boundary(min), self._encode_zscore_boundary(max))
 
+    @_read_only
     @_query_command
     def zscore(self, key:NativeType, member:NativeType) -> (float, NoneType):
         """ Get the score associated with the given member in a sorted set """
@@ -1657,16 +2106,19 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
                         ZAggregate.MAX: b'MAX' }[aggregate]
                 ] )
 
+    @_read_only
     @_query_command
     def zcard(self, key:NativeType) -> int:
         """ Get the number of members in a sorted set """
         return self._query(b'zcard', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def zrank(self, key:NativeType, member:NativeType) -> (int, NoneType):
         """ Determine the index of a member in a sorted set """
         return self._query(b'zrank', self.encode_from_native(key), self.encode_from_native(member))
 
+    @_read_only
     @_query_command
     def zrevrank(self, key:NativeType, member:NativeType) -> (int, NoneType):
         """ Determine the index of a member in a sorted set, with scores ordered from high to low """
@@ -1713,36 +2165,43 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Delete one or more hash fields """
         return self._query(b'hdel', self.encode_from_native(key), *map(self.encode_from_native, fields))
 
+    @_read_only
     @_query_command
     def hget(self, key:NativeType, field:NativeType) -> (NativeType, NoneType):
         """ Get the value of a hash field """
         return self._query(b'hget', self.encode_from_native(key), self.encode_from_native(field))
 
+    @_read_only
     @_query_command
     def hexists(self, key:NativeType, field:NativeType) -> bool:
         """ Returns if field is an existing field in the hash stored at key. """
         return self._query(b'hexists', self.encode_from_native(key), self.encode_from_native(field))
 
+    @_read_only
     @_query_command
     def hkeys(self, key:NativeType) -> SetReply:
         """ Get all the keys in a hash. (Returns a set) """
         return self._query(b'hkeys', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def hvals(self, key:NativeType) -> ListReply:
         """ Get all the values in a hash. (Returns a list) """
         return self._query(b'hvals', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def hlen(self, key:NativeType) -> int:
         """ Returns the number of fields contained in the hash stored at key. """
         return self._query(b'hlen', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def hgetall(self, key:NativeType) -> DictReply:
         """ Get the value of a hash field """
         return self._query(b'hgetall', self.encode_from_native(key))
 
+    @_read_only
     @_query_command
     def hmget(self, key:NativeType, fields:ListOf(NativeType)) -> ListReply:
         """ Get the values of all the given hash fields """
@@ -1761,14 +2220,204 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         Returns: the value at field after the increment operation. """
         return self._query(b'hincrbyfloat', self.encode_from_native(key), self.encode_from_native(field), self._encode_float(increment))
 
+    # Streams
+
+    def _encode_stream_id(self, id):
+        # (IDs are returned as str, but bytes are accepted as well.)
+        return id if isinstance(id, bytes) else id.encode('ascii')
+
+    def _encode_stream_ids(self, ids):
+        return [ self._encode_stream_id(id) for id in ids ]
+
+    @_query_command
+    def xadd(self, key:NativeType, fields:dict, id:str='*', maxlen:(int, NoneType)=None, approximate:bool=True) -> str:
+        """
+        Append an entry to a stream. Returns the ID of the entry.
+
+        :param fields: Dictionary of fields and values.
+        :param id: ID of the entry, by default generated by the server.
+        :param maxlen: Trim the stream to about this many entries. (Exactly,
+                       when `approximate` is False.)
+        """
+        args = [ self.encode_from_native(key) ]
+
+        if maxlen is not None:
+            args += [ b'maxlen', b'~' if approximate else b'=', self._encode_int(maxlen) ]
+
+        args.append(id.encode('ascii'))
+
+        for k, v in fields.items():
+            args.append(self.encode_from_native(k))
+            args.append(self.encode_from_native(v))
+
+        return self._query(b'xadd', *args)
+
+    @_read_only
+    @_query_command
+    def xlen(self, key:NativeType) -> int:
+        """ Get the number of entries in a stream """
+        return self._query(b'xlen', self.encode_from_native(key))
+
+    @_read_only
+    @_query_command
+    def xrange(self, key:NativeType, start:str='-', end:str='+', count:(int, NoneType)=None) -> StreamEntriesReply:
+        """
+        Get the entries of a stream between two IDs, as ``(id, fields)`` tuples.
+        """
+        args = [ self.encode_from_native(key), start.encode('ascii'), end.encode('ascii') ]
+        if count is not None:
+            args += [ b'count', self._encode_int(count) ]
+
+        return self._query(b'xrange', *args)
+
+    @_query_command
+    def xtrim(self, key:NativeType, maxlen:int, approximate:bool=True) -> int:
+        """ Trim a stream to (about) `maxlen` entries. Returns the number of removed entries. """
+        return self._query(b'xtrim', self.encode_from_native(key), b'maxlen', b'~' if approximate else b'=',
+                    self._encode_int(maxlen))
+
+    def _xread_args(self, streams, count, block):
+        args = []
+        if count is not None:
+            args += [ b'count', self._encode_int(count) ]
+        if block is not None:
+            args += [ b'block', self._encode_int(block) ]
+
+        names = list(streams)
+        args.append(b'streams')
+        args += [ self.encode_from_native(name) for name in names ]
+        args += [ self._encode_stream_id(streams[name]) for name in names ]
+        return args
+
+    @_read_only
+    @_blocking
+    @_query_command
+    def xread(self, streams:dict, count:(int, NoneType)=None, block:(int, NoneType)=None) -> StreamsReply:
+        """
+        Read entries from one or more streams. The reply maps the stream
+        names to lists of ``(id, fields)`` tuples.
+
+        :param streams: Dictionary which maps stream names to the last ID that
+                        was seen. (``'$'`` for new entries only.)
+        :param count: Maximum number of entries per stream.
+        :param block: Wait this many milliseconds (0 is forever) for new
+                      entries. The reply is empty on timeout.
+        """
+        return self._query(b'xread', *self._xread_args(streams, count, block), set_blocking=block is not None)
+
+    @_blocking
+    @_query_command
+    def xreadgroup(self, group:NativeType, consumer:NativeType, streams:dict, count:(int, NoneType)=None,
+                   block:(int, NoneType)=None, noack:bool=False) -> StreamsReply:
+        """
+        Read entries from one or more streams as `consumer` of a consumer
+        group. Like :func:`xread`; use the ID ``'>'`` for entries that were
+        never delivered to another consumer, or ``'0'`` for the pending
+        entries of this consumer.
+        """
+        args = [ b'group', self.encode_from_native(group), self.encode_from_native(consumer) ]
+        if noack:
+            args.append(b'noack')
+
+        return self._query(b'xreadgroup', *(args + self._xread_args(streams, count, block)),
+                    set_blocking=block is not None)
+
+    @_query_command
+    def xack(self, key:NativeType, group:NativeType, ids:ListOf(str)) -> int:
+        """ Acknowledge entries of a consumer group. Returns the number of acknowledged entries. """
+        return self._query(b'xack', self.encode_from_native(key), self.encode_from_native(group),
+                    *self._encode_stream_ids(ids))
+
+    @_query_command
+    def xgroup_create(self, key:NativeType, group:NativeType, id:str='$', mkstream:bool=False) -> StatusReply:
+        """
+        Create a consumer group, which starts after entry `id`. (``'$'`` for
+        new entries only, ``'0'`` for all the entries.) With `mkstream`, the
+        stream is created when it doesn't exist.
+        """
+        args = [ b'create', self.encode_from_native(key), self.encode_from_native(group), id.encode('ascii') ]
+        if mkstream:
+            args.append(b'mkstream')
+
+        return self._query(b'xgroup', *args)
+
+    @_query_command
+    def xgroup_destroy(self, key:NativeType, group:NativeType) -> int:
+        """ Remove a consumer group """
+        return self._query(b'xgroup', b'destroy', self.encode_from_native(key), self.encode_from_native(group))
+
+    @_command
+    @asyncio.coroutine
+    def xpending(self, key:NativeType, group:NativeType) -> tuple:
+        """
+        Summary of the pending entries of a consumer group: a ``(count,
+        min_id, max_id, consumers)`` tuple, where `consumers` maps the
+        consumer names to their number of pending entries.
+        """
+        result = yield from self._query(b'xpending', self.encode_from_native(key), self.encode_from_native(group))
+
+        assert isinstance(result, MultiBulkReply)
+        count, min_id, max_id, consumers = yield from result._read(decode=False, count=4)
+        counts = {}
+
+        if consumers is not None:
+            for consumer in (yield from consumers._read(decode=False, count=consumers.count)):
+                name, n = yield from consumer._read(decode=False, count=2)
+                counts[self.decode_to_native(name)] = int(n)
+
+        return (count, min_id and min_id.decode('ascii'), max_id and max_id.decode('ascii'), counts)
+
+    @_command
+    @asyncio.coroutine
+    def xpending_range(self, key:NativeType, group:NativeType, start:str='-', end:str='+', count:int=10,
+                       consumer:(NativeType, NoneType)=None) -> list:
+        """
+        Pending entries of a consumer group between two IDs, as a list of
+        ``(id, consumer, idle, deliveries)`` tuples. `idle` is the time in
+        milliseconds since the last delivery.
+        """
+        args = [ self.encode_from_native(key), self.encode_from_native(group),
+                 start.encode('ascii'), end.encode('ascii'), self._encode_int(count) ]
+        if consumer is not None:
+            args.append(self.encode_from_native(consumer))
+
+        result = yield from self._query(b'xpending', *args)
+
+        assert isinstance(result, MultiBulkReply)
+        entries = []
+        for entry in (yield from result._read(decode=False, count=result.count)):
+            id, name, idle, deliveries = yield from entry._read(decode=False, count=4)
+            entries.append((id.decode('ascii'), self.decode_to_native(name), idle, deliveries))
+
+        return entries
+
+    @_query_command
+    def xclaim(self, key:NativeType, group:NativeType, consumer:NativeType, min_idle_time:int,
+               ids:ListOf(str)) -> StreamEntriesReply:
+        """
+        Change the owner of pending entries that are idle for at least
+        `min_idle_time` milliseconds. Returns the claimed entries as ``(id,
+        fields)`` tuples.
+        """
+        return self._query(b'xclaim', self.encode_from_native(key), self.encode_from_native(group),
+                    self.encode_from_native(consumer), self._encode_int(min_idle_time),
+                    *self._encode_stream_ids(ids))
+
     # Pubsub
     # (subscribe, unsubscribe, etc... should be called through the Subscription class.)
 
     @_command
-    def start_subscribe(self, *a) -> 'Subscription':
+    def start_subscribe(self, *a, max_messages:(int, NoneType)=None, max_bytes:(int, NoneType)=None,
+                        overflow:str=OverflowPolicy.BLOCK) -> 'Subscription':
         """
         Start a pubsub listener.
 
+        Received messages are buffered in the subscription until they are
+        consumed. The buffer can be bounded by the number of messages
+        (`max_messages`) and by the size of the channel names and values
+        (`max_bytes`). `overflow` is one of the :class:`OverflowPolicy`
+        constants, and defines what happens when it is full.
+
         ::
 
             # Create subscription
@@ -1790,7 +2439,11 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         if self.in_use:
             raise Error('Cannot start pubsub listener when a protocol is in use.')
 
-        subscription = Subscription(self)
+        if overflow not in (OverflowPolicy.BLOCK, OverflowPolicy.DROP_OLDEST,
+                            OverflowPolicy.DROP_NEWEST, OverflowPolicy.DISCONNECT):
+            raise Error('Unknown overflow policy: %r' % overflow)
+
+        subscription = Subscription(self, max_messages=max_messages, max_bytes=max_bytes, overflow=overflow)
 
         self._in_pubsub = True
         self._subscription = subscription
@@ -1825,6 +2478,11 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         if not self._in_pubsub:
             raise Error('Cannot call pubsub methods without calling start_subscribe')
 
+        if not self._is_connected:
+            raise NotConnectedError
+
+        yield from self._initialized_f
+
         # Send
         self._send_command([method.encode('ascii')] + list(map(self.encode_from_native, params)))
 
@@ -1842,6 +2500,40 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         (Returns the number of clients that received this message.) """
         return self._query(b'publish', self.encode_from_native(channel), self.encode_from_native(message))
 
+    @_command
+    @asyncio.coroutine
+    def publish_many(self, messages:ListOf(tuple), wait:bool=True) -> (list, NoneType):
+        """
+        Post a list of ``(channel, message)`` tuples. All the PUBLISH
+        commands are sent in one write.
+
+        Returns the number of clients that received every message, in the
+        order of `messages`. With ``wait=False``, the replies are discarded as
+        they arrive, and None is returned right after writing. (Fire and
+        forget.)
+        """
+        if not self._is_connected:
+            raise NotConnectedError
+
+        yield from self._initialized_f
+
+        encode = self.encode_from_native
+        messages = list(messages)
+        data = b''.join([ self._encode_command([ b'publish', encode(channel), encode(message) ])
+                          for channel, message in messages ])
+
+        if wait:
+            futures = [ Future(loop=self._loop) for m in messages ]
+            self._queue.extend(futures)
+        else:
+            self._queue.extend([ self._discard_f ] * len(messages))
+
+        if data:
+            self.transport.write(data)
+
+        if wait:
+            return (yield from asyncio.gather(*futures, loop=self._loop))
+
     @_query_command
     def pubsub_channels(self, pattern:(NativeType, NoneType)=None) -> ListReply:
         """
@@ -1866,20 +2558,122 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         clients are subscribed to. """
         return self._query(b'pubsub', b'numpat')
 
-    # Server
+    # Mass insertion
 
-    @_query_command
-    def ping(self) -> StatusReply:
-        """ Ping the server (Returns PONG) """
-        return self._query(b'ping')
+    @_command
+    @asyncio.coroutine
+    def bulk_load(self, commands, max_pending:int=10000, buffer_size:int=65536) -> BulkLoadReply:
+        """
+        Send a large number of commands, like ``redis-cli --pipe``.
 
-    @_query_command
-    def echo(self, string:NativeType) -> NativeType:
-        """ Echo the given string """
-        return self._query(b'echo', self.encode_from_native(string))
+        `commands` is an iterator (or async iterator) of tuples, with the
+        command name, followed by the arguments. ``str`` arguments are
+        encoded with the encoder, ``bytes`` are sent as-is and numbers are
+        converted to strings.
 
-    @_query_command
-    def save(self) -> StatusReply:
+        The commands are serialized into buffers of about `buffer_size`
+        bytes, which are written at once. Instead of a future for every
+        command, the replies are only counted, and no more than `max_pending`
+        replies can be outstanding before reading from `commands` waits.
+
+        ::
+
+            commands = (('set', 'key:%i' % i, i) for i in range(10 * 1000 * 1000))
+            reply = yield from protocol.bulk_load(commands)
+            print(reply.errors, reply.throughput)
+
+        :returns: :class:`~asyncio_redis.replies.BulkLoadReply`
+        """
+        if not self._is_connected:
+            raise NotConnectedError
+
+        if self._in_transaction or self._in_pubsub:
+            raise Error('bulk_load is not possible inside a transaction or in pubsub mode.')
+
+        # (This keeps a pool from using the connection for other commands.)
+        self._in_bulk_load = True
+        try:
+            yield from self._wait_for_initialization()
+
+            counter = _ReplyCounter(self._loop)
+            start = self._loop.time()
+            buffer = []
+            buffered_bytes = 0
+            total = 0
+
+            def encode(arg):
+                if isinstance(arg, bytes):
+                    return arg
+                elif isinstance(arg, int):
+                    return self._encode_int(arg)
+                elif isinstance(arg, float):
+                    return self._encode_float(arg)
+                else:
+                    return self.encode_from_native(arg)
+
+            def flush():
+                # Add the replies to the queue while writing, so that they
+                # stay in the order of the other requests on this connection.
+                counter.pending += len(buffer)
+                self._queue.extend([ counter ] * len(buffer))
+                self.transport.write(b''.join(buffer))
+                del buffer[:]
+
+            if hasattr(commands, '__aiter__'):
+                iterator = commands.__aiter__()
+                next_command = iterator.__anext__
+            else:
+                iterator = iter(commands)
+                next_command = None
+
+            while True:
+                if next_command:
+                    try:
+                        command = yield from next_command()
+                    except StopAsyncIteration:
+                        break
+                else:
+                    try:
+                        command = next(iterator)
+                    except StopIteration:
+                        break
+
+                name = command[0]
+                data = self._encode_command([ name.encode('ascii') if isinstance(name, str) else name ] +
+                                            [ encode(arg) for arg in command[1:] ])
+                buffer.append(data)
+                buffered_bytes += len(data)
+                total += 1
+
+                if buffered_bytes >= buffer_size:
+                    flush()
+                    buffered_bytes = 0
+
+                    if counter.pending >= max_pending:
+                        yield from counter.wait(max_pending // 2)
+
+            if buffer:
+                flush()
+            yield from counter.wait(0)
+
+            return BulkLoadReply(total, counter.errors, counter.first_error, self._loop.time() - start)
+        finally:
+            self._in_bulk_load = False
+
+    # Server
+
+    @_query_command
+    def ping(self) -> StatusReply:
+        """ Ping the server (Returns PONG) """
+        return self._query(b'ping')
+
+    @_query_command
+    def echo(self, string:NativeType) -> NativeType:
+        """ Echo the given string """
+        return self._query(b'echo', self.encode_from_native(string))
+
+    @_query_command
+    def save(self) -> StatusReply:
         """ Synchronously save the dataset to disk """
         return self._query(b'save')
 
@@ -1898,6 +2692,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Get the UNIX time stamp of the last successful save to disk """
         return self._query(b'lastsave')
 
+    @_read_only
     @_query_command
     def dbsize(self) -> int:
         """ Return the number of keys in the currently-selected database. """
@@ -1918,6 +2713,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 #        """ Inspect the internals of Redis objects """
 #        raise NotImplementedError
 
+    @_read_only
     @_query_command
     def type(self, key:NativeType) -> StatusReply:
         """ Determine the type stored at key """
@@ -1957,6 +2753,21 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """ Synchronously save the dataset to disk and then shut down the server """
         return self._query(b'shutdown', (b'save' if save else b'nosave'))
 
+    @_query_command
+    def role(self) -> RoleReply:
+        """ Return the role of this instance in the context of replication """
+        return self._query(b'role')
+
+    @_query_command
+    def wait(self, numreplicas:int, timeout:int) -> int:
+        """
+        Block until all the previous write commands of this connection are
+        acknowledged by at least `numreplicas` replicas, or until the timeout
+        (in milliseconds) is reached. Returns the number of replicas that
+        acknowledged the writes.
+        """
+        return self._query(b'wait', self._encode_int(numreplicas), self._encode_int(timeout))
+
     @_query_command
     def client_getname(self) -> NativeType:
         """ Get the current connection name """
@@ -1965,8 +2776,39 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
     @_query_command
     def client_setname(self, name) -> StatusReply:
         """ Set the current connection name """
+        self.client_name = name
         return self._query(b'client', b'setname', self.encode_from_native(name))
 
+    @_query_command
+    def client_id(self) -> int:
+        """ Get the ID of the current connection """
+        return self._query(b'client', b'id')
+
+    @_query_command
+    def client_tracking(self, enable:bool, redirect:(int, NoneType)=None,
+                        prefixes:(ListOf(NativeType), NoneType)=None, bcast:bool=False) -> StatusReply:
+        """
+        Enable or disable server assisted client side caching. Invalidation
+        messages are sent to the connection with ID `redirect`, on the
+        ``__redis__:invalidate`` channel. (Tracking with this redirect is
+        enabled again after a reconnect, the prefixes are not.)
+        """
+        args = [ b'client', b'tracking', b'on' if enable else b'off' ]
+
+        if redirect is not None:
+            args += [ b'redirect', self._encode_int(redirect) ]
+
+        # Enable it again after a reconnect.
+        self.tracking_redirect = redirect if enable else None
+
+        for prefix in prefixes or []:
+            args += [ b'prefix', self.encode_from_native(prefix) ]
+
+        if bcast:
+            args.append(b'bcast')
+
+        return self._query(*args)
+
     @_query_command
     def client_list(self) -> ClientListReply:
         """ Get the list of client connections """
@@ -1980,6 +2822,46 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """
         return self._query(b'client', b'kill', address.encode('utf-8'))
 
+    # Cluster
+
+    @_query_command
+    def cluster_slots(self) -> ClusterSlotsReply:
+        """ Get the mapping of hash slots to cluster nodes """
+        return self._query(b'cluster', b'slots')
+
+    @_query_command
+    def cluster_info(self) -> str:
+        """ Get information about the state of the cluster """
+        return self._query(b'cluster', b'info')
+
+    @_query_command
+    def cluster_meet(self, host:str, port:int) -> StatusReply:
+        """ Connect this cluster node to another node """
+        return self._query(b'cluster', b'meet', host.encode('ascii'), self._encode_int(port))
+
+    @_query_command
+    def cluster_addslots(self, slots:ListOf(int)) -> StatusReply:
+        """ Assign hash slots to this cluster node """
+        return self._query(b'cluster', b'addslots', *map(self._encode_int, slots))
+
+    @_query_command
+    def asking(self) -> StatusReply:
+        """
+        Allow the next command on this connection to access a slot that is
+        being imported into this node. (Used for following ASK redirections.)
+        """
+        return self._query(b'asking')
+
+    # Sentinel
+
+    @_query_command
+    def sentinel_get_master_addr_by_name(self, name:str) -> (tuple, NoneType):
+        """
+        Ask a sentinel for the ``(host, port)`` of the current master of the
+        service `name`. Returns None when the sentinel doesn't know the service.
+        """
+        return self._query(b'sentinel', b'get-master-addr-by-name', name.encode('utf-8'))
+
     # LUA scripting
 
     @_command
@@ -1988,15 +2870,24 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         """
         Register a LUA script.
 
+        The SHA1 digest is computed locally, without a round trip. The first
+        ``run`` loads the script in the server through the ``EVAL``
+        fallback.
+
         ::
 
             script = yield from protocol.register_script(lua_code)
             result = yield from script.run(keys=[...], args=[...])
         """
+        if False: yield
+
         # The register_script APi was made compatible with the redis.py library:
         # https://github.com/andymccurdy/redis-py
-        sha = yield from self.script_load(script)
-        return Script(sha, script, lambda:self.evalsha)
+        sha = _script_sha(script)
+
+        # Load the script again when we reconnect.
+        self._scripts[sha] = script
+        return Script(sha, script, lambda:self.evalsha, lambda:self.eval, lambda:self.evalsha_many)
 
     @_query_command
     def script_exists(self, shas:ListOf(str)) -> ListOf(bool):
@@ -2036,29 +2927,93 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         The return type/value depends on the script.
 
         This will raise a :class:`~asyncio_redis.exceptions.ScriptKilledError`
-        exception if the script was killed.
+        exception if the script was killed, and a
+        :class:`~asyncio_redis.exceptions.NoScriptError` if the script is not
+        in the script cache.
         """
-        if not keys: keys = []
-        if not args: args = []
+        keys = list(keys or [])
+        args = list(args or [])
 
         try:
-            result = yield from self._query(b'evalsha', sha.encode('ascii'),
+            return (yield from self._query(b'evalsha', sha.encode('ascii'),
                         self._encode_int(len(keys)),
-                        *map(self.encode_from_native, keys + args))
+                        *map(self.encode_from_native, keys + args)))
+        except ErrorReply as e:
+            raise _translate_script_error(e)
 
-            return result
-        except ErrorReply:
-            raise ScriptKilledError
+    @_command
+    @asyncio.coroutine
+    def evalsha_many(self, sha:str, calls:ListOf(tuple)) -> list:
+        """
+        Evaluate a cached script once for every ``(keys, args)`` tuple in
+        `calls`. All the EVALSHA commands are sent in one write.
+
+        Returns the decoded return values, in the order of `calls`. When a
+        call fails, its entry contains the exception instead, e.g.
+        :class:`~asyncio_redis.exceptions.NoScriptError`.
+        """
+        if not self._is_connected:
+            raise NotConnectedError
+
+        yield from self._wait_for_initialization()
+
+        futures = []
+        data = []
+        encoded_sha = sha.encode('ascii')
+
+        for keys, args in calls:
+            keys = list(keys or [])
+            args = list(args or [])
+            data.append(self._encode_command([ b'evalsha', encoded_sha, self._encode_int(len(keys)) ] +
+                                             list(map(self.encode_from_native, keys + args))))
+
+            f = Future(loop=self._loop)
+            self._queue.append(f)
+            futures.append(f)
+
+        if data:
+            self.transport.write(b''.join(data))
+
+        results = []
+        for f in futures:
+            try:
+                value = yield from f
+                results.append((yield from EvalScriptReply(self, value).return_value()))
+            except ErrorReply as e:
+                results.append(_translate_script_error(e))
+        return results
+
+    @_query_command
+    @asyncio.coroutine
+    def eval(self, script:str,
+                        keys:(ListOf(NativeType), NoneType)=None,
+                        args:(ListOf(NativeType), NoneType)=None) -> EvalScriptReply:
+        """
+        Evaluates a script. (The server adds it to the script cache.)
+
+        This will raise a :class:`~asyncio_redis.exceptions.ScriptKilledError`
+        exception if the script was killed.
+        """
+        keys = list(keys or [])
+        args = list(args or [])
+
+        try:
+            return (yield from self._query(b'eval', script.encode('utf-8'),
+                        self._encode_int(len(keys)),
+                        *map(self.encode_from_native, keys + args)))
+        except ErrorReply as e:
+            raise _translate_script_error(e)
 
     @_query_command
     def script_load(self, script:str) -> str:
         """ Load script, returns sha1 """
-        return self._query(b'script', b'load', script.encode('ascii'))
+        return self._query(b'script', b'load', script.encode('utf-8'))
 
     # Scanning
 
+    @_read_only
     @_command
-    def scan(self, match:(NativeType, NoneType)=None) -> Cursor:
+    def scan(self, match:(NativeType, NoneType)=None, cursor:int=0) -> Cursor:
         """
         Walk through the keys space. You can either fetch the items one by one
         or in bulk.
@@ -2086,6 +3041,9 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
             cursor.count = 100
 
+        An interrupted scan can be resumed by passing the ``position`` of the
+        cursor as `cursor`.
+
         Also see: :func:`~asyncio_redis.RedisProtocol.sscan`,
         :func:`~asyncio_redis.RedisProtocol.hscan` and
         :func:`~asyncio_redis.RedisProtocol.zscan`
@@ -2097,8 +3055,9 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         def scanfunc(cursor, count):
             return self._scan(cursor, match, count)
 
-        return Cursor(name='scan(match=%r)' % match, scanfunc=scanfunc)
+        return Cursor(name='scan(match=%r)' % match, scanfunc=scanfunc, position=cursor)
 
+    @_read_only
     @_query_command
     def _scan(self, cursor:int, match:(NativeType,NoneType), count:int) -> _ScanPart:
         match = b'*' if match is None else self.encode_from_native(match)
@@ -2107,6 +3066,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
                     b'match', match,
                     b'count', self._encode_int(count))
 
+    @_read_only
     @_command
     def sscan(self, key:NativeType, match:(NativeType,NoneType)=None) -> SetCursor:
         """
@@ -2122,6 +3082,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         return SetCursor(name=name, scanfunc=scan)
 
+    @_read_only
     @_command
     def hscan(self, key:NativeType, match:(NativeType,NoneType)=None) -> DictCursor:
         """
@@ -2136,6 +3097,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         return DictCursor(name=name, scanfunc=scan)
 
+    @_read_only
     @_command
     def zscan(self, key:NativeType, match:(NativeType,NoneType)=None) -> DictCursor:
         """
@@ -2150,6 +3112,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         return ZCursor(name=name, scanfunc=scan)
 
+    @_read_only
     @_query_command
     def _do_scan(self, verb:bytes, key:NativeType, cursor:int, match:(NativeType,NoneType), count:int) -> _ScanPart:
         match = b'*' if match is None else self.encode_from_native(match)
@@ -2232,6 +3195,159 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         self._transaction = t
         return t
 
+    @asyncio.coroutine
+    def pipelined(self, *calls):
+        """
+        Run the commands `calls`, which are ``(name, args, kwargs)`` tuples,
+        and write them to the server together, in this order. Nothing else is
+        sent on this connection in between. (For commands like ``ASKING``,
+        which applies to the next command.)
+
+        Returns a list with the result of every command, or the exception
+        that it raised.
+
+        ::
+
+            asking, value = yield from protocol.pipelined(('asking', (), {}), ('get', ('key', ), {}))
+        """
+        if not self._is_connected:
+            raise NotConnectedError
+
+        yield from self._wait_for_initialization()
+
+        batch = PipelinedBatch(self, len(calls))
+        tasks = []
+
+        def done(task):
+            # The command failed before it was sent.
+            if task in self._batches:
+                self._batches.pop(task)[0].skip(tasks.index(task))
+
+        # Every command runs in its own task. `_query` recognizes the task,
+        # and hands the command to the batch instead of sending it.
+        for index, (name, args, kwargs) in enumerate(calls):
+            task = asyncio.async(getattr(self, name)(*args, **kwargs), loop=self._loop)
+            task.add_done_callback(done)
+            self._batches[task] = (batch, index)
+            tasks.append(task)
+
+        results = yield from asyncio.gather(*tasks, loop=self._loop, return_exceptions=True)
+        return list(results)
+
+    @asyncio.coroutine
+    def transaction(self, func, watch_keys=None, retries=10, backoff=.001):
+        """
+        Run a transaction with optimistic locking, and retry it when one of
+        the watched keys was modified in the meantime.
+
+        `func` is a coroutine function which is called with this protocol and
+        a :class:`TransactionWrites` object. It does the reads on the
+        protocol, and records the writes on the other object. The writes are
+        sent in one go between ``MULTI`` and ``EXEC``. When ``EXEC`` fails
+        because of a watched key, `func` is called again, after a random
+        delay of up to ``backoff * 2 ** retry`` seconds.
+
+        ::
+
+            @asyncio.coroutine
+            def increment(protocol, writes):
+                value = yield from protocol.get('counter')
+                writes.set('counter', str(int(value or 0) + 1))
+
+            reply = yield from protocol.transaction(increment, ['counter'])
+
+        :param watch_keys: Keys to ``WATCH`` before calling `func`.
+        :type watch_keys: list
+        :param retries: Maximum number of retries.
+        :type retries: int
+        :param backoff: Base delay in seconds between the retries.
+        :type backoff: float
+        :returns: :class:`~asyncio_redis.replies.TransactionReply`. Raises
+                  :class:`~asyncio_redis.exceptions.TransactionError` when
+                  all the retries failed.
+        """
+        if self._in_transaction or self._watching:
+            raise Error('Transactions can not be nested.')
+
+        retry = 0
+
+        # (This keeps a pool from using the connection for other commands,
+        # also during the delay between the retries.)
+        self._watching = True
+        try:
+            while True:
+                writes = TransactionWrites()
+
+                try:
+                    if watch_keys:
+                        yield from self.watch(watch_keys)
+
+                    value = yield from func(self, writes)
+
+                    if writes._calls:
+                        results = yield from self._execute_writes(writes._calls)
+                        return TransactionReply(value, results, retry)
+
+                    elif watch_keys:
+                        yield from self._query(b'unwatch')
+
+                    return TransactionReply(value, [], retry)
+
+                except TransactionError:
+                    # A watched key was modified.
+                    if retry >= retries:
+                        raise TransactionError('Transaction failed after %i retries.' % retries)
+
+                except BaseException:
+                    yield from self._abort_transaction()
+                    raise
+
+                yield from asyncio.sleep(random.uniform(0, backoff * 2 ** retry), loop=self._loop)
+                retry += 1
+        finally:
+            self._watching = False
+
+    @asyncio.coroutine
+    def _execute_writes(self, calls):
+        """
+        Send MULTI, the writes and EXEC. Return the results of the writes.
+        """
+        transaction = yield from self.multi()
+
+        # Queue all the writes at once, before waiting for any QUEUED reply.
+        tasks = [ asyncio.async(getattr(transaction, name)(*a, **kw), loop=self._loop) for name, a, kw in calls ]
+        yield from asyncio.wait(tasks, loop=self._loop)
+
+        for task in tasks:
+            if task.exception():
+                raise task.exception()
+
+        yield from transaction.exec()
+
+        results = []
+        for task in tasks:
+            try:
+                results.append((yield from task.result()))
+            except ErrorReply as e:
+                results.append(e)
+        return results
+
+    @asyncio.coroutine
+    def _abort_transaction(self):
+        """
+        Discard the transaction or forget the watched keys, after an error in
+        `transaction`.
+        """
+        try:
+            if self._in_transaction:
+                yield from self._discard()
+            else:
+                yield from self._query(b'unwatch')
+        except (OSError, Error, ErrorReply):
+            # The connection is gone, or broken. (The original exception is
+            # raised.)
+            pass
+
     @asyncio.coroutine
     def _exec(self):
         """
@@ -2248,6 +3364,7 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
 
         if multi_bulk_reply is None:
             # We get None when a transaction failed.
+            self._forget_queued_calls(futures_and_postprocessors)
             self._transaction_response_queue = deque()
             self._in_transaction = False
             self._transaction = None
@@ -2279,12 +3396,19 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         if not self._in_transaction:
             raise Error('Not in transaction')
 
+        self._forget_queued_calls(self._transaction_response_queue)
         self._transaction_response_queue = deque()
         self._in_transaction = False
         self._transaction = None
         result = yield from self._query(b'discard')
         assert result == b'OK'
 
+    def _forget_queued_calls(self, futures_and_postprocessors):
+        """ Remove the calls of a transaction that won't be executed. """
+        for f, call in futures_and_postprocessors:
+            if call:
+                self._pipelined_calls.discard(call)
+
     @asyncio.coroutine
     def _unwatch(self):
         """
@@ -2297,13 +3421,39 @@ class RedisProtocol(asyncio.Protocol, metaclass=_RedisProtocolMeta):
         assert result == b'OK'
 
 
+def _script_sha(code):
+    """ SHA1 digest of a script, as used by the server's script cache. """
+    return hashlib.sha1(code.encode('utf-8')).hexdigest()
+
+
+def _translate_script_error(e):
+    """ Turn the ErrorReply of EVAL/EVALSHA in a more specific exception. """
+    message = e.args[0]
+
+    if message.startswith('NOSCRIPT'):
+        return NoScriptError(message)
+    elif 'Script killed' in message:
+        return ScriptKilledError(message)
+    else:
+        return e
+
+
 class Script:
-    """ Lua script. """
-    def __init__(self, sha, code, get_evalsha_func):
+    """
+    Lua script.
+
+    When the script is missing from the script cache of the server (after a
+    restart, ``SCRIPT FLUSH`` or on a node that never saw it), ``run`` falls
+    back to ``EVAL`` with the full source, which loads it again.
+    """
+    def __init__(self, sha, code, get_evalsha_func, get_eval_func=None, get_evalsha_many_func=None):
         self.sha = sha
         self.code = code
         self.get_evalsha_func = get_evalsha_func
+        self.get_eval_func = get_eval_func
+        self.get_evalsha_many_func = get_evalsha_many_func
 
+    @asyncio.coroutine
     def run(self, keys=[], args=[]):
         """
         Returns a coroutine that executes the script.
@@ -2318,7 +3468,105 @@ class Script:
         This will raise a :class:`~asyncio_redis.exceptions.ScriptKilledError`
         exception if the script was killed.
         """
-        return self.get_evalsha_func()(self.sha, keys, args)
+        # (We could need them twice.)
+        keys = list(keys)
+        args = list(args)
+
+        try:
+            return (yield from self.get_evalsha_func()(self.sha, keys, args))
+        except NoScriptError:
+            if self.get_eval_func is None:
+                raise
+
+        # (Concurrent callers don't wait for each other; a flushed script
+        # costs each of them one extra round trip.)
+        return (yield from self.get_eval_func()(self.code, keys, args))
+
+    @asyncio.coroutine
+    def run_many(self, calls):
+        """
+        Run the script for every ``(keys, args)`` tuple in `calls`, pipelined
+        in one write (per node). Returns the return values in order; the entry
+        of a call that failed contains the exception.
+
+        ::
+
+            results = yield from script.run_many([ (['key1'], ['arg']), (['key2'], ['arg']) ])
+        """
+        calls = [ (list(keys), list(args)) for keys, args in calls ]
+        results = yield from self.get_evalsha_many_func()(self.sha, calls)
+
+        # Where the script was missing, run one call with the EVAL fallback,
+        # which loads it, and the others again. (Repeat for every node that
+        # didn't have it.)
+        retry = [ i for i, r in enumerate(results) if isinstance(r, NoScriptError) ]
+
+        while retry:
+            i, rest = retry[0], retry[1:]
+            try:
+                reply = yield from self.run(*calls[i])
+                results[i] = yield from reply.return_value()
+            except (Error, ErrorReply) as e:
+                results[i] = e
+
+            if rest:
+                for j, r in zip(rest, (yield from self.get_evalsha_many_func()(self.sha, [ calls[j] for j in rest ]))):
+                    results[j] = r
+
+            retry = [ j for j in rest if isinstance(results[j], NoScriptError) ]
+
+        return results
+
+
+class _ReplyCounter:
+    """
+    Takes the place of the futures of the commands of `bulk_load` in the
+    answer queue. Counts the replies instead of delivering them.
+    """
+    def __init__(self, loop):
+        self._loop = loop
+        self._waiter = None
+        self._low_water = 0
+        self.pending = 0
+        self.errors = 0
+        self.first_error = None
+        self.connection_error = None
+
+    def cancelled(self):
+        return False
+
+    def set_result(self, result):
+        self.pending -= 1
+        self._wakeup()
+
+    def set_exception(self, exception):
+        self.pending -= 1
+
+        if isinstance(exception, ConnectionLostError):
+            self.connection_error = exception
+        else:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = exception
+
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._waiter and not self._waiter.done() and (
+                self.pending <= self._low_water or self.connection_error):
+            self._waiter.set_result(None)
+
+    @asyncio.coroutine
+    def wait(self, low_water):
+        """ Wait until no more than `low_water` replies are outstanding. """
+        if self.pending > low_water and not self.connection_error:
+            self._low_water = low_water
+            self._waiter = Future(loop=self._loop)
+            yield from self._waiter
+            self._waiter = None
+
+        if self.connection_error:
+            raise self.connection_error
 
 
 class Transaction:
@@ -2374,13 +3622,284 @@ class Transaction:
         return self._protocol._unwatch()
 
 
-class Subscription:
+class TransactionWrites:
+    """
+    Writes of :func:`RedisProtocol.transaction <asyncio_redis.RedisProtocol.transaction>`.
+    Every redis command called on this object is recorded, and sent later
+    inside the transaction. (Don't ``yield from`` the calls, they return
+    ``None``.)
+    """
+    def __init__(self):
+        self._calls = [] # (name, args, kwargs) tuples.
+
+    def __getattr__(self, name):
+        # Only record commands.
+        if name not in _all_commands:
+            raise AttributeError(name)
+
+        def record(*a, **kw):
+            self._calls.append((name, a, kw))
+        return record
+
+
+class _MessageBuffer:
+    """
+    Bounded buffer of received pubsub messages, and the consumer side of a
+    subscription.
+    """
+    def __init__(self, loop, max_messages=None, max_bytes=None, overflow=OverflowPolicy.BLOCK):
+        self._loop = loop
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._overflow = overflow
+
+        self._buffer = deque() # (PubSubReply, size) tuples.
+        self._buffered_bytes = 0
+        self._getters = [] # Futures of consumers, waiting for a message.
+        self._space_f = None # Future of the producer, waiting for space.
+        self._exception = None # Raised to consumers when the buffer is empty.
+
+        self._dropped_messages = 0
+        self._high_water_messages = 0
+        self._high_water_bytes = 0
+
+        self._handlers = {} # Maps channel or pattern to a list of (callback, executor) tuples.
+        self._handler_errors = 0
+
+    @property
+    def buffered_messages(self):
+        """ Number of received messages that have not been consumed yet. """
+        return len(self._buffer)
+
+    @property
+    def buffered_bytes(self):
+        """ Size of the channel names and values of the buffered messages. """
+        return self._buffered_bytes
+
+    @property
+    def dropped_messages(self):
+        """ Number of messages that were dropped because the buffer was full. """
+        return self._dropped_messages
+
+    @property
+    def high_water_messages(self):
+        """ Highest number of buffered messages so far. """
+        return self._high_water_messages
+
+    @property
+    def high_water_bytes(self):
+        """ Highest number of buffered bytes so far. """
+        return self._high_water_bytes
+
+    @property
+    def handler_errors(self):
+        """ Number of exceptions raised by handlers. """
+        return self._handler_errors
+
+    def add_handler(self, channel_or_pattern, callback, executor=None):
+        """
+        Call `callback` with the :class:`PubSubReply <asyncio_redis.replies.PubSubReply>`
+        of every message on this channel, or on a channel that matches this
+        pattern. (Subscribing is still done with ``subscribe`` or
+        ``psubscribe``.)
+
+        The callback is called right when the message has been received,
+        without waiting in the buffer. Messages that are handled are not
+        returned by ``next_published``. The callback should be fast; for
+        heavy work, pass an `executor`
+        (:class:`concurrent.futures.Executor`) to run it in. Exceptions of a
+        callback are logged and don't affect the other handlers.
+
+        ::
+
+            subscription.add_handler('invalidations', lambda reply: cache.pop(reply.value, None))
+        """
+        self._handlers.setdefault(channel_or_pattern, []).append((callback, executor))
+
+    def remove_handler(self, channel_or_pattern, callback):
+        """
+        Stop calling `callback` for this channel or pattern.
+        """
+        handlers = [ h for h in self._handlers.get(channel_or_pattern, []) if h[0] != callback ]
+        if handlers:
+            self._handlers[channel_or_pattern] = handlers
+        else:
+            self._handlers.pop(channel_or_pattern, None)
+
+    def _call_handlers(self, handlers, reply):
+        for callback, executor in handlers:
+            if executor is None:
+                try:
+                    callback(reply)
+                except Exception as e:
+                    self._handler_error(callback, e)
+            else:
+                self._run_in_executor(executor, callback, reply)
+
+    def _run_in_executor(self, executor, callback, reply):
+        def done(f):
+            if not f.cancelled() and f.exception():
+                self._handler_error(callback, f.exception())
+
+        self._loop.run_in_executor(executor, callback, reply).add_done_callback(done)
+
+    def _handler_error(self, callback, exception):
+        self._handler_errors += 1
+        logger.log(logging.WARNING, 'Pubsub handler %r failed: %r' % (callback, exception))
+
+    def _is_full(self, size=0):
+        """ True when a message of `size` bytes doesn't fit in the buffer anymore. """
+        # (A message which is larger than max_bytes is accepted in an empty buffer.)
+        return bool(self._buffer) and (
+            (self._max_messages is not None and len(self._buffer) >= self._max_messages) or
+            (self._max_bytes is not None and self._buffered_bytes + size > self._max_bytes))
+
+    def _put(self, reply, size):
+        """
+        Called for every received message. Returns a future when the
+        producer has to wait for space before it continues.
+        """
+        if self._handlers:
+            handlers = self._handlers.get(reply.channel if reply.pattern is None else reply.pattern)
+            if handlers:
+                self._call_handlers(handlers, reply)
+                return
+
+        if self._is_full(size):
+            if self._overflow == OverflowPolicy.DROP_NEWEST:
+                self._dropped_messages += 1
+                return
+
+            elif self._overflow == OverflowPolicy.DROP_OLDEST:
+                while self._is_full(size):
+                    self._pop()
+                    self._dropped_messages += 1
+
+            elif self._overflow == OverflowPolicy.DISCONNECT:
+                self._dropped_messages += 1
+                return self._disconnect()
+
+        self._buffer.append((reply, size))
+        self._buffered_bytes += size
+        self._high_water_messages = max(self._high_water_messages, len(self._buffer))
+        self._high_water_bytes = max(self._high_water_bytes, self._buffered_bytes)
+        self._wake_up_getters()
+
+        # BLOCK policy: the buffer is full now, the producer waits.
+        if self._overflow == OverflowPolicy.BLOCK and self._is_full():
+            self._space_f = Future(loop=self._loop)
+            return self._space_f
+
+    def _disconnect(self):
+        """ Called when the buffer is full with the DISCONNECT policy. """
+        raise NotImplementedError
+
+    def _set_exception(self, exception):
+        """ Raise `exception` to the consumers, once the buffer is empty. """
+        self._exception = exception
+        self._wake_up_getters()
+
+    def _wake_up_getters(self):
+        for f in self._getters:
+            if not f.done():
+                f.set_result(None)
+        self._getters = []
+
+    def _pop_sized(self):
+        reply, size = self._buffer.popleft()
+        self._buffered_bytes -= size
+
+        if self._space_f and not self._is_full():
+            if not self._space_f.done():
+                self._space_f.set_result(None)
+            self._space_f = None
+
+        return reply, size
+
+    def _pop(self):
+        return self._pop_sized()[0]
+
+    def _wait_for_message(self):
+        """ Return a future which is done when a message is put in the buffer. """
+        f = Future(loop=self._loop)
+        self._getters.append(f)
+        return f
+
+    @asyncio.coroutine
+    def next_published(self):
+        """
+        Coroutine which waits for next pubsub message to be received and
+        returns it.
+
+        :returns: instance of :class:`PubSubReply <asyncio_redis.replies.PubSubReply>`
+        """
+        while not self._buffer:
+            if self._exception:
+                raise self._exception
+            yield from self._wait_for_message()
+        return self._pop()
+
+    @asyncio.coroutine
+    def next_published_batch(self, max_count=100, max_wait=None):
+        """
+        Coroutine which waits for the next pubsub message to be received, and
+        returns it together with all the messages that are buffered behind
+        it, up to `max_count` messages.
+
+        :param max_count: Maximum number of messages to return.
+        :type max_count: int
+        :param max_wait: (optional) Seconds to wait for more messages after
+                         the first one, as long as the batch is not full.
+        :type max_wait: float
+        :returns: list of :class:`PubSubReply <asyncio_redis.replies.PubSubReply>` instances
+        """
+        batch = [ (yield from self.next_published()) ]
+        self._drain(batch, max_count)
+
+        if max_wait:
+            deadline = self._loop.time() + max_wait
+
+            while len(batch) < max_count and not self._exception:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    yield from asyncio.wait_for(self._wait_for_message(), timeout, loop=self._loop)
+                except asyncio.TimeoutError:
+                    break
+                self._drain(batch, max_count)
+
+        return batch
+
+    def _drain(self, batch, max_count):
+        """ Move buffered messages to `batch`, without waiting. """
+        while len(batch) < max_count and self._buffer:
+            batch.append(self._pop())
+
+    def batches(self, max_count=100, max_wait=None):
+        """
+        Asynchronous iterator (Python 3.5+) which yields the messages in
+        batches, as returned by :func:`next_published_batch`.
+
+        ::
+
+            async for batch in subscription.batches(max_count=500):
+                for reply in batch:
+                    print(reply.value)
+        """
+        return _SubscriptionBatches(self, max_count, max_wait)
+
+    def __aiter__(self):
+        return self.batches()
+
+
+class Subscription(_MessageBuffer):
     """
     Pubsub subscription
     """
-    def __init__(self, protocol):
+    def __init__(self, protocol, max_messages=None, max_bytes=None, overflow=OverflowPolicy.BLOCK):
+        super().__init__(protocol._loop, max_messages=max_messages, max_bytes=max_bytes, overflow=overflow)
         self.protocol = protocol
-        self._messages_queue = Queue(loop=protocol._loop) # Pubsub queue
 
     @wraps(RedisProtocol._subscribe)
     def subscribe(self, channels):
@@ -2398,15 +3917,28 @@ class Subscription:
     def punsubscribe(self, patterns):
         return self.protocol._punsubscribe(self, patterns)
 
-    @asyncio.coroutine
-    def next_published(self):
-        """
-        Coroutine which waits for next pubsub message to be received and
-        returns it.
+    def _disconnect(self):
+        if self.protocol.transport:
+            logger.log(logging.WARNING, 'Pubsub buffer full, closing connection.')
+            self.protocol.transport.close()
 
-        :returns: instance of :class:`PubSubReply <asyncio_redis.replies.PubSubReply>`
-        """
-        return (yield from self._messages_queue.get())
+        # Don't parse anything anymore until the connection is lost.
+        return Future(loop=self._loop)
+
+
+class _SubscriptionBatches:
+    """ Asynchronous iterator returned by :func:`Subscription.batches <asyncio_redis.Subscription.batches>`. """
+    def __init__(self, subscription, max_count, max_wait):
+        self._subscription = subscription
+        self._max_count = max_count
+        self._max_wait = max_wait
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        return (yield from self._subscription.next_published_batch(self._max_count, self._max_wait))
 
 
 class HiRedisProtocol(RedisProtocol, metaclass=_RedisProtocolMeta):
@@ -2421,13 +3953,14 @@ class HiRedisProtocol(RedisProtocol, metaclass=_RedisProtocolMeta):
     """
     def __init__(self, *, password=None, db=0, encoder=None,
                  connection_lost_callback=None, enable_typechecking=True,
-                 loop=None):
+                 loop=None, client_name=None):
         super().__init__(password=password,
                          db=db,
                          encoder=encoder,
                          connection_lost_callback=connection_lost_callback,
                          enable_typechecking=enable_typechecking,
-                         loop=loop)
+                         loop=loop,
+                         client_name=client_name)
         self._hiredis = None
         assert hiredis, "`hiredis` libary not available. Please don't use HiRedisProtocol."
 
@@ -2442,10 +3975,24 @@ class HiRedisProtocol(RedisProtocol, metaclass=_RedisProtocolMeta):
         while True:
             item = self._hiredis.gets()
 
-            if item is not False:
-                self._process_hiredis_item(item, self._push_answer)
-            else:
+            if item is False:
                 break
+            elif self._in_pubsub and isinstance(item, list):
+                space_f = self._handle_pubsub_message(item)
+
+                # The subscription is full, and blocks. Leave the rest in the
+                # parser and stop reading until there is space again.
+                if space_f:
+                    self.transport.pause_reading()
+                    space_f.add_done_callback(self._resume_reading)
+                    return
+            else:
+                self._process_hiredis_item(item, self._push_answer)
+
+    def _resume_reading(self, f):
+        if self.transport:
+            self.transport.resume_reading()
+            self.data_received(b'')
 
     def _process_hiredis_item(self, item, cb):
         if isinstance(item, (bytes, int)):
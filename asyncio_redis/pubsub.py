@@ -0,0 +1,301 @@
+from .connection import Connection
+from .exceptions import Error
+from .log import logger
+from .protocol import OverflowPolicy, _MessageBuffer
+
+import asyncio
+import logging
+import zlib
+
+
+__all__ = ('HubSubscription', 'PubSubHub')
+
+
+class PubSubHub:
+    """
+    Shares a few subscriber connections between any number of local
+    subscriptions.
+
+    Every local :class:`HubSubscription` has its own bounded buffer. Channels
+    and patterns are reference counted: ``SUBSCRIBE`` and ``PSUBSCRIBE`` are
+    only sent for the first local subscriber, ``UNSUBSCRIBE`` and
+    ``PUNSUBSCRIBE`` when the last one leaves. With more than one connection,
+    the channels and patterns are spread over the connections by a hash of
+    their name.
+
+    Received messages are fanned out through an index which maps channels
+    and patterns to the local subscriptions. (Redis tells with every
+    ``pmessage`` which pattern matched, so the hub doesn't need to match
+    patterns itself.)
+
+    ::
+
+        hub = yield from pool.get_pubsub_hub()
+        subscription = yield from hub.start_subscribe(max_messages=1000, overflow=OverflowPolicy.DROP_OLDEST)
+        yield from subscription.subscribe(['our-channel'])
+
+        reply = yield from subscription.next_published()
+        subscription.close()
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, host='localhost', port=6379, *, connections=1, max_buffered=1000, loop=None, **kwargs):
+        """
+        :param host: Address, either host or unix domain socket path
+        :type host: str
+        :param port: TCP port. If port is 0 then host assumed to be unix socket path
+        :type port: int
+        :param connections: Number of subscriber connections.
+        :type connections: int
+        :param max_buffered: Number of messages that are buffered for every
+                             connection, before reading from it is paused.
+                             (This happens when a local subscription with the
+                             ``BLOCK`` overflow policy is full.)
+        :type max_buffered: int
+        :param loop: (optional) asyncio event loop.
+
+        All other keyword arguments (``password``, ``encoder``, ...) are
+        passed to :func:`Connection.create <asyncio_redis.Connection.create>`.
+        """
+        self = cls()
+        self._loop = loop or asyncio.get_event_loop()
+        self._connections = []
+        self._subscriptions = [] # The subscription of every connection.
+        self._dispatch_tasks = []
+        self._local_subscriptions = set()
+        self._last_send_f = None # Last (un)subscribe task.
+
+        # Index: maps channel and pattern names to sets of HubSubscription.
+        self._channels = {}
+        self._patterns = {}
+
+        for i in range(connections):
+            connection = yield from Connection.create(host=host, port=port, loop=self._loop, **kwargs)
+            subscription = yield from connection.start_subscribe(max_messages=max_buffered)
+
+            self._connections.append(connection)
+            self._subscriptions.append(subscription)
+            self._dispatch_tasks.append(asyncio.async(self._dispatch(subscription), loop=self._loop))
+
+        return self
+
+    def __repr__(self):
+        return 'PubSubHub(connections=%r, channels=%r, patterns=%r)' % (
+                len(self._connections), len(self._channels), len(self._patterns))
+
+    @property
+    def channels(self):
+        """ Dictionary which maps the subscribed channels to their number of local subscriptions. """
+        return { name: len(subscriptions) for name, subscriptions in self._channels.items() }
+
+    @property
+    def patterns(self):
+        """ Dictionary which maps the subscribed patterns to their number of local subscriptions. """
+        return { name: len(subscriptions) for name, subscriptions in self._patterns.items() }
+
+    @asyncio.coroutine
+    def start_subscribe(self, *, max_messages=None, max_bytes=None, overflow=OverflowPolicy.BLOCK):
+        """
+        Create a local subscription. The buffer options are the same as for
+        :func:`RedisProtocol.start_subscribe <asyncio_redis.RedisProtocol.start_subscribe>`.
+        (``BLOCK`` stalls the connection that delivers the message, so also
+        the other subscriptions which are served by it. ``DISCONNECT`` closes
+        the local subscription.)
+
+        :returns: :class:`HubSubscription`
+        """
+        if overflow not in (OverflowPolicy.BLOCK, OverflowPolicy.DROP_OLDEST,
+                            OverflowPolicy.DROP_NEWEST, OverflowPolicy.DISCONNECT):
+            raise Error('Unknown overflow policy: %r' % overflow)
+
+        subscription = HubSubscription(self, max_messages=max_messages, max_bytes=max_bytes, overflow=overflow)
+        self._local_subscriptions.add(subscription)
+        return subscription
+
+    def _get_subscription(self, name):
+        """ Return the subscription of the connection that serves this channel or pattern. """
+        subscriptions = self._subscriptions
+        if len(subscriptions) == 1:
+            return subscriptions[0]
+
+        key = subscriptions[0].protocol.encode_from_native(name)
+        return subscriptions[zlib.crc32(key) % len(subscriptions)]
+
+    def _add(self, index, subscription, names):
+        """ Add references. Return the names that were not subscribed yet. """
+        new = []
+        for name in names:
+            subscriptions = index.setdefault(name, set())
+            if not subscriptions:
+                new.append(name)
+            subscriptions.add(subscription)
+        return new
+
+    def _remove(self, index, subscription, names):
+        """ Remove references. Return the names without local subscriptions. """
+        gone = []
+        for name in names:
+            subscriptions = index.get(name)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del index[name]
+                    gone.append(name)
+        return gone
+
+    def _send(self, method, names):
+        """
+        Send `method` (``subscribe``, ``unsubscribe``, ...) for these names,
+        after the commands that were sent before, so that they arrive in the
+        order of the changes to the index. Returns a future.
+        """
+        if not names:
+            f = asyncio.Future(loop=self._loop)
+            f.set_result(None)
+            return f
+
+        previous = self._last_send_f
+        f = asyncio.async(self._send_after(previous, method, names), loop=self._loop)
+        f.add_done_callback(self._send_done)
+        self._last_send_f = f
+
+        # (Shield, so that a caller that gets cancelled doesn't leave the
+        # subscriptions on the server and the index out of sync.)
+        return asyncio.shield(f, loop=self._loop)
+
+    @asyncio.coroutine
+    def _send_after(self, previous, method, names):
+        if previous:
+            yield from asyncio.wait([previous], loop=self._loop)
+
+        # Group by connection.
+        groups = {}
+        for name in names:
+            groups.setdefault(self._get_subscription(name), []).append(name)
+
+        for subscription, group in groups.items():
+            yield from getattr(subscription, method)(group)
+
+    def _send_done(self, f):
+        if not f.cancelled() and f.exception():
+            logger.log(logging.WARNING, 'Pubsub hub subscription change failed: %r' % f.exception())
+
+    def _close_subscription(self, subscription):
+        self._local_subscriptions.discard(subscription)
+
+        for method, index, names in [('unsubscribe', self._channels, subscription._channel_names),
+                                     ('punsubscribe', self._patterns, subscription._pattern_names)]:
+            gone = self._remove(index, subscription, names)
+            if gone:
+                self._send(method, gone)
+
+    @asyncio.coroutine
+    def _dispatch(self, subscription):
+        """
+        Fan out the messages of one connection to the local subscriptions.
+        """
+        while True:
+            while not subscription._buffer:
+                yield from subscription._wait_for_message()
+
+            while subscription._buffer:
+                reply, size = subscription._pop_sized()
+
+                if reply.pattern is None:
+                    local_subscriptions = self._channels.get(reply.channel)
+                else:
+                    local_subscriptions = self._patterns.get(reply.pattern)
+
+                # (Copy, the set changes when a subscription gets closed.)
+                for s in tuple(local_subscriptions or ()):
+                    space_f = s._put(reply, size)
+
+                    # BLOCK policy: wait until this subscription has space.
+                    if space_f:
+                        yield from space_f
+
+    def close(self):
+        """
+        Close all the local subscriptions and the connections.
+        """
+        for subscription in list(self._local_subscriptions):
+            subscription._closed = True
+            subscription._set_exception(Error('Pubsub hub closed.'))
+
+        for task in self._dispatch_tasks:
+            task.cancel()
+
+        for connection in self._connections:
+            connection.close()
+
+        self._local_subscriptions = set()
+        self._channels = {}
+        self._patterns = {}
+        self._connections = []
+        self._subscriptions = []
+        self._dispatch_tasks = []
+
+
+class HubSubscription(_MessageBuffer):
+    """
+    Local subscription of a :class:`PubSubHub`. Messages are received like
+    from a :class:`~asyncio_redis.Subscription`.
+    """
+    def __init__(self, hub, max_messages=None, max_bytes=None, overflow=OverflowPolicy.BLOCK):
+        super().__init__(hub._loop, max_messages=max_messages, max_bytes=max_bytes, overflow=overflow)
+        self.hub = hub
+        self._channel_names = set()
+        self._pattern_names = set()
+        self._closed = False
+
+    def __repr__(self):
+        return 'HubSubscription(channels=%r, patterns=%r)' % (sorted(self._channel_names), sorted(self._pattern_names))
+
+    def _check_closed(self):
+        if self._closed:
+            raise Error('Subscription is closed.')
+
+    @asyncio.coroutine
+    def subscribe(self, channels):
+        """ Listen for messages published to the given channels """
+        self._check_closed()
+        channels = [ c for c in channels if c not in self._channel_names ]
+        self._channel_names |= set(channels)
+        yield from self.hub._send('subscribe', self.hub._add(self.hub._channels, self, channels))
+
+    @asyncio.coroutine
+    def unsubscribe(self, channels):
+        """ Stop listening for messages posted to the given channels """
+        self._check_closed()
+        self._channel_names -= set(channels)
+        yield from self.hub._send('unsubscribe', self.hub._remove(self.hub._channels, self, channels))
+
+    @asyncio.coroutine
+    def psubscribe(self, patterns):
+        """ Listen for messages published to channels matching the given patterns """
+        self._check_closed()
+        patterns = [ p for p in patterns if p not in self._pattern_names ]
+        self._pattern_names |= set(patterns)
+        yield from self.hub._send('psubscribe', self.hub._add(self.hub._patterns, self, patterns))
+
+    @asyncio.coroutine
+    def punsubscribe(self, patterns):
+        """ Stop listening for messages posted to channels matching the given patterns """
+        self._check_closed()
+        self._pattern_names -= set(patterns)
+        yield from self.hub._send('punsubscribe', self.hub._remove(self.hub._patterns, self, patterns))
+
+    def _disconnect(self):
+        logger.log(logging.WARNING, 'Pubsub hub subscription buffer full, closing it.')
+        self.close()
+
+    def close(self):
+        """
+        Stop listening to all channels and patterns. Messages that are still
+        buffered can be consumed; after that, ``next_published`` raises
+        :class:`~asyncio_redis.exceptions.Error`.
+        """
+        if not self._closed:
+            self._closed = True
+            self.hub._close_subscription(self)
+            self._set_exception(Error('Subscription is closed.'))
@@ -0,0 +1,284 @@
+from .exceptions import Error, ErrorReply, TimeoutError
+from .log import logger
+
+import asyncio
+import logging
+import time
+
+
+__all__ = ('QueueConsumer', )
+
+
+# Remove a job from the processing list after it was handled.
+# KEYS: processing list, deadlines, attempts. ARGV: job.
+_ACK_SCRIPT = """
+redis.call('lrem', KEYS[1], 1, ARGV[1])
+redis.call('zrem', KEYS[2], ARGV[1])
+redis.call('hdel', KEYS[3], ARGV[1])
+"""
+
+# Move a job from the processing list back to the queue, or to the failed
+# list after too many attempts. Returns 0 when the job was not in the
+# processing list anymore, 1 when it was requeued, 2 when it failed.
+# KEYS: processing list, deadlines, attempts, queue, failed list.
+# ARGV: job, max attempts.
+_NACK_SCRIPT = """
+redis.call('zrem', KEYS[2], ARGV[1])
+if redis.call('lrem', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('hincrby', KEYS[3], ARGV[1], 1) >= tonumber(ARGV[2]) then
+    redis.call('hdel', KEYS[3], ARGV[1])
+    redis.call('lpush', KEYS[5], ARGV[1])
+    return 2
+end
+redis.call('lpush', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Like NACK, but only when the deadline of the job has passed.
+# ARGV: job, max attempts, current time.
+_RECOVER_SCRIPT = """
+local deadline = redis.call('zscore', KEYS[2], ARGV[1])
+if not deadline or tonumber(deadline) > tonumber(ARGV[3]) then
+    return 0
+end
+""" + _NACK_SCRIPT
+
+
+class QueueConsumer:
+    """
+    Reliable consumer for a work queue in a Redis list. Producers add jobs
+    with ``lpush``.
+
+    Every job is moved atomically from the queue to a processing list with
+    ``BRPOPLPUSH``, and gets a deadline. When the handler returns, the job is
+    acknowledged: it's removed from the processing list. When the handler
+    raises, the job goes back to the queue, or, after `max_attempts`, to the
+    failed list.
+
+    Every `check_interval` seconds, the deadlines of the jobs that are being
+    handled are extended, and jobs of other consumers that are past their
+    deadline (because the consumer crashed) are moved back to the queue.
+
+    The blocking calls run on the connections of `pool` for blocking commands,
+    so they don't take the connections for other commands.
+
+    The keys ``<queue>:processing``, ``<queue>:deadlines``,
+    ``<queue>:attempts`` and ``<queue>:failed`` are used for the bookkeeping.
+    Jobs are identified by their payload, so jobs with the same payload share
+    their deadline and number of attempts. Make them unique, for instance
+    by including an ID.
+
+    ::
+
+        @asyncio.coroutine
+        def handle(job):
+            print('Processing', job)
+
+        consumer = yield from QueueConsumer.create(pool, 'jobs', handle, concurrency=10)
+        ...
+        yield from consumer.stop()
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, pool, queue, handler, *, concurrency=1, visibility_timeout=60,
+               max_attempts=3, poll_timeout=1, check_interval=10, loop=None):
+        """
+        Create a consumer, and start handling jobs.
+
+        :param pool: Pool for fetching, acknowledging and recovering jobs.
+        :type pool: :class:`~asyncio_redis.Pool`
+        :param queue: Name of the list with the jobs.
+        :type queue: Native Python type as defined by the ``encoder`` parameter
+        :param handler: Coroutine function which is called with every job.
+        :param concurrency: Number of jobs that are handled at the same time.
+        :type concurrency: int
+        :param visibility_timeout: Seconds after which a job of a crashed consumer is handled again.
+        :type visibility_timeout: float
+        :param max_attempts: Number of times a job is handled, before it is moved to the failed list.
+        :type max_attempts: int
+        :param poll_timeout: Timeout of every ``BRPOPLPUSH`` in seconds. (Stopping takes this long at most.)
+        :type poll_timeout: int
+        :param check_interval: Seconds between checks for stalled jobs.
+        :type check_interval: float
+        :param loop: (optional) asyncio event loop.
+        """
+        self = cls()
+        self._pool = pool
+        self._queue = queue
+        self._handler = handler
+        self._visibility_timeout = visibility_timeout
+        self._max_attempts = max_attempts
+        self._poll_timeout = poll_timeout
+        self._check_interval = check_interval
+        self._loop = loop or asyncio.get_event_loop()
+
+        def key(suffix):
+            return queue + (suffix.encode('ascii') if isinstance(queue, bytes) else suffix)
+
+        self._processing = key(':processing')
+        self._deadlines = key(':deadlines')
+        self._attempts = key(':attempts')
+        self._failed_list = key(':failed')
+
+        self._in_flight = set() # Jobs that are being handled by this consumer.
+        self._running = True
+
+        # Metrics.
+        self._start_time = self._loop.time()
+        self._processed = 0
+        self._failed = 0
+        self._recovered = 0
+        self._total_latency = 0
+        self._max_latency = 0
+
+        self._ack_script = yield from pool.register_script(_ACK_SCRIPT)
+        self._nack_script = yield from pool.register_script(_NACK_SCRIPT)
+        self._recover_script = yield from pool.register_script(_RECOVER_SCRIPT)
+
+        self._workers = [ asyncio.async(self._work(), loop=self._loop) for i in range(concurrency) ]
+        self._monitor_task = asyncio.async(self._monitor(), loop=self._loop)
+        return self
+
+    def __repr__(self):
+        return 'QueueConsumer(queue=%r, concurrency=%r)' % (self._queue, len(self._workers))
+
+    @property
+    def in_flight(self):
+        """ Number of jobs that are being handled. """
+        return len(self._in_flight)
+
+    @property
+    def processed(self):
+        """ Number of jobs that were handled successfully. """
+        return self._processed
+
+    @property
+    def failed(self):
+        """ Number of times a handler raised an exception. """
+        return self._failed
+
+    @property
+    def recovered(self):
+        """ Number of stalled jobs that were moved back to the queue. """
+        return self._recovered
+
+    @property
+    def throughput(self):
+        """ Successfully handled jobs per second, since the start. """
+        duration = self._loop.time() - self._start_time
+        return self._processed / duration if duration else 0.
+
+    @property
+    def average_latency(self):
+        """ Average time in seconds that the handler took for a successful job. """
+        return self._total_latency / self._processed if self._processed else 0.
+
+    @property
+    def max_latency(self):
+        """ Longest time in seconds that the handler took for a successful job. """
+        return self._max_latency
+
+    @asyncio.coroutine
+    def _work(self):
+        while self._running:
+            try:
+                job = yield from self._pool.brpoplpush(self._queue, self._processing, self._poll_timeout)
+            except TimeoutError:
+                continue
+            except (OSError, Error, ErrorReply) as e:
+                logger.log(logging.WARNING, 'Fetching job from %r failed: %r' % (self._queue, e))
+                yield from asyncio.sleep(self._poll_timeout, loop=self._loop)
+                continue
+
+            yield from self._process(job)
+
+    @asyncio.coroutine
+    def _process(self, job):
+        self._in_flight.add(job)
+        try:
+            yield from self._pool.zadd(self._deadlines, { job: time.time() + self._visibility_timeout })
+
+            start = self._loop.time()
+            try:
+                yield from self._handler(job)
+            except Exception as e:
+                self._failed += 1
+                logger.log(logging.WARNING, 'Job %r failed: %r' % (job, e))
+                yield from self._nack_script.run(
+                        keys=[ self._processing, self._deadlines, self._attempts, self._queue, self._failed_list ],
+                        args=[ job, str(self._max_attempts) ])
+            else:
+                latency = self._loop.time() - start
+                self._processed += 1
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+
+                yield from self._ack_script.run(keys=[ self._processing, self._deadlines, self._attempts ], args=[ job ])
+
+        except (OSError, Error, ErrorReply) as e:
+            # The job stays in the processing list, and is recovered after its deadline.
+            logger.log(logging.WARNING, 'Acknowledging job %r failed: %r' % (job, e))
+        finally:
+            self._in_flight.discard(job)
+
+    @asyncio.coroutine
+    def _monitor(self):
+        while True:
+            yield from asyncio.sleep(self._check_interval, loop=self._loop)
+            try:
+                yield from self.recover_stalled_jobs()
+            except (OSError, Error, ErrorReply) as e:
+                logger.log(logging.WARNING, 'Recovering stalled jobs of %r failed: %r' % (self._queue, e))
+
+    @asyncio.coroutine
+    def recover_stalled_jobs(self):
+        """
+        Extend the deadlines of the jobs that are being handled, and move
+        jobs of other consumers that are past their deadline back to the
+        queue. (This runs every `check_interval` seconds.)
+
+        Returns the number of recovered jobs.
+        """
+        now = time.time()
+
+        if self._in_flight:
+            yield from self._pool.zadd(self._deadlines, { job: now + self._visibility_timeout for job in self._in_flight })
+
+        jobs = yield from self._pool.lrange_aslist(self._processing)
+        jobs = list(set(jobs) - self._in_flight)
+
+        # Pipeline the ZSCORE commands.
+        deadlines = yield from asyncio.gather(* [ self._pool.zscore(self._deadlines, job) for job in jobs ],
+                                              loop=self._loop)
+
+        # Taken by a consumer that crashed before setting the deadline, or
+        # just now.
+        missing = { job: now + self._visibility_timeout for job, deadline in zip(jobs, deadlines) if deadline is None }
+        if missing:
+            yield from self._pool.zadd(self._deadlines, missing)
+
+        stalled = [ job for job, deadline in zip(jobs, deadlines) if deadline is not None and deadline < now ]
+        replies = yield from asyncio.gather(* [ self._recover_script.run(
+                        keys=[ self._processing, self._deadlines, self._attempts, self._queue, self._failed_list ],
+                        args=[ job, str(self._max_attempts), repr(now) ]) for job in stalled ], loop=self._loop)
+
+        recovered = 0
+        for job, reply in zip(stalled, replies):
+            if (yield from reply.return_value()):
+                logger.log(logging.INFO, 'Recovered stalled job %r' % (job, ))
+                recovered += 1
+
+        self._recovered += recovered
+        return recovered
+
+    @asyncio.coroutine
+    def stop(self):
+        """
+        Stop taking new jobs, and wait for the jobs that are being handled.
+        """
+        self._running = False
+        self._monitor_task.cancel()
+
+        yield from asyncio.wait(self._workers, loop=self._loop)
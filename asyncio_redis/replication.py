@@ -0,0 +1,283 @@
+from .encoders import UTF8Encoder
+from .exceptions import Error, ErrorReply, NoAvailableConnectionsInPoolError
+from .log import logger
+from .pool import Pool
+from .protocol import RedisProtocol, Script, _all_commands, _blocking_commands, _read_only_commands
+
+from functools import wraps
+import asyncio
+import logging
+
+
+__all__ = ('ReadPolicy', 'ReadYourWrites', 'ReplicaPool')
+
+
+# Commands that are passed to the primary as-is, even when a WAIT or ROLE
+# should follow writes. (Pipelining one of those after MULTI or SUBSCRIBE
+# would end up in the transaction or fail.) Blocking commands are passed
+# as-is too: they run on the connections of the pool for blocking commands,
+# and a check behind them would wait until they return.
+_UNCHECKED_COMMANDS = ('multi', 'watch', 'start_subscribe', 'wait', 'role')
+
+
+class ReadPolicy:
+    """
+    How :class:`ReplicaPool` chooses a replica for read-only commands.
+    """
+    #: Take the healthy replicas in turn.
+    ROUND_ROBIN = 'round_robin'
+
+    #: Take the healthy replica with the lowest measured ``PING`` latency.
+    LOWEST_LATENCY = 'lowest_latency'
+
+    #: Like ``ROUND_ROBIN``, but read from the primary when no replica is healthy.
+    PRIMARY_FALLBACK = 'primary_fallback'
+
+
+class ReadYourWrites:
+    """
+    Consistency modes of :class:`ReplicaPool` for reads that follow writes.
+    """
+    #: No guarantee. Replicas can lag behind the primary.
+    NONE = None
+
+    #: Send ``WAIT`` after every write on the same connection, so that the
+    #: write returns after it has been acknowledged by the replicas.
+    WAIT = 'wait'
+
+    #: Send ``ROLE`` after every write to record the replication offset of the
+    #: primary. Reads go only to replicas that reached this offset, or to the
+    #: primary when none did.
+    OFFSET = 'offset'
+
+
+class ReplicaPool:
+    """
+    Connection pool for a primary with any number of replicas. Keeps a
+    :class:`~asyncio_redis.Pool` for every node.
+
+    Read-only commands (``get``, ``hgetall``, ``lrange``, ``smembers``,
+    ``scan``, ...) go to a replica, chosen according to the
+    :class:`ReadPolicy`. All other commands, transactions and pubsub go to the
+    primary.
+
+    A background task pings the replicas every `monitor_interval` seconds to
+    measure their latency and, in ``ReadYourWrites.OFFSET`` mode, their
+    replication offset. Replicas which don't answer are skipped until they
+    answer again.
+
+    ::
+
+        pool = yield from ReplicaPool.create(
+                primary=('redis-primary', 6379),
+                replicas=[ ('redis-replica1', 6379), ('redis-replica2', 6379) ],
+                read_policy=ReadPolicy.LOWEST_LATENCY, poolsize=10)
+        yield from pool.set('key', 'value') # To the primary.
+        result = yield from pool.get('key') # To a replica.
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, primary, replicas, *, read_policy=ReadPolicy.ROUND_ROBIN,
+               read_your_writes=ReadYourWrites.NONE, wait_replicas=1, wait_timeout=100,
+               monitor_interval=1., encoder=None, loop=None, **kwargs):
+        """
+        Create a new primary/replica connection pool instance.
+
+        :param primary: ``(host, port)`` tuple of the primary.
+        :type primary: tuple
+        :param replicas: List of ``(host, port)`` tuples of the replicas.
+        :type replicas: list
+        :param read_policy: One of the :class:`ReadPolicy` constants.
+        :param read_your_writes: One of the :class:`ReadYourWrites` constants.
+        :param wait_replicas: In ``WAIT`` mode, the number of replicas that have to acknowledge a write.
+        :type wait_replicas: int
+        :param wait_timeout: In ``WAIT`` mode, the maximum time in milliseconds to wait for the replicas.
+        :type wait_timeout: int
+        :param monitor_interval: Seconds between health checks of the replicas.
+        :type monitor_interval: float
+        :param encoder: Encoder to use for encoding to or decoding from redis bytes to a native type.
+        :type encoder: :class:`~asyncio_redis.encoders.BaseEncoder` instance.
+        :param loop: (optional) asyncio event loop.
+
+        All other keyword arguments (``password``, ``poolsize``, ...) are
+        passed to :func:`Pool.create <asyncio_redis.Pool.create>` for every
+        node.
+        """
+        if read_policy not in (ReadPolicy.ROUND_ROBIN, ReadPolicy.LOWEST_LATENCY, ReadPolicy.PRIMARY_FALLBACK):
+            raise Error('Unknown read policy: %r' % read_policy)
+        if read_your_writes not in (ReadYourWrites.NONE, ReadYourWrites.WAIT, ReadYourWrites.OFFSET):
+            raise Error('Unknown read-your-writes mode: %r' % read_your_writes)
+
+        self = cls()
+        self._encoder = encoder or UTF8Encoder()
+        self._loop = loop or asyncio.get_event_loop()
+        self._read_policy = read_policy
+        self._read_your_writes = read_your_writes
+        self._wait_replicas = wait_replicas
+        self._wait_timeout = wait_timeout
+        self._monitor_interval = monitor_interval
+
+        def create_pool(host, port):
+            return Pool.create(host=host, port=port, encoder=self._encoder, loop=self._loop, **kwargs)
+
+        self._primary = yield from create_pool(*primary)
+        self._replicas = {} # Maps 'host:port' to Pool.
+        self._latencies = {} # Maps 'host:port' to the last PING time, or None when unhealthy.
+        self._offsets = {} # Maps 'host:port' to the last known replication offset.
+        self._write_offset = 0 # Replication offset of the primary after our last write.
+        self._counter = 0
+
+        for host, port in replicas:
+            name = '%s:%s' % (host, port)
+            self._replicas[name] = yield from create_pool(host, port)
+            self._latencies[name] = None
+            self._offsets[name] = 0
+
+        yield from self._check_replicas()
+        self._monitor_task = asyncio.async(self._monitor(), loop=self._loop)
+        return self
+
+    def __repr__(self):
+        return 'ReplicaPool(primary=%r, replicas=%r, read_policy=%r)' % (
+                self._primary, sorted(self._replicas), self._read_policy)
+
+    @property
+    def primary(self):
+        """ :class:`~asyncio_redis.Pool` of the primary. """
+        return self._primary
+
+    @property
+    def replicas(self):
+        """ Dictionary which maps replica names to :class:`~asyncio_redis.Pool` instances. """
+        return dict(self._replicas)
+
+    @property
+    def healthy_replicas(self):
+        """ Names of the replicas that answered the last health check. """
+        return sorted(name for name, latency in self._latencies.items() if latency is not None)
+
+    @asyncio.coroutine
+    def _monitor(self):
+        while True:
+            yield from asyncio.sleep(self._monitor_interval, loop=self._loop)
+            yield from self._check_replicas()
+
+    @asyncio.coroutine
+    def _check_replicas(self):
+        """
+        Measure the latency (and the offset) of all replicas concurrently.
+        """
+        names = list(self._replicas)
+        yield from asyncio.gather(*[ self._check_replica(name) for name in names ], loop=self._loop)
+
+    @asyncio.coroutine
+    def _check_replica(self, name):
+        pool = self._replicas[name]
+        try:
+            start = self._loop.time()
+            yield from pool.ping()
+            latency = self._loop.time() - start
+
+            if self._read_your_writes == ReadYourWrites.OFFSET:
+                reply = yield from pool.role()
+                self._offsets[name] = reply.offset
+
+            self._latencies[name] = latency
+        except (OSError, Error, ErrorReply) as e:
+            if self._latencies[name] is not None:
+                logger.log(logging.WARNING, 'Replica %s is unhealthy: %r' % (name, e))
+            self._latencies[name] = None
+
+    def _get_read_pool(self):
+        """
+        Choose the pool for a read-only command.
+        """
+        candidates = self.healthy_replicas
+
+        if self._read_your_writes == ReadYourWrites.OFFSET:
+            caught_up = [ name for name in candidates if self._offsets[name] >= self._write_offset ]
+
+            # None of the replicas has seen our last write yet, the primary has.
+            if candidates and not caught_up:
+                return self._primary
+            candidates = caught_up
+
+        if not candidates:
+            if self._read_policy == ReadPolicy.PRIMARY_FALLBACK:
+                return self._primary
+            raise NoAvailableConnectionsInPoolError('No healthy replicas: %r' % sorted(self._replicas))
+
+        if self._read_policy == ReadPolicy.LOWEST_LATENCY:
+            name = min(candidates, key=lambda name: self._latencies[name])
+        else:
+            self._counter += 1
+            name = candidates[self._counter % len(candidates)]
+
+        return self._replicas[name]
+
+    @asyncio.coroutine
+    def _execute_write(self, name, a, kw):
+        """
+        Run write command on the primary, followed by ``WAIT`` or ``ROLE`` on
+        the same connection.
+        """
+        if self._read_your_writes == ReadYourWrites.WAIT:
+            check = ('wait', (self._wait_replicas, self._wait_timeout), {})
+        else:
+            check = ('role', (), {})
+
+        result, check = yield from self._primary.pipelined((name, a, kw), check)
+
+        if isinstance(result, BaseException):
+            raise result
+
+        if isinstance(check, BaseException):
+            # The write succeeded, so don't hide its result.
+            logger.log(logging.WARNING, 'Checking the replication of a write failed: %r' % check)
+
+        elif self._read_your_writes == ReadYourWrites.WAIT:
+            if check < self._wait_replicas:
+                logger.log(logging.WARNING, 'Write acknowledged by %i of %i replicas.' % (
+                                check, self._wait_replicas))
+        else:
+            self._write_offset = max(self._write_offset, check.offset)
+
+        return result
+
+    def __getattr__(self, name):
+        """
+        Proxy read-only commands to a replica and everything else to the primary.
+        """
+        if name in _read_only_commands:
+            return getattr(self._get_read_pool(), name)
+
+        if (self._read_your_writes != ReadYourWrites.NONE and name in _all_commands and
+                name not in _UNCHECKED_COMMANDS and name not in _blocking_commands):
+            @wraps(getattr(RedisProtocol, name))
+            def call(*a, **kw):
+                return self._execute_write(name, a, kw)
+            return call
+
+        return getattr(self._primary, name)
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.register_script)
+    def register_script(self, script:str) -> Script:
+        # Load the script on the replicas as well, they take over when the primary fails.
+        for pool in list(self._replicas.values()):
+            yield from pool.register_script(script)
+
+        result = yield from self._primary.register_script(script)
+        return Script(result.sha, script, lambda: self.evalsha, lambda: self.eval, lambda: self.evalsha_many)
+
+    def close(self):
+        """
+        Stop the health checks and close all the connections to all the nodes.
+        """
+        self._monitor_task.cancel()
+        self._primary.close()
+
+        for pool in self._replicas.values():
+            pool.close()
+
+        self._replicas = {}
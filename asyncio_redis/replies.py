@@ -3,11 +3,17 @@ from asyncio.tasks import gather
 
 __all__ = (
     'BlockingPopReply',
+    'BulkLoadReply',
+    'ClusterSlotsReply',
     'DictReply',
     'ListReply',
     'PubSubReply',
+    'RoleReply',
     'SetReply',
     'StatusReply',
+    'StreamEntriesReply',
+    'StreamsReply',
+    'TransactionReply',
     'ZRangeReply',
     'ConfigPairReply',
     'InfoReply',
@@ -199,6 +205,179 @@ class ClientListReply:
         self._data = data # TODO: implement parser logic
 
 
+class ClusterSlotsReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.cluster_slots` reply.
+
+    ``slots`` is a list of ``(start, end, master, replicas)`` tuples, where
+    ``master`` is a ``(host, port)`` tuple and ``replicas`` a list of those.
+    """
+    def __init__(self, slots):
+        self._slots = slots
+
+    @property
+    def slots(self):
+        """ List of slot ranges. """
+        return self._slots
+
+    def __repr__(self):
+        return 'ClusterSlotsReply(slots=%r)' % (self.slots, )
+
+
+class StreamEntriesReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.xrange` and
+    :func:`~asyncio_redis.RedisProtocol.xclaim` reply.
+
+    ``entries`` is a list of ``(id, fields)`` tuples, where ``fields`` is a
+    dictionary. (None for entries that were deleted.)
+    """
+    def __init__(self, entries):
+        self._entries = entries
+
+    @property
+    def entries(self):
+        """ List of ``(id, fields)`` tuples. """
+        return self._entries
+
+    def __repr__(self):
+        return 'StreamEntriesReply(entries=%r)' % (self.entries, )
+
+
+class StreamsReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.xread` and
+    :func:`~asyncio_redis.RedisProtocol.xreadgroup` reply.
+
+    ``streams`` is a dictionary which maps the stream names to lists of
+    ``(id, fields)`` tuples. (Empty when the command timed out.)
+    """
+    def __init__(self, streams):
+        self._streams = streams
+
+    @property
+    def streams(self):
+        """ Dictionary which maps stream names to their entries. """
+        return self._streams
+
+    def __repr__(self):
+        return 'StreamsReply(streams=%r)' % (self.streams, )
+
+
+class RoleReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.role` reply.
+    """
+    def __init__(self, role, *, offset=None, master=None, state=None,
+                 replicas=(), master_names=()):
+        self._role = role
+        self._offset = offset
+        self._master = master
+        self._state = state
+        self._replicas = list(replicas)
+        self._master_names = list(master_names)
+
+    @property
+    def role(self):
+        """ 'master', 'slave' or 'sentinel'. """
+        return self._role
+
+    @property
+    def offset(self):
+        """ Replication offset of this node. (Not for sentinels.) """
+        return self._offset
+
+    @property
+    def master(self):
+        """ For replicas: ``(host, port)`` tuple of the master. """
+        return self._master
+
+    @property
+    def state(self):
+        """ For replicas: state of the replication link, e.g. 'connected'. """
+        return self._state
+
+    @property
+    def replicas(self):
+        """ For masters: list of ``(host, port, offset)`` tuples. """
+        return self._replicas
+
+    @property
+    def master_names(self):
+        """ For sentinels: names of the monitored masters. """
+        return self._master_names
+
+    def __repr__(self):
+        return 'RoleReply(role=%r, offset=%r)' % (self.role, self.offset)
+
+
+class BulkLoadReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.bulk_load` reply.
+    """
+    def __init__(self, commands, errors, first_error, duration):
+        self._commands = commands
+        self._errors = errors
+        self._first_error = first_error
+        self._duration = duration
+
+    @property
+    def commands(self):
+        """ Number of commands that were sent. """
+        return self._commands
+
+    @property
+    def errors(self):
+        """ Number of commands that returned an error. """
+        return self._errors
+
+    @property
+    def first_error(self):
+        """ ErrorReply of the first command that failed, or None. """
+        return self._first_error
+
+    @property
+    def duration(self):
+        """ Seconds between the start and the last reply. """
+        return self._duration
+
+    @property
+    def throughput(self):
+        """ Commands per second. """
+        return self._commands / self._duration if self._duration else 0.
+
+    def __repr__(self):
+        return 'BulkLoadReply(commands=%r, errors=%r, duration=%r)' % (self.commands, self.errors, self.duration)
+
+
+class TransactionReply:
+    """
+    :func:`~asyncio_redis.RedisProtocol.transaction` reply.
+    """
+    def __init__(self, value, results, retries):
+        self._value = value
+        self._results = results
+        self._retries = retries
+
+    @property
+    def value(self):
+        """ Return value of the transaction function. """
+        return self._value
+
+    @property
+    def results(self):
+        """ List with the results of the writes. (Errors are returned as ErrorReply instances.) """
+        return self._results
+
+    @property
+    def retries(self):
+        """ Number of times the transaction was retried. """
+        return self._retries
+
+    def __repr__(self):
+        return 'TransactionReply(value=%r, results=%r, retries=%r)' % (self.value, self.results, self.retries)
+
+
 class PubSubReply:
     """ Received pubsub message. """
     def __init__(self, channel, value, *, pattern=None):
@@ -242,32 +421,44 @@ class EvalScriptReply:
         self._value = value
 
     @asyncio.coroutine
-    def return_value(self):
+    def return_value(self, decode=True):
         """
         Coroutine that returns a Python representation of the script's return
-        value.
+        value. Lua tables become (nested) lists.
+
+        Strings are decoded with the encoder of the connection, unless
+        `decode` is False, then they are returned as bytes. (Status replies in
+        tables are returned like strings, error replies in tables as
+        :class:`~asyncio_redis.exceptions.ErrorReply` instances.)
         """
         from asyncio_redis.protocol import MultiBulkReply
 
-        @asyncio.coroutine
-        def decode(obj):
-            if isinstance(obj, int):
-                return obj
+        def convert(items):
+            # Decode all the strings of one level at once.
+            if decode:
+                decode_to_native = self._protocol.decode_to_native
+                return [ decode_to_native(i) if isinstance(i, bytes) else i for i in items ]
+            else:
+                return items
 
-            elif isinstance(obj, bytes):
-                return self._protocol.decode_to_native(self._value)
+        if not isinstance(self._value, MultiBulkReply):
+            return convert([ self._value ])[0]
 
-            elif isinstance(obj, MultiBulkReply):
-                # Unpack MultiBulkReply recursively as Python list.
-                result = []
-                for f in obj:
-                    item = yield from f
-                    result.append((yield from decode(item)))
-                return result
+        # Walk through the nested replies without recursion, reading every
+        # level at once.
+        result = []
+        pending = [ (self._value, result) ]
 
-            else:
-                # Nonetype, or decoded bytes.
-                return obj
+        while pending:
+            reply, target = pending.pop()
+            items = convert((yield from reply._read(decode=False, count=reply.count)))
+
+            for i, item in enumerate(items):
+                if isinstance(item, MultiBulkReply):
+                    items[i] = []
+                    pending.append((item, items[i]))
+
+            target.extend(items)
 
-        return (yield from decode(self._value))
+        return result
 
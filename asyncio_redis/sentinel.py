@@ -0,0 +1,222 @@
+from .connection import Connection
+from .exceptions import Error, ErrorReply, NotConnectedError
+from .log import logger
+from .pool import Pool
+
+import asyncio
+import logging
+
+
+__all__ = ('Sentinel', )
+
+
+class Sentinel:
+    """
+    Discovers the primary of a service through Redis Sentinel, and makes
+    connections follow failovers.
+
+    The address of the primary is asked with ``SENTINEL
+    get-master-addr-by-name``. A background task subscribes to
+    ``+switch-master`` on one of the sentinels; when the primary changes, all
+    connections created through this sentinel are dropped, and they reconnect
+    to the new primary. On every (re)connect, ``ROLE`` is used to check that
+    the node is really the primary.
+
+    ::
+
+        sentinel = yield from Sentinel.create([ ('sentinel1', 26379), ('sentinel2', 26379) ], 'mymaster')
+        pool = yield from sentinel.create_pool(poolsize=10)
+        result = yield from pool.set('key', 'value')
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, sentinels, service_name, *, password=None, connect_timeout=1,
+               check_interval=1, loop=None):
+        """
+        :param sentinels: List of ``(host, port)`` tuples of the sentinels.
+        :type sentinels: list
+        :param service_name: Name of the monitored master.
+        :type service_name: str
+        :param password: (optional) Password of the sentinels.
+        :type password: bytes
+        :param connect_timeout: Seconds to wait for a sentinel to answer, before the next one is tried.
+        :type connect_timeout: float
+        :param check_interval: Seconds between checks of the subscription connection.
+        :type check_interval: float
+        :param loop: (optional) asyncio event loop.
+        """
+        self = cls()
+        self._sentinels = list(sentinels)
+        self._service_name = service_name
+        self._password = password
+        self._connect_timeout = connect_timeout
+        self._check_interval = check_interval
+        self._loop = loop or asyncio.get_event_loop()
+
+        self._address = None # (host, port) of the primary.
+        self._connection = None # Connection to a sentinel for queries.
+        self._discover_f = None
+        self._connections = set() # Connections that follow the primary.
+
+        yield from self.discover_primary()
+        self._listen_task = asyncio.async(self._listen(), loop=self._loop)
+        return self
+
+    def __repr__(self):
+        return 'Sentinel(service_name=%r, primary=%r)' % (self._service_name, self._address)
+
+    @property
+    def service_name(self):
+        """ Name of the monitored master. """
+        return self._service_name
+
+    @property
+    def primary_address(self):
+        """ Last known ``(host, port)`` of the primary. """
+        return self._address
+
+    @asyncio.coroutine
+    def create_connection(self, **kwargs):
+        """
+        Create a :class:`~asyncio_redis.Connection` to the primary. The
+        keyword arguments are passed to :func:`Connection.create <asyncio_redis.Connection.create>`.
+        """
+        return (yield from Connection.create(sentinel=self, loop=self._loop, **kwargs))
+
+    @asyncio.coroutine
+    def create_pool(self, **kwargs):
+        """
+        Create a :class:`~asyncio_redis.Pool` for the primary. The keyword
+        arguments are passed to :func:`Pool.create <asyncio_redis.Pool.create>`.
+        """
+        return (yield from Pool.create(sentinel=self, loop=self._loop, **kwargs))
+
+    def _register(self, connection):
+        self._connections.add(connection)
+
+    def _unregister(self, connection):
+        self._connections.discard(connection)
+
+    @asyncio.coroutine
+    def get_primary_address(self):
+        """
+        Return the ``(host, port)`` of the primary. (Only asks the sentinels
+        when the address is not known.)
+        """
+        if self._address is None:
+            yield from self.discover_primary()
+        return self._address
+
+    def _forget_primary_address(self, host, port):
+        """ Called when a connection found out that this node is not the primary. """
+        if self._address == (host, port):
+            self._address = None
+
+    @asyncio.coroutine
+    def discover_primary(self):
+        """
+        Ask the sentinels for the address of the primary. Concurrent calls
+        share the same request.
+        """
+        if self._discover_f is None or self._discover_f.done():
+            self._discover_f = asyncio.async(self._discover_primary(), loop=self._loop)
+        return (yield from self._discover_f)
+
+    @asyncio.coroutine
+    def _connect_sentinel(self, host, port):
+        return (yield from asyncio.wait_for(
+                Connection.create(host=host, port=port, password=self._password,
+                                  auto_reconnect=False, loop=self._loop),
+                self._connect_timeout, loop=self._loop))
+
+    @asyncio.coroutine
+    def _discover_primary(self):
+        for i, (host, port) in enumerate(list(self._sentinels)):
+            try:
+                if self._connection is None or not self._connection.protocol.is_connected:
+                    self._connection = yield from self._connect_sentinel(host, port)
+
+                address = yield from asyncio.wait_for(
+                        self._connection.sentinel_get_master_addr_by_name(self._service_name),
+                        self._connect_timeout, loop=self._loop)
+            except (OSError, asyncio.TimeoutError, Error, ErrorReply) as e:
+                logger.log(logging.INFO, 'Sentinel %s:%s failed: %r' % (host, port, e))
+                self._close_connection()
+                continue
+
+            if address is None:
+                logger.log(logging.INFO, 'Sentinel %s:%s does not know %r' % (host, port, self._service_name))
+                self._close_connection()
+                continue
+
+            # Ask the sentinel that answered first next time.
+            if i:
+                self._sentinels.insert(0, self._sentinels.pop(i))
+
+            self._set_primary_address(address)
+            return address
+
+        raise NotConnectedError('No sentinel knows the primary of %r' % self._service_name)
+
+    def _close_connection(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def _set_primary_address(self, address):
+        """
+        Store the new address, and drop the connections to any other node.
+        They reconnect to the new primary.
+        """
+        if address != self._address:
+            logger.log(logging.WARNING, 'Primary of %r is at %s:%s' % ((self._service_name, ) + address))
+        self._address = address
+
+        for connection in list(self._connections):
+            if connection.transport and (connection.host, connection.port) != address:
+                connection.transport.close()
+
+    @asyncio.coroutine
+    def _listen(self):
+        """
+        Keep a subscription to ``+switch-master`` on one of the sentinels.
+        """
+        while True:
+            for host, port in list(self._sentinels):
+                try:
+                    connection = yield from self._connect_sentinel(host, port)
+                except (OSError, asyncio.TimeoutError):
+                    continue
+
+                try:
+                    subscriber = yield from connection.start_subscribe()
+                    yield from subscriber.subscribe(['+switch-master'])
+
+                    # We could have missed a failover while not subscribed.
+                    yield from self.discover_primary()
+
+                    while connection.protocol.is_connected:
+                        try:
+                            reply = yield from asyncio.wait_for(subscriber.next_published(),
+                                                                self._check_interval, loop=self._loop)
+                        except asyncio.TimeoutError:
+                            continue
+
+                        # Message format: <name> <old-ip> <old-port> <new-ip> <new-port>
+                        name, _, _, new_host, new_port = reply.value.split()
+                        if name == self._service_name:
+                            self._set_primary_address((new_host, int(new_port)))
+                except (OSError, Error, ErrorReply) as e:
+                    logger.log(logging.INFO, 'Sentinel subscription to %s:%s failed: %r' % (host, port, e))
+                finally:
+                    connection.close()
+
+            yield from asyncio.sleep(self._check_interval, loop=self._loop)
+
+    def close(self):
+        """
+        Stop following the primary. (Connections created through this
+        sentinel stay open.)
+        """
+        self._listen_task.cancel()
+        self._close_connection()
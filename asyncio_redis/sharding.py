@@ -0,0 +1,500 @@
+from .encoders import UTF8Encoder
+from .exceptions import Error, PartialFailureError
+from .pool import Pool
+from .protocol import RedisProtocol, Script, _all_commands
+
+from bisect import bisect
+from functools import wraps
+from hashlib import md5
+from inspect import signature
+import asyncio
+
+
+__all__ = ('HashRing', 'ShardedPool')
+
+
+#: Names of the protocol method parameters that contain a key or a list of keys.
+_KEY_PARAMS = ('key', 'newkey', 'source', 'destination', 'destkey')
+_KEYS_PARAMS = ('keys', 'srckeys')
+
+#: Names of the protocol method parameters that contain a dictionary with keys.
+_DICT_KEYS_PARAMS = ('streams', )
+
+#: Commands of which the `values` parameter is a dictionary with keys.
+_DICT_KEY_COMMANDS = ('mset', )
+
+# Cache of command name -> list of (position, name, kind) tuples.
+_key_params_cache = {}
+
+
+def _get_key_params(name):
+    """
+    Return the parameters of the protocol method `name` that contain keys, as
+    a list of (position, parameter name, kind) tuples, where kind is 'key',
+    'list' or 'dict'. The position doesn't count `self`.
+    """
+    try:
+        return _key_params_cache[name]
+    except KeyError:
+        # `signature` follows the __wrapped__ chain, so this gives the
+        # parameters of the original method, rather than (*a, **kw).
+        params = list(signature(getattr(RedisProtocol, name)).parameters)[1:]
+        result = []
+
+        for i, p in enumerate(params):
+            if p in _KEY_PARAMS:
+                result.append((i, p, 'key'))
+            elif p in _KEYS_PARAMS:
+                result.append((i, p, 'list'))
+            elif p in _DICT_KEYS_PARAMS or (p == 'values' and name.split('_')[0] in _DICT_KEY_COMMANDS):
+                result.append((i, p, 'dict'))
+
+        _key_params_cache[name] = result
+        return result
+
+
+def _get_keys(name, a, kw):
+    """
+    Return a list of all the keys that are passed to the command `name`
+    through `a` and `kw`.
+
+    Returns a (keys, a, kw) tuple. Iterators that are passed as a list of
+    keys are consumed here, so they are replaced by lists in `a` and `kw`.
+    """
+    keys = []
+
+    for position, param, kind in _get_key_params(name):
+        if position < len(a):
+            value = a[position]
+        else:
+            value = kw.get(param)
+
+        if value is None:
+            continue
+
+        if kind == 'list':
+            if not isinstance(value, (list, tuple)):
+                value = list(value)
+                if position < len(a):
+                    a = a[:position] + (value, ) + a[position + 1:]
+                else:
+                    kw = dict(kw, **{ param: value })
+            keys.extend(value)
+        elif kind == 'dict':
+            keys.extend(value)
+        else:
+            keys.append(value)
+
+    return keys, a, kw
+
+
+class _FanOutPool:
+    """
+    Base class for pools that spread keys over several nodes.
+
+    Multi-key commands (mget, delete, mset, sinter, sunion, sdiff) are split
+    in groups of keys that can be executed by a single node. The groups are
+    executed concurrently and the results are reassembled in the order of the
+    keys that were given. When only some of the nodes fail, a
+    :class:`~asyncio_redis.exceptions.PartialFailureError` is raised that
+    contains the errors and the results per node.
+
+    ``evalsha_many`` (used by ``Script.run_many``) groups the calls by the
+    node of their first key, and pipelines every group on its node.
+
+    Subclasses implement `_group_keys`, `_execute` and `_get_node_pool`.
+    """
+    def _group_keys(self, keys):
+        """
+        Split keys in groups that can be executed as one command. Returns a
+        list of (node name, list of keys) tuples.
+        """
+        raise NotImplementedError
+
+    @asyncio.coroutine
+    def _execute(self, name, a, kw):
+        """ Execute command on the node that owns its key(s). """
+        raise NotImplementedError
+
+    @asyncio.coroutine
+    def _get_node_pool(self, node):
+        """ Return the :class:`~asyncio_redis.Pool` of this node. """
+        raise NotImplementedError
+
+    @asyncio.coroutine
+    def _fan_out(self, keys, call):
+        """
+        Split the keys in groups, and run `call(group)` concurrently for every
+        group. Returns a list of (group, result) tuples.
+        """
+        groups = self._group_keys(keys)
+
+        # Everything on one node: no need to aggregate errors.
+        if len(groups) == 1:
+            group = groups[0][1]
+            return [ (group, (yield from call(group))) ]
+
+        results = yield from asyncio.gather(*[ call(group) for node, group in groups ],
+                                            loop=self._loop, return_exceptions=True)
+        errors = {}
+        successes = {}
+
+        for (node, group), result in zip(groups, results):
+            if isinstance(result, Exception):
+                errors.setdefault(node, result)
+            else:
+                successes.setdefault(node, []).append((group, result))
+
+        if errors:
+            raise PartialFailureError('Command failed on %i of %i nodes: %r' % (
+                        len(errors), len(set(node for node, group in groups)), errors),
+                        errors, successes)
+
+        return [ (group, result) for (node, group), result in zip(groups, results) ]
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.evalsha_many)
+    def evalsha_many(self, sha, calls):
+        calls = [ (list(keys or []), list(args or [])) for keys, args in calls ]
+        results = [ None ] * len(calls)
+
+        # Group the calls by the node of their first key.
+        groups = {}
+        for i, (keys, args) in enumerate(calls):
+            if not keys:
+                raise Error('Script calls need a key to choose a node.')
+            node = self._group_keys(keys[:1])[0][0]
+            groups.setdefault(node, []).append(i)
+
+        @asyncio.coroutine
+        def run(node, indices):
+            pool = yield from self._get_node_pool(node)
+            return (yield from pool.evalsha_many(sha, [ calls[i] for i in indices ]))
+
+        groups = list(groups.items())
+        replies = yield from asyncio.gather(*[ run(node, indices) for node, indices in groups ],
+                                            loop=self._loop, return_exceptions=True)
+
+        # When a node failed, all its entries get the exception.
+        for (node, indices), reply in zip(groups, replies):
+            if isinstance(reply, Exception):
+                reply = [ reply ] * len(indices)
+            for i, r in zip(indices, reply):
+                results[i] = r
+
+        return results
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.mget_aslist)
+    def mget_aslist(self, keys):
+        keys = list(keys)
+        values = {}
+
+        for group, result in (yield from self._fan_out(keys,
+                    lambda group: self._execute('mget_aslist', (group, ), {}))):
+            values.update(zip(group, result))
+
+        return [ values[k] for k in keys ]
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.delete)
+    def delete(self, keys):
+        results = yield from self._fan_out(list(keys),
+                    lambda group: self._execute('delete', (group, ), {}))
+        return sum(result for group, result in results)
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.mset)
+    def mset(self, values):
+        # Note that this is only atomic per node.
+        results = yield from self._fan_out(list(values),
+                    lambda group: self._execute('mset', ({ k: values[k] for k in group }, ), {}))
+        return results[0][1]
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.sinter_asset)
+    def sinter_asset(self, keys):
+        keys = list(keys)
+        if not keys:
+            # Fails like any command without a key.
+            return (yield from self._execute('sinter_asset', (keys, ), {}))
+
+        results = yield from self._fan_out(keys,
+                    lambda group: self._execute('sinter_asset', (group, ), {}))
+        return set.intersection(*[ result for group, result in results ])
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.sunion_asset)
+    def sunion_asset(self, keys):
+        keys = list(keys)
+        if not keys:
+            # Fails like any command without a key.
+            return (yield from self._execute('sunion_asset', (keys, ), {}))
+
+        results = yield from self._fan_out(keys,
+                    lambda group: self._execute('sunion_asset', (group, ), {}))
+        return set.union(*[ result for group, result in results ])
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.sdiff_asset)
+    def sdiff_asset(self, keys):
+        keys = list(keys)
+        if not keys:
+            # Fails like any command without a key.
+            return (yield from self._execute('sdiff_asset', (keys, ), {}))
+
+        first = keys[0]
+
+        # The node of the first key calculates the difference of its keys,
+        # the other nodes the union of the keys that have to be subtracted.
+        def call(group):
+            if group[0] == first:
+                return self._execute('sdiff_asset', (group, ), {})
+            else:
+                return self._execute('sunion_asset', (group, ), {})
+
+        result = set()
+        subtract = set()
+
+        for group, members in (yield from self._fan_out(keys, call)):
+            if group[0] == first:
+                result = members
+            else:
+                subtract |= members
+
+        return result - subtract
+
+
+class HashRing:
+    """
+    Consistent hash ring (ketama-style) which maps keys to node names.
+
+    Every node gets ``160 * weight`` points on the ring, derived from MD5
+    hashes of the node name. A key belongs to the first node point following
+    the hash of the key. Adding or removing a node only remaps the keys that
+    fall between the points of that node, about 1/N of the keys.
+
+    When a key contains a ``{hashtag}``, only the part between the first
+    ``{`` and the next ``}`` is hashed, so that related keys end up on the
+    same node.
+
+    ::
+
+        ring = HashRing({ 'redis1:6379': 1, 'redis2:6379': 2 })
+        node = ring.get_node(b'user:{1000}:followers')
+    """
+    #: Number of MD5 digests per unit of weight. Every digest gives four points.
+    replicas = 40
+
+    def __init__(self, nodes=None):
+        self._weights = {}
+        self._points = []
+        self._nodes = []
+
+        for name, weight in (nodes or {}).items():
+            self._weights[name] = weight
+        self._build()
+
+    def __repr__(self):
+        return 'HashRing(nodes=%r)' % (self._weights, )
+
+    @property
+    def nodes(self):
+        """ Dictionary which maps the node names to their weight. """
+        return dict(self._weights)
+
+    def add_node(self, name, weight=1):
+        """ Add a node to the ring. """
+        assert isinstance(weight, int) and weight > 0
+        self._weights[name] = weight
+        self._build()
+
+    def remove_node(self, name):
+        """ Remove a node from the ring. """
+        del self._weights[name]
+        self._build()
+
+    def _build(self):
+        ring = []
+
+        for name, weight in self._weights.items():
+            for i in range(self.replicas * weight):
+                digest = md5(('%s-%i' % (name, i)).encode('utf-8')).digest()
+
+                for j in range(4):
+                    ring.append((int.from_bytes(digest[j*4:j*4+4], 'little'), name))
+
+        ring.sort()
+        self._points = [ point for point, name in ring ]
+        self._nodes = [ name for point, name in ring ]
+
+    @staticmethod
+    def hash_key(key):
+        """ Hash a key (bytes) to a position on the ring. """
+        # Only hash the part between braces, if any.
+        start = key.find(b'{')
+        if start != -1:
+            end = key.find(b'}', start + 1)
+            if end > start + 1:
+                key = key[start + 1:end]
+
+        return int.from_bytes(md5(key).digest()[:4], 'little')
+
+    def get_node(self, key):
+        """ Return the name of the node to which this key (bytes) belongs. """
+        if not self._points:
+            raise Error('Hash ring has no nodes.')
+
+        i = bisect(self._points, self.hash_key(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+class ShardedPool(_FanOutPool):
+    """
+    Client-side sharding over several independent Redis servers. Every node
+    gets its own :class:`~asyncio_redis.Pool` and keys are distributed over
+    the nodes with a consistent :class:`~asyncio_redis.HashRing`.
+
+    Commands are proxied like in a normal pool; the node is chosen by the key
+    argument(s) of the command. ``mget_aslist``, ``delete``, ``mset``,
+    ``sinter_asset``, ``sunion_asset`` and ``sdiff_asset`` are split by node
+    and executed concurrently. Other commands without keys, or with keys that
+    map to different nodes, raise :class:`~asyncio_redis.exceptions.Error`.
+    Use :func:`get_pool` to run these directly on a node.
+
+    ::
+
+        pool = yield from ShardedPool.create(nodes=[
+                    ('redis1', 6379), ('redis2', 6379), ('redis3', 6379, 2) ], poolsize=10)
+        result = yield from pool.set('key', 'value')
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, nodes, *, encoder=None, loop=None, **kwargs):
+        """
+        Create a new sharded connection pool instance.
+
+        :param nodes: List of ``(host, port)`` or ``(host, port, weight)``
+                      tuples, one for every Redis server.
+        :type nodes: list
+        :param encoder: Encoder to use for encoding to or decoding from redis bytes to a native type.
+        :type encoder: :class:`~asyncio_redis.encoders.BaseEncoder` instance.
+        :param loop: (optional) asyncio event loop.
+
+        All other keyword arguments (``password``, ``db``, ``poolsize``, ...)
+        are passed to :func:`Pool.create <asyncio_redis.Pool.create>` for
+        every node.
+        """
+        self = cls()
+        self._encoder = encoder or UTF8Encoder()
+        self._loop = loop or asyncio.get_event_loop()
+        self._pool_kwargs = kwargs
+        self._pools = {}
+        self._ring = HashRing()
+
+        for node in nodes:
+            yield from self.add_node(*node)
+
+        return self
+
+    def __repr__(self):
+        return 'ShardedPool(nodes=%r)' % (sorted(self._pools), )
+
+    @staticmethod
+    def _node_name(host, port):
+        return '%s:%s' % (host, port) if port else host
+
+    @property
+    def ring(self):
+        """ The :class:`~asyncio_redis.HashRing` instance. """
+        return self._ring
+
+    @property
+    def nodes(self):
+        """ Dictionary which maps node names to :class:`~asyncio_redis.Pool` instances. """
+        return dict(self._pools)
+
+    @asyncio.coroutine
+    def add_node(self, host, port=6379, weight=1):
+        """
+        Create a connection pool for a new node and add it to the ring.
+        """
+        name = self._node_name(host, port)
+        if name in self._pools:
+            raise Error('Node %s already exists.' % name)
+
+        pool = yield from Pool.create(host=host, port=port, encoder=self._encoder,
+                                      loop=self._loop, **self._pool_kwargs)
+        self._pools[name] = pool
+        self._ring.add_node(name, weight)
+
+    def remove_node(self, host, port=6379):
+        """
+        Remove a node from the ring and close its connections.
+        """
+        name = self._node_name(host, port)
+        self._ring.remove_node(name)
+        self._pools.pop(name).close()
+
+    def get_pool(self, key):
+        """ Return the :class:`~asyncio_redis.Pool` of the node that owns this key. """
+        return self._pools[self._ring.get_node(self._encoder.encode_from_native(key))]
+
+    def _group_keys(self, keys):
+        groups = {}
+        for k in keys:
+            groups.setdefault(self._ring.get_node(self._encoder.encode_from_native(k)), []).append(k)
+        return list(groups.items())
+
+    @asyncio.coroutine
+    def _get_node_pool(self, node):
+        return self._pools[node]
+
+    @asyncio.coroutine
+    def _execute(self, name, a, kw):
+        keys, a, kw = _get_keys(name, a, kw)
+
+        if not keys:
+            raise Error('Command %s has no key to choose a node in a ShardedPool.' % name)
+
+        nodes = set(self._ring.get_node(self._encoder.encode_from_native(k)) for k in keys)
+        if len(nodes) > 1:
+            raise Error('Keys of command %s map to different nodes: %r' % (name, sorted(nodes)))
+
+        return (yield from getattr(self._pools[nodes.pop()], name)(*a, **kw))
+
+    def __getattr__(self, name):
+        """
+        Proxy to the pool of the node that owns the key(s) of this command.
+        """
+        # Only proxy commands.
+        if name not in _all_commands:
+            raise AttributeError(name)
+
+        @wraps(getattr(RedisProtocol, name))
+        def call(*a, **kw):
+            return self._execute(name, a, kw)
+        return call
+
+    @asyncio.coroutine
+    @wraps(RedisProtocol.register_script)
+    def register_script(self, script:str) -> Script:
+        if not self._pools:
+            raise Error('ShardedPool has no nodes.')
+
+        # Register the script on every node.
+        for pool in self._pools.values():
+            result = yield from pool.register_script(script)
+
+        # Run it on the node that owns the keys passed to `run`.
+        return Script(result.sha, script, lambda: self.evalsha, lambda: self.eval, lambda: self.evalsha_many)
+
+    def close(self):
+        """
+        Close all the connections of all the nodes.
+        """
+        for pool in self._pools.values():
+            pool.close()
+
+        self._pools = {}
+        self._ring = HashRing()
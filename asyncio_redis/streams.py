@@ -0,0 +1,281 @@
+from .exceptions import Error, ErrorReply
+from .log import logger
+
+import asyncio
+import logging
+
+
+__all__ = ('StreamGroupConsumer', )
+
+
+class StreamGroupConsumer:
+    """
+    Consumer of a Redis stream, as member of a consumer group.
+
+    Entries are fetched in batches with ``XREADGROUP ... COUNT ... BLOCK``,
+    and passed to the handler as a list of ``(id, fields)`` tuples. When the
+    handler returns, the whole batch is acknowledged with one ``XACK``, which
+    is sent while the next batch is being fetched. When the handler raises,
+    the entries stay pending.
+
+    On start, the entries that are still pending for this consumer (after a
+    restart) are handled first. Every `check_interval` seconds, pending
+    entries of the group that were not acknowledged for `claim_idle_time`
+    milliseconds (because the handler failed, or another consumer crashed)
+    are claimed with ``XCLAIM`` and handled again. (So the handler can be
+    called for a claimed batch while it handles another one.) Entries that
+    were delivered `max_deliveries` times are acknowledged without handling
+    them again.
+
+    ::
+
+        @asyncio.coroutine
+        def handle(entries):
+            for id, fields in entries:
+                print('Processing', id, fields)
+
+        consumer = yield from StreamGroupConsumer.create(pool, 'events', 'workers', 'worker-1', handle)
+        ...
+        yield from consumer.stop()
+    """
+    @classmethod
+    @asyncio.coroutine
+    def create(cls, pool, stream, group, consumer, handler, *, count=100, block=1000,
+               claim_idle_time=60000, max_deliveries=None, check_interval=10, loop=None):
+        """
+        Create a consumer, and start handling entries. The stream and the
+        group are created when they don't exist. (A new group starts with the
+        entries that are added after it was created.)
+
+        :param pool: Pool for all the stream commands.
+        :type pool: :class:`~asyncio_redis.Pool`
+        :param stream: Name of the stream.
+        :type stream: Native Python type as defined by the ``encoder`` parameter
+        :param group: Name of the consumer group.
+        :type group: Native Python type as defined by the ``encoder`` parameter
+        :param consumer: Name of this consumer in the group.
+        :type consumer: Native Python type as defined by the ``encoder`` parameter
+        :param handler: Coroutine function which is called with every batch of entries.
+        :param count: Maximum number of entries in a batch.
+        :type count: int
+        :param block: Timeout of every ``XREADGROUP`` in milliseconds. (Stopping takes this long at most.)
+        :type block: int
+        :param claim_idle_time: Milliseconds after which pending entries are claimed.
+        :type claim_idle_time: int
+        :param max_deliveries: (optional) Number of deliveries after which an
+                               entry is acknowledged without handling it.
+        :type max_deliveries: int
+        :param check_interval: Seconds between checks for stale pending entries.
+        :type check_interval: float
+        :param loop: (optional) asyncio event loop.
+        """
+        self = cls()
+        self._pool = pool
+        self._stream = stream
+        self._group = group
+        self._consumer = consumer
+        self._handler = handler
+        self._count = count
+        self._block = block
+        self._claim_idle_time = claim_idle_time
+        self._max_deliveries = max_deliveries
+        self._check_interval = check_interval
+        self._loop = loop or asyncio.get_event_loop()
+        self._running = True
+        self._ack_tasks = set() # XACK requests that are in flight.
+
+        # Metrics.
+        self._start_time = self._loop.time()
+        self._processed = 0
+        self._failed = 0
+        self._claimed = 0
+        self._dropped = 0
+        self._batches = 0
+
+        try:
+            yield from pool.xgroup_create(stream, group, id='$', mkstream=True)
+        except ErrorReply as e:
+            if not e.args[0].startswith('BUSYGROUP'):
+                raise
+
+        self._worker = asyncio.async(self._work(), loop=self._loop)
+        self._monitor_task = asyncio.async(self._monitor(), loop=self._loop)
+        return self
+
+    def __repr__(self):
+        return 'StreamGroupConsumer(stream=%r, group=%r, consumer=%r)' % (self._stream, self._group, self._consumer)
+
+    @property
+    def processed(self):
+        """ Number of entries that were handled successfully. """
+        return self._processed
+
+    @property
+    def failed(self):
+        """ Number of entries of batches for which the handler raised an exception. """
+        return self._failed
+
+    @property
+    def claimed(self):
+        """ Number of stale pending entries that were claimed. """
+        return self._claimed
+
+    @property
+    def dropped(self):
+        """ Number of entries that were acknowledged after `max_deliveries`. """
+        return self._dropped
+
+    @property
+    def batches(self):
+        """ Number of batches that were passed to the handler. """
+        return self._batches
+
+    @property
+    def throughput(self):
+        """ Successfully handled entries per second, since the start. """
+        duration = self._loop.time() - self._start_time
+        return self._processed / duration if duration else 0.
+
+    @asyncio.coroutine
+    def _work(self):
+        # Start with the entries that were delivered to this consumer before,
+        # but never acknowledged.
+        last_id = '0'
+
+        while self._running:
+            try:
+                result = yield from self._pool.xreadgroup(self._group, self._consumer, { self._stream: last_id },
+                                                          count=self._count, block=self._block)
+            except (OSError, Error, ErrorReply) as e:
+                logger.log(logging.WARNING, 'Reading from stream %r failed: %r' % (self._stream, e))
+                yield from asyncio.sleep(self._block / 1000., loop=self._loop)
+                continue
+
+            entries = result.streams.get(self._stream)
+
+            if last_id != '>':
+                # Page through the pending entries, then switch to new ones.
+                if entries:
+                    last_id = entries[-1][0]
+                else:
+                    last_id = '>'
+
+            if entries:
+                yield from self._process(entries)
+
+    @asyncio.coroutine
+    def _process(self, entries):
+        # Entries that were deleted from the stream don't have fields
+        # anymore. Acknowledge them without handling.
+        ids = [ id for id, fields in entries ]
+        entries = [ entry for entry in entries if entry[1] is not None ]
+
+        if entries:
+            self._batches += 1
+            try:
+                yield from self._handler(entries)
+            except Exception as e:
+                self._failed += len(entries)
+                logger.log(logging.WARNING, 'Handling %i entries of stream %r failed: %r' % (len(entries), self._stream, e))
+                return
+            else:
+                self._processed += len(entries)
+
+        self._ack(ids)
+
+    def _ack(self, ids):
+        """
+        Acknowledge these entries in the background, while the next batch is
+        fetched.
+        """
+        task = asyncio.async(self._pool.xack(self._stream, self._group, ids), loop=self._loop)
+        self._ack_tasks.add(task)
+        task.add_done_callback(self._ack_done)
+
+    def _ack_done(self, task):
+        self._ack_tasks.discard(task)
+
+        if not task.cancelled() and task.exception():
+            # The entries stay pending, and are claimed again later.
+            logger.log(logging.WARNING, 'Acknowledging entries of stream %r failed: %r' % (self._stream, task.exception()))
+
+    @asyncio.coroutine
+    def _monitor(self):
+        while True:
+            yield from asyncio.sleep(self._check_interval, loop=self._loop)
+            try:
+                yield from self.claim_stale_entries()
+            except (OSError, Error, ErrorReply) as e:
+                logger.log(logging.WARNING, 'Claiming entries of stream %r failed: %r' % (self._stream, e))
+
+    @asyncio.coroutine
+    def claim_stale_entries(self):
+        """
+        Claim the pending entries of the group that were not acknowledged for
+        `claim_idle_time` milliseconds, and handle them. (This runs every
+        `check_interval` seconds.)
+
+        Returns the number of claimed entries.
+        """
+        claimed = 0
+        start = '-'
+
+        while True:
+            pending = yield from self._pool.xpending_range(self._stream, self._group, start, '+', self._count)
+            if not pending:
+                break
+
+            stale = [ (id, deliveries) for id, consumer, idle, deliveries in pending if idle >= self._claim_idle_time ]
+            dropped = set(id for id, deliveries in stale
+                          if self._max_deliveries is not None and deliveries >= self._max_deliveries)
+
+            if dropped:
+                logger.log(logging.WARNING, 'Dropping %i entries of stream %r after too many deliveries.' % (
+                                len(dropped), self._stream))
+                yield from self._pool.xack(self._stream, self._group, list(dropped))
+                self._dropped += len(dropped)
+
+            ids = [ id for id, deliveries in stale if id not in dropped ]
+            if ids:
+                # (Entries that another consumer claimed in the meantime are
+                # not returned, nor entries that were deleted on older Redis
+                # versions. Those are dropped after `max_deliveries`.)
+                reply = yield from self._pool.xclaim(self._stream, self._group, self._consumer,
+                                                     self._claim_idle_time, ids)
+                entries = reply.entries
+                claimed += len(entries)
+                self._claimed += len(entries)
+
+                if entries:
+                    yield from self._process(entries)
+
+            if len(pending) < self._count:
+                break
+
+            # Continue after the last ID of this page.
+            start = _next_id(pending[-1][0])
+
+        return claimed
+
+    @asyncio.coroutine
+    def stop(self):
+        """
+        Stop reading, and wait for the batch that is being handled and for
+        the acknowledgements.
+        """
+        self._running = False
+        self._monitor_task.cancel()
+
+        yield from asyncio.wait([ self._worker ], loop=self._loop)
+
+        if self._ack_tasks:
+            yield from asyncio.wait(list(self._ack_tasks), loop=self._loop)
+
+
+def _next_id(id):
+    """ The stream ID that follows `id` (str or bytes), as str. """
+    if isinstance(id, bytes):
+        id = id.decode('ascii')
+
+    time, sequence = id.split('-')
+    return '%s-%i' % (time, int(sequence) + 1)
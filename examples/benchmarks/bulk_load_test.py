@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Benchmark how many keys per second can be inserted with separate `set` calls
+(pipelined per chunk) and with `bulk_load`.
+"""
+import asyncio
+import asyncio_redis
+import time
+
+KEYS = 1000 * 1000
+CHUNK = 1000
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+
+    @asyncio.coroutine
+    def insert_with_set(connection):
+        for i in range(0, KEYS, CHUNK):
+            yield from asyncio.gather(*[ connection.set('key-%i' % j, 'value') for j in range(i, i + CHUNK) ])
+
+    @asyncio.coroutine
+    def insert_with_bulk_load(connection):
+        reply = yield from connection.bulk_load(('set', 'key-%i' % i, 'value') for i in range(KEYS))
+        assert reply.errors == 0
+
+    def run():
+        connection = yield from asyncio_redis.Connection.create(host='localhost', port=6379)
+
+        try:
+            for name, insert in [ ('set', insert_with_set),
+                                  ('bulk_load', insert_with_bulk_load) ]:
+                print('Inserting %i keys with %s...' % (KEYS, name))
+                start = time.time()
+                start_cpu = time.process_time()
+
+                yield from insert(connection)
+
+                duration = time.time() - start
+                cpu = time.process_time() - start_cpu
+                print('Done. Duration=%.2fs, %i keys/s, %i keys/s per CPU second' % (
+                        duration, KEYS / duration, KEYS / cpu))
+                print()
+        finally:
+            connection.close()
+
+    loop.run_until_complete(run())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Benchmark how many pubsub messages per second one subscriber (running on one
+core) can consume, with `next_published` and with `next_published_batch`.
+A local publisher pipelines the messages from a second connection.
+"""
+import asyncio
+import asyncio_redis
+import time
+
+MESSAGES = 100 * 1000
+CHUNK = 1000
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+
+    @asyncio.coroutine
+    def publish(connection, channel):
+        # Pipeline the PUBLISH commands per chunk.
+        for i in range(0, MESSAGES, CHUNK):
+            yield from asyncio.gather(*[ connection.publish(channel, 'message') for _ in range(CHUNK) ])
+
+    @asyncio.coroutine
+    def consume_one_by_one(subscription):
+        for i in range(MESSAGES):
+            yield from subscription.next_published()
+
+    @asyncio.coroutine
+    def consume_in_batches(subscription):
+        received = 0
+        while received < MESSAGES:
+            batch = yield from subscription.next_published_batch(max_count=1000)
+            received += len(batch)
+
+    def run():
+        publisher = yield from asyncio_redis.Connection.create(host='localhost', port=6379)
+        subscriber = yield from asyncio_redis.Connection.create(host='localhost', port=6379)
+
+        try:
+            subscription = yield from subscriber.start_subscribe()
+            yield from subscription.subscribe([ 'benchmark' ])
+
+            for name, consume in [ ('next_published', consume_one_by_one),
+                                   ('next_published_batch', consume_in_batches) ]:
+                print('Receiving %i messages with %s...' % (MESSAGES, name))
+                start = time.time()
+                start_cpu = time.process_time()
+
+                yield from asyncio.gather(publish(publisher, 'benchmark'), consume(subscription))
+
+                duration = time.time() - start
+                cpu = time.process_time() - start_cpu
+                print('Done. Duration=%.2fs, %i msg/s, %i msg/s per CPU second' % (
+                        duration, MESSAGES / duration, MESSAGES / cpu))
+                print()
+        finally:
+            publisher.close()
+            subscriber.close()
+
+    loop.run_until_complete(run())
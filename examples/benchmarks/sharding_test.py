@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Show how evenly keys are distributed over the nodes of a consistent hash ring,
+how many keys move when a node is added, and what the routing of a command
+costs per call.
+"""
+import time
+
+from asyncio_redis import HashRing
+from asyncio_redis.sharding import _get_keys
+
+KEYS = 100 * 1000
+
+
+def distribution(ring, keys):
+    counts = { name: 0 for name in ring.nodes }
+    for k in keys:
+        counts[ring.get_node(k)] += 1
+    return counts
+
+
+def run():
+    keys = [ ('user:%i' % i).encode('ascii') for i in range(KEYS) ]
+
+    for count in (2, 4, 8, 16):
+        ring = HashRing({ 'redis%i:6379' % i: 1 for i in range(count) })
+        counts = distribution(ring, keys)
+        expected = KEYS / count
+        deviation = max(abs(c - expected) for c in counts.values()) / expected
+
+        # Add one node and count how many keys are remapped.
+        before = { k: ring.get_node(k) for k in keys }
+        ring.add_node('redis-new:6379')
+        moved = sum(1 for k in keys if ring.get_node(k) != before[k])
+
+        print('%2i nodes: max deviation from even share: %5.1f%%, '
+              'remapped after adding a node: %5.1f%% (ideal: %5.1f%%)' % (
+              count, deviation * 100, moved * 100. / KEYS, 100. / (count + 1)))
+
+    # Routing overhead: key extraction + hashing + ring lookup per call.
+    ring = HashRing({ 'redis%i:6379' % i: 1 for i in range(8) })
+
+    start = time.time()
+    for k in keys:
+        for key in _get_keys('get', (k, ), {})[0]:
+            ring.get_node(key)
+    duration = time.time() - start
+
+    print()
+    print('Routing overhead: %.2f us per call' % (duration * 1000 * 1000 / KEYS))
+
+
+if __name__ == '__main__':
+    run()
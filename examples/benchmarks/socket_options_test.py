@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Measure the effect of the socket options on latency (sequential requests) and
+throughput (pipelined requests).
+"""
+import asyncio
+import asyncio_redis
+import time
+
+
+configurations = [
+        ('Defaults (TCP_NODELAY)', {}),
+        ('Nagle enabled', { 'tcp_nodelay': False }),
+        ('Keepalive', { 'keepalive': True, 'keepalive_idle': 60,
+                        'keepalive_interval': 10, 'keepalive_count': 3 }),
+        ('Small buffers (8k)', { 'rcvbuf': 8 * 1024, 'sndbuf': 8 * 1024 }),
+        ('Large buffers (1M)', { 'rcvbuf': 1024 * 1024, 'sndbuf': 1024 * 1024 }),
+]
+
+REQUESTS = 10 * 1000
+
+
+@asyncio.coroutine
+def latency(connection):
+    """ Sequential get/set, every request waits for the previous answer. """
+    for i in range(REQUESTS):
+        yield from connection.set('key', 'value')
+
+
+@asyncio.coroutine
+def throughput(connection):
+    """ Pipelined requests, using asyncio.gather. """
+    futures = [ asyncio.async(connection.set('key', 'value')) for i in range(REQUESTS) ]
+    yield from asyncio.gather(*futures)
+
+
+@asyncio.coroutine
+def run():
+    for name, options in configurations:
+        connection = yield from asyncio_redis.Connection.create(host='localhost', port=6379, **options)
+
+        try:
+            print(name)
+
+            for benchmark in (latency, throughput):
+                start = time.time()
+                yield from benchmark(connection)
+                duration = time.time() - start
+
+                print('      %-12s %.3fs  (%i requests/s)' % (benchmark.__name__ + ':', duration, REQUESTS / duration))
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run())
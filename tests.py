@@ -5,21 +5,39 @@ from asyncio.tasks import gather
 from asyncio.test_utils import run_briefly
 
 from asyncio_redis import (
+        ClusterPool,
         Connection,
         Error,
         ErrorReply,
+        HashRing,
         HiRedisProtocol,
+        HubSubscription,
+        KeyspaceMigration,
+        NearCache,
         NoAvailableConnectionsInPoolError,
         NoRunningScriptError,
+        NoScriptError,
         NotConnectedError,
+        OverflowPolicy,
+        PartialFailureError,
         Pool,
+        PubSubHub,
+        QueueConsumer,
+        ReadPolicy,
+        ReadYourWrites,
         RedisProtocol,
+        ReplicaPool,
         Script,
         ScriptKilledError,
+        Sentinel,
+        ShardedPool,
+        StreamGroupConsumer,
         Subscription,
+        TTLCache,
         Transaction,
         TransactionError,
         ZScoreBoundary,
+        key_slot,
 )
 from asyncio_redis.replies import (
         BlockingPopReply,
@@ -30,8 +48,13 @@ from asyncio_redis.replies import (
         InfoReply,
         ListReply,
         PubSubReply,
+        RoleReply,
         SetReply,
+        BulkLoadReply,
         StatusReply,
+        StreamEntriesReply,
+        StreamsReply,
+        TransactionReply,
         ZRangeReply,
 )
 from asyncio_redis.exceptions import TimeoutError, ConnectionLostError
@@ -42,6 +65,10 @@ import asyncio
 import unittest
 import os
 import gc
+import socket
+import sys
+import tempfile
+import time
 import warnings
 
 try:
@@ -53,6 +80,13 @@ PORT = int(os.environ.get('REDIS_PORT', 6379))
 HOST = os.environ.get('REDIS_HOST', 'localhost')
 START_REDIS_SERVER = bool(os.environ.get('START_REDIS_SERVER', False))
 
+# Ports of the Redis Cluster nodes on localhost, e.g. "7000,7001,7002".
+CLUSTER_PORTS = [ int(p) for p in os.environ.get('REDIS_CLUSTER_PORTS', '').split(',') if p ]
+START_REDIS_CLUSTER = bool(os.environ.get('START_REDIS_CLUSTER', False))
+
+# Port of a sentinel on localhost that monitors the server above as 'mymaster'.
+SENTINEL_PORT = int(os.environ.get('REDIS_SENTINEL_PORT', 0))
+
 
 @asyncio.coroutine
 def connect(loop, protocol=RedisProtocol):
@@ -308,6 +342,33 @@ class RedisProtocolTest(TestCase):
         value = yield from protocol.renamenx(u'key3', u'key4')
         self.assertEqual(value, 0)
 
+    @redis_test
+    def test_dump_restore(self, transport, protocol):
+        yield from protocol.delete([ u'key', u'key2' ])
+        yield from protocol.rpush(u'key', [ u'a', u'b' ])
+
+        # Dump
+        value = yield from protocol.dump(u'key')
+        self.assertIsInstance(value, bytes)
+
+        value2 = yield from protocol.dump(u'unknown-key')
+        self.assertEqual(value2, None)
+
+        # Restore, with TTL.
+        result = yield from protocol.restore(u'key2', 10 * 1000, value)
+        self.assertEqual(result, StatusReply('OK'))
+        self.assertEqual((yield from protocol.lrange_aslist(u'key2')), [ u'a', u'b' ])
+        self.assertGreater((yield from protocol.pttl(u'key2')), 0)
+
+        # The key exists.
+        with self.assertRaises(ErrorReply):
+            yield from protocol.restore(u'key2', 0, value)
+
+        # Replace
+        result = yield from protocol.restore(u'key2', 0, value, replace=True)
+        self.assertEqual(result, StatusReply('OK'))
+        self.assertEqual((yield from protocol.pttl(u'key2')), -1)
+
     @redis_test
     def test_expire(self, transport, protocol):
         # Set
@@ -812,6 +873,64 @@ class RedisProtocolTest(TestCase):
         result = yield from protocol.hincrbyfloat(u'my_hash', u'a', 3.7)
         self.assertEqual(result, 15.7)
 
+    @redis_test
+    def test_streams(self, transport, protocol):
+        yield from protocol.delete([ u'my_stream' ])
+
+        # xadd
+        id1 = yield from protocol.xadd(u'my_stream', { u'a': u'1' })
+        id2 = yield from protocol.xadd(u'my_stream', { u'b': u'2', u'c': u'3' })
+        self.assertIsInstance(id1, str)
+        self.assertEqual((yield from protocol.xlen(u'my_stream')), 2)
+
+        # xrange
+        result = yield from protocol.xrange(u'my_stream')
+        self.assertIsInstance(result, StreamEntriesReply)
+        self.assertEqual(result.entries, [ (id1, { u'a': u'1' }), (id2, { u'b': u'2', u'c': u'3' }) ])
+        result = yield from protocol.xrange(u'my_stream', count=1)
+        self.assertEqual(result.entries, [ (id1, { u'a': u'1' }) ])
+
+        # xread
+        result = yield from protocol.xread({ u'my_stream': id1 })
+        self.assertIsInstance(result, StreamsReply)
+        self.assertEqual(result.streams, { u'my_stream': [ (id2, { u'b': u'2', u'c': u'3' }) ] })
+        result = yield from protocol.xread({ u'my_stream': '$' }, block=100)
+        self.assertEqual(result.streams, { })
+
+        # Consumer groups.
+        result = yield from protocol.xgroup_create(u'my_stream', u'group', id='0')
+        self.assertEqual(result, StatusReply('OK'))
+
+        result = yield from protocol.xreadgroup(u'group', u'consumer1', { u'my_stream': '>' }, count=10)
+        self.assertEqual(list(result.streams), [ u'my_stream' ])
+        self.assertEqual([ id for id, fields in result.streams[u'my_stream'] ], [ id1, id2 ])
+
+        count, min_id, max_id, consumers = yield from protocol.xpending(u'my_stream', u'group')
+        self.assertEqual((count, min_id, max_id, consumers), (2, id1, id2, { u'consumer1': 2 }))
+
+        result = yield from protocol.xpending_range(u'my_stream', u'group')
+        self.assertEqual([ (id, consumer, deliveries) for id, consumer, idle, deliveries in result ],
+                         [ (id1, u'consumer1', 1), (id2, u'consumer1', 1) ])
+
+        # xclaim
+        result = yield from protocol.xclaim(u'my_stream', u'group', u'consumer2', 0, [ id2 ])
+        self.assertIsInstance(result, StreamEntriesReply)
+        self.assertEqual(result.entries, [ (id2, { u'b': u'2', u'c': u'3' }) ])
+
+        # xack
+        result = yield from protocol.xack(u'my_stream', u'group', [ id1, id2 ])
+        self.assertEqual(result, 2)
+        count, min_id, max_id, consumers = yield from protocol.xpending(u'my_stream', u'group')
+        self.assertEqual((count, min_id, max_id, consumers), (0, None, None, { }))
+
+        # xtrim
+        result = yield from protocol.xtrim(u'my_stream', 1, approximate=False)
+        self.assertEqual(result, 1)
+        self.assertEqual((yield from protocol.xlen(u'my_stream')), 1)
+
+        result = yield from protocol.xgroup_destroy(u'my_stream', u'group')
+        self.assertEqual(result, 1)
+
     @redis_test
     def test_pubsub(self, transport, protocol):
         @asyncio.coroutine
@@ -923,6 +1042,182 @@ class RedisProtocolTest(TestCase):
         yield from sender()
         yield from f
 
+    @redis_test
+    def test_pubsub_batch(self, transport, protocol):
+        """ Receive buffered messages in batches. """
+        transport2, protocol2 = yield from connect(self.loop)
+        subscription = yield from protocol2.start_subscribe()
+        yield from subscription.subscribe(['our_channel'])
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        for i in range(10):
+            yield from protocol.publish('our_channel', 'message%i' % i)
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        # Everything is buffered, up to max_count.
+        results = yield from subscription.next_published_batch(max_count=4)
+        self.assertEqual([ r.value for r in results ], [ 'message0', 'message1', 'message2', 'message3' ])
+
+        results = yield from subscription.next_published_batch()
+        self.assertEqual([ r.value for r in results ], [ 'message%i' % i for i in range(4, 10) ])
+
+        # Wait for more messages, after the first one.
+        @asyncio.coroutine
+        def sender():
+            for i in range(3):
+                yield from protocol.publish('our_channel', 'later%i' % i)
+                yield from asyncio.sleep(.1, loop=self.loop)
+
+        f = asyncio.async(sender(), loop=self.loop)
+        results = yield from subscription.next_published_batch(max_count=10, max_wait=1)
+        self.assertEqual([ r.value for r in results ], [ 'later0', 'later1', 'later2' ])
+        yield from f
+
+        # Asynchronous iterator.
+        yield from protocol.publish('our_channel', 'message')
+        yield from asyncio.sleep(.5, loop=self.loop)
+        results = yield from subscription.batches(max_count=10).__anext__()
+        self.assertEqual(results, [ PubSubReply('our_channel', 'message') ])
+
+        transport2.close()
+
+    @redis_test
+    def test_pubsub_order(self, transport, protocol):
+        """ Messages that are published in a pipeline arrive in order. """
+        transport2, protocol2 = yield from connect(self.loop)
+        subscription = yield from protocol2.start_subscribe()
+        yield from subscription.subscribe(['our_channel'])
+        yield from subscription.psubscribe(['our_*'])
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        # (Not with asyncio.gather, which doesn't start them in order on
+        # older Python versions. Tasks start in the order of creation, and
+        # are pipelined.)
+        futures = [ asyncio.async(protocol.publish('our_channel', str(i)), loop=self.loop) for i in range(1000) ]
+        yield from asyncio.wait(futures, loop=self.loop)
+
+        results = []
+        while len(results) < 2000:
+            results.extend((yield from subscription.next_published_batch(max_count=2000)))
+
+        self.assertEqual([ r.value for r in results if r.pattern is None ], [ str(i) for i in range(1000) ])
+        self.assertEqual([ r.value for r in results if r.pattern ], [ str(i) for i in range(1000) ])
+
+        transport2.close()
+
+    @redis_test
+    def test_pubsub_overflow(self, transport, protocol):
+        """ Bounded subscription buffers. """
+        @asyncio.coroutine
+        def receive(overflow, **kwargs):
+            transport2, protocol2 = yield from connect(self.loop)
+            subscription = yield from protocol2.start_subscribe(overflow=overflow, **kwargs)
+            yield from subscription.subscribe(['our_channel'])
+            yield from asyncio.sleep(.5, loop=self.loop)
+
+            for i in range(10):
+                yield from protocol.publish('our_channel', 'message%i' % i)
+            yield from asyncio.sleep(.5, loop=self.loop)
+
+            results = []
+            while subscription.buffered_messages:
+                results.extend((yield from subscription.next_published_batch(max_count=2)))
+                yield from asyncio.sleep(.1, loop=self.loop)
+
+            transport2.close()
+            return [ r.value for r in results ], subscription
+
+        # Drop newest.
+        results, subscription = yield from receive(OverflowPolicy.DROP_NEWEST, max_messages=4)
+        self.assertEqual(results, [ 'message0', 'message1', 'message2', 'message3' ])
+        self.assertEqual(subscription.dropped_messages, 6)
+        self.assertEqual(subscription.high_water_messages, 4)
+
+        # Drop oldest, by size. (Every message is 19 bytes.)
+        results, subscription = yield from receive(OverflowPolicy.DROP_OLDEST, max_bytes=19 * 3)
+        self.assertEqual(results, [ 'message7', 'message8', 'message9' ])
+        self.assertEqual(subscription.dropped_messages, 7)
+        self.assertEqual(subscription.high_water_bytes, 19 * 3)
+
+        # Block: nothing is lost.
+        results, subscription = yield from receive(OverflowPolicy.BLOCK, max_messages=2)
+        self.assertEqual(results, [ 'message%i' % i for i in range(10) ])
+        self.assertEqual(subscription.dropped_messages, 0)
+        self.assertEqual(subscription.high_water_messages, 2)
+
+        # Unknown policy.
+        with self.assertRaises(Error):
+            yield from protocol.start_subscribe(overflow='unknown')
+
+    @redis_test
+    def test_pubsub_handlers(self, transport, protocol):
+        """ Callbacks for channels and patterns. """
+        transport2, protocol2 = yield from connect(self.loop)
+        subscription = yield from protocol2.start_subscribe()
+
+        received = []
+        def handler(reply):
+            received.append(reply)
+
+        def failing_handler(reply):
+            raise Exception('Failure')
+
+        subscription.add_handler('channel1', handler)
+        subscription.add_handler('channel1', failing_handler)
+        subscription.add_handler('ch*', handler)
+        yield from subscription.subscribe(['channel1', 'channel2'])
+        yield from subscription.psubscribe(['ch*'])
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        yield from protocol.publish('channel1', 'message1')
+        yield from protocol.publish('channel2', 'message2')
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        # Handled messages are not buffered.
+        self.assertEqual(received, [
+                PubSubReply('channel1', 'message1'),
+                PubSubReply('channel1', 'message1', pattern='ch*'),
+                PubSubReply('channel2', 'message2', pattern='ch*'),
+            ])
+        self.assertEqual(subscription.handler_errors, 1)
+        self.assertEqual(subscription.buffered_messages, 1)
+        result = yield from subscription.next_published()
+        self.assertEqual(result, PubSubReply('channel2', 'message2'))
+
+        # Remove handler.
+        subscription.remove_handler('channel1', handler)
+        subscription.remove_handler('channel1', failing_handler)
+        yield from protocol.publish('channel1', 'message3')
+        result = yield from subscription.next_published()
+        self.assertEqual(result, PubSubReply('channel1', 'message3'))
+
+        transport2.close()
+
+    @redis_test
+    def test_publish_many(self, transport, protocol):
+        transport2, protocol2 = yield from connect(self.loop)
+        subscription = yield from protocol2.start_subscribe()
+        yield from subscription.subscribe(['channel1'])
+        yield from asyncio.sleep(.5, loop=self.loop)
+
+        result = yield from protocol.publish_many([ ('channel1', 'message1'), ('channel2', 'message2'), ('channel1', 'message3') ])
+        self.assertEqual(result, [ 1, 0, 1 ])
+
+        # Fire and forget.
+        result = yield from protocol.publish_many([ ('channel1', 'message%i' % i) for i in range(4, 100) ], wait=False)
+        self.assertEqual(result, None)
+
+        # The discarded replies don't get mixed up with the next ones.
+        result = yield from protocol.publish('channel1', 'message100')
+        self.assertEqual(result, 1)
+
+        results = []
+        while len(results) < 99:
+            results.extend((yield from subscription.next_published_batch(max_count=100)))
+        self.assertEqual([ r.value for r in results ], [ 'message1' ] + [ 'message%i' % i for i in range(3, 101) ])
+
+        transport2.close()
+
     @redis_test
     def test_pubsub_patterns(self, transport, protocol):
         """ Test a pubsub connection that subscribes to a pattern. """
@@ -1356,10 +1651,12 @@ class RedisProtocolTest(TestCase):
         return value * ARGV[1]
         """
         yield from protocol.set('foo', '2')
+        yield from protocol.script_flush()
 
-        # Register script
+        # Register script. (Without loading it in the server.)
         script = yield from protocol.register_script(code)
         self.assertIsInstance(script, Script)
+        self.assertEqual((yield from protocol.script_exists([ script.sha ])), [ False ])
 
         # Call script.
         result = yield from script.run(keys=['foo'], args=['5'])
@@ -1384,12 +1681,32 @@ class RedisProtocolTest(TestCase):
         result = yield from protocol.script_exists([ script.sha, script.sha, 'unknown-script' ])
         self.assertEqual(result, [ False, False, False ])
 
+        # After a flush, evalsha fails, but the script loads itself again.
+        with self.assertRaises(NoScriptError):
+            yield from protocol.evalsha(script.sha, keys=['foo'], args=['5'])
+
+        result = yield from script.run(keys=['foo'], args=['5'])
+        result = yield from result.return_value()
+        self.assertEqual(result, 10)
+
+        result = yield from protocol.script_exists([ script.sha ])
+        self.assertEqual(result, [ True ])
+
+        # Test eval
+        result = yield from protocol.eval('return KEYS[1]', keys=['foo'])
+        result = yield from result.return_value()
+        self.assertEqual(result, 'foo')
+
+        # Other errors are not hidden.
+        with self.assertRaises(ErrorReply):
+            yield from protocol.eval('return redis.call("unknown-command")')
+
         # Test another script where evalsha returns a string.
         code2 = """
         return "text"
         """
         script2 = yield from protocol.register_script(code2)
-        result = yield from protocol.evalsha(script2.sha)
+        result = yield from script2.run()
         self.assertIsInstance(result, EvalScriptReply)
         result = yield from result.return_value()
         self.assertIsInstance(result, str)
@@ -1416,6 +1733,41 @@ class RedisProtocolTest(TestCase):
             result = yield from scriptreply.return_value()
             self.assertEqual(result, return_value)
 
+        # Raw bytes.
+        script = yield from protocol.register_script('return {"a", {"b", 1}}')
+        scriptreply = yield from script.run()
+        result = yield from scriptreply.return_value(decode=False)
+        self.assertEqual(result, [b'a', [b'b', 1]])
+
+        # Status and error replies inside tables.
+        script = yield from protocol.register_script('return {{ok="fine"}, {err="broken"}}')
+        scriptreply = yield from script.run()
+        result = yield from scriptreply.return_value()
+        self.assertEqual(result[0], 'fine')
+        self.assertIsInstance(result[1], ErrorReply)
+        self.assertEqual(result[1].args[0], 'broken')
+
+        # Large tables.
+        script = yield from protocol.register_script('local t = {} for i = 1, 10000 do t[i] = tostring(i) end return t')
+        scriptreply = yield from script.run()
+        result = yield from scriptreply.return_value()
+        self.assertEqual(result, [ str(i) for i in range(1, 10001) ])
+
+    @redis_test
+    def test_script_run_many(self, transport, protocol):
+        script = yield from protocol.register_script("return ARGV[1] * 2")
+        results = yield from script.run_many([ (['a'], ['1']), (['b'], ['2']), (['c'], ['x']) ])
+
+        self.assertEqual(results[:2], [ 2, 4 ])
+
+        # Errors are returned per call.
+        self.assertIsInstance(results[2], ErrorReply)
+
+        # After a flush, the script is loaded again.
+        yield from protocol.script_flush()
+        results = yield from script.run_many([ (['a'], ['1']), (['b'], ['2']) ])
+        self.assertEqual(results, [ 2, 4 ])
+
     @redis_test
     def test_script_kill(self, transport, protocol):
         # Test script kill (when nothing is running.)
@@ -1560,6 +1912,23 @@ class RedisProtocolTest(TestCase):
         self.assertIsInstance(result, StatusReply)
         transport2.close()
 
+        # With a wrong password, the connection can still authenticate later.
+        # Commands fail until then, because the database was not selected.
+        transport2, protocol2 = yield from connect(self.loop, lambda **kw: RedisProtocol(password='wrong', db=3, **kw))
+        with self.assertRaises(ErrorReply):
+            yield from protocol2.set('my-key', 'value-in-db-3')
+
+        result = yield from protocol2.auth('newpassword')
+        self.assertIsInstance(result, StatusReply)
+        result = yield from protocol2.set('my-key', 'value-in-db-3')
+        self.assertIsInstance(result, StatusReply)
+        transport2.close()
+
+        # (`auth` has selected database 3 again.)
+        yield from protocol.select(3)
+        result = yield from protocol.get('my-key')
+        self.assertEqual(result, 'value-in-db-3')
+
         # Reset password
         result = yield from protocol.config_set('requirepass', '')
         self.assertIsInstance(result, StatusReply)
@@ -1616,6 +1985,14 @@ class RedisProtocolTest(TestCase):
         self.assertIsInstance(received2, list)
         self.assertEqual(set(received), set(received2))
 
+        # Test fetchmany, and resuming at a position.
+        cursor = yield from protocol.scan(match='*')
+        received3 = yield from cursor.fetchmany()
+
+        cursor = yield from protocol.scan(match='*', cursor=cursor.position)
+        received3 += yield from cursor.fetchall()
+        self.assertEqual(set(received), set(received3))
+
     @redis_test
     def test_set_scan(self, transport, protocol):
         """ Test sscan """
@@ -1860,6 +2237,103 @@ class RedisProtocolTest(TestCase):
         transport2.close()
 
 
+    @redis_test
+    def test_transaction_helper(self, transport, protocol):
+        yield from protocol.set(u'counter', u'0')
+        transport2, protocol2 = yield from connect(self.loop)
+
+        calls = []
+
+        @asyncio.coroutine
+        def increment(protocol, writes):
+            value = yield from protocol.get(u'counter')
+            self.assertTrue(protocol.in_use)
+
+            # Modify the watched key during the first attempt.
+            if not calls:
+                yield from protocol2.set(u'counter', u'10')
+
+            calls.append(value)
+            writes.set(u'counter', str(int(value) + 1))
+            writes.get(u'counter')
+            return int(value) + 1
+
+        reply = yield from protocol.transaction(increment, [u'counter'])
+        self.assertIsInstance(reply, TransactionReply)
+        self.assertEqual(reply.value, 11)
+        self.assertEqual(reply.results, [ StatusReply('OK'), u'11' ])
+        self.assertEqual(reply.retries, 1)
+        self.assertEqual(calls, [ u'0', u'10' ])
+        self.assertFalse(protocol.in_use)
+
+        # Give up after `retries`.
+        @asyncio.coroutine
+        def conflict(protocol, writes):
+            yield from protocol2.incr(u'counter')
+            writes.set(u'counter', u'0')
+
+        with self.assertRaises(TransactionError):
+            yield from protocol.transaction(conflict, [u'counter'], retries=2)
+        self.assertEqual((yield from protocol.get(u'counter')), u'14')
+
+        # Exceptions of the function are raised, and the keys are unwatched.
+        @asyncio.coroutine
+        def fail(protocol, writes):
+            writes.set(u'counter', u'0')
+            raise ZeroDivisionError
+
+        with self.assertRaises(ZeroDivisionError):
+            yield from protocol.transaction(fail, [u'counter'])
+        self.assertFalse(protocol.in_use)
+
+        transport2.close()
+
+    @redis_test
+    def test_bulk_load(self, transport, protocol):
+        yield from protocol.delete([ u'bulk-%i' % i for i in range(1000) ] + [ u'bulk-hash' ])
+
+        # Many buffers, and waiting for the replies in between.
+        commands = ((u'set', u'bulk-%i' % i, i) for i in range(1000))
+        reply = yield from protocol.bulk_load(commands, max_pending=100, buffer_size=1000)
+        self.assertIsInstance(reply, BulkLoadReply)
+        self.assertEqual(reply.commands, 1000)
+        self.assertEqual(reply.errors, 0)
+        self.assertGreater(reply.throughput, 0)
+        self.assertEqual((yield from protocol.get(u'bulk-999')), u'999')
+
+        # Errors are counted.
+        reply = yield from protocol.bulk_load([ (u'hset', u'bulk-hash', u'a', u'1'),
+                                                (u'incr', u'bulk-hash'),
+                                                (b'incr', u'bulk-0') ])
+        self.assertEqual(reply.commands, 3)
+        self.assertEqual(reply.errors, 1)
+        self.assertIsInstance(reply.first_error, ErrorReply)
+
+        # The replies of the next commands are not mixed up.
+        self.assertEqual((yield from protocol.get(u'bulk-0')), u'1')
+        self.assertFalse(protocol.in_use)
+
+        # Async iterators.
+        if sys.version_info >= (3, 5):
+            class Commands:
+                def __init__(self):
+                    self.i = 0
+
+                def __aiter__(self):
+                    return self
+
+                @asyncio.coroutine
+                def __anext__(self):
+                    self.i += 1
+                    if self.i > 10:
+                        raise StopAsyncIteration
+                    yield from asyncio.sleep(0)
+                    return (u'set', u'bulk-%i' % self.i, u'async')
+
+            reply = yield from protocol.bulk_load(Commands())
+            self.assertEqual(reply.commands, 10)
+            self.assertEqual((yield from protocol.get(u'bulk-10')), u'async')
+
 class RedisBytesProtocolTest(TestCase):
     def setUp(self):
         self.loop = asyncio.get_event_loop()
@@ -1953,6 +2427,69 @@ class RedisConnectionTest(TestCase):
 
         self.loop.run_until_complete(test())
 
+    def test_initialization(self):
+        """
+        The connection setup (SELECT, CLIENT SETNAME, SCRIPT LOAD) is sent again
+        on every reconnect, before any other command.
+        """
+        @asyncio.coroutine
+        def test():
+            connection = yield from Connection.create(host=HOST, port=PORT, db=3,
+                                                      client_name='my-connection')
+            other = yield from Connection.create(host=HOST, port=PORT, db=3)
+
+            script = yield from connection.register_script('return 1')
+
+            for i in range(3):
+                yield from other.script_flush()
+
+                # Close the transport and issue commands right after the reconnect.
+                connection.transport.close()
+                yield from asyncio.sleep(1, loop=self.loop)
+
+                f = asyncio.async(connection.set('key', 'value-%i' % i), loop=self.loop)
+                name = yield from connection.client_getname()
+                exists = yield from connection.script_exists([script.sha])
+                yield from f
+
+                self.assertEqual(name, 'my-connection')
+                self.assertEqual(exists, [True])
+
+                # The value has been written in database 3.
+                result = yield from other.get('key')
+                self.assertEqual(result, 'value-%i' % i)
+
+            connection.close()
+            other.close()
+
+        self.loop.run_until_complete(test())
+
+    @unittest.skipIf(not PORT, 'Socket options require a TCP connection.')
+    def test_socket_options(self):
+        @asyncio.coroutine
+        def test():
+            connection = yield from Connection.create(host=HOST, port=PORT,
+                            keepalive=True, rcvbuf=64 * 1024, sndbuf=64 * 1024)
+
+            sock = connection.transport.get_extra_info('socket')
+            self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+            self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
+            # The kernel is allowed to round buffer sizes (Linux doubles them.)
+            self.assertGreaterEqual(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 64 * 1024)
+
+            # Options are applied again after reconnecting.
+            connection.transport.close()
+            yield from asyncio.sleep(1, loop=self.loop)
+
+            sock = connection.transport.get_extra_info('socket')
+            self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
+            yield from connection.set('key', 'value')
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
 
 class RedisPoolTest(TestCase):
     """ Test connection pooling. """
@@ -1981,7 +2518,7 @@ class RedisPoolTest(TestCase):
 
     def test_connection_in_use(self):
         """
-        When a blocking call is running, it's impossible to use the same
+        When a transaction is running, it's impossible to use the same
         protocol for another call.
         """
         @asyncio.coroutine
@@ -1995,12 +2532,19 @@ class RedisPoolTest(TestCase):
             f = asyncio.async(connection.blpop(['unknown-key']), loop=self.loop)
             yield from asyncio.sleep(.1, loop=self.loop) # Sleep to make sure that the above coroutine started executing.
 
+            # The blocking call runs on a connection of its own.
+            self.assertEqual(connection.connections_in_use, 0)
+            self.assertEqual(connection.blocking_connections_in_use, 1)
+
+            transaction = yield from connection.multi()
+
             # Run command in other thread.
             with self.assertRaises(NoAvailableConnectionsInPoolError) as e:
                 yield from connection.set('key', 'value')
             self.assertIn('No available connections in the pool', e.exception.args[0])
 
             self.assertEqual(connection.connections_in_use, 1)
+            yield from transaction.discard()
 
             connection.close()
 
@@ -2084,127 +2628,375 @@ class RedisPoolTest(TestCase):
         @asyncio.coroutine
         def test():
             # Create connection
-            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=10)
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=2, max_blocking_connections=10)
             for i in range(0, 10):
                 yield from connection.delete([ 'my-list-%i' % i ])
 
             @asyncio.coroutine
             def sink(i):
-                the_list, result = yield from connection.blpop(['my-list-%i' % i])
+                reply = yield from connection.blpop(['my-list-%i' % i])
+                self.assertEqual(reply.list_name, 'my-list-%i' % i)
+                self.assertEqual(reply.value, 'value')
 
             futures = []
             for i in range(0, 10):
-                self.assertEqual(connection.connections_in_use, i)
+                self.assertEqual(connection.blocking_connections_in_use, i)
                 futures.append(asyncio.async(sink(i), loop=self.loop))
                 yield from asyncio.sleep(.1, loop=self.loop) # Sleep to make sure that the above coroutine started executing.
 
+            # The connections for other commands are still available.
+            self.assertEqual(connection.connections_in_use, 0)
+            self.assertEqual(connection.blocking_connections, 10)
+
             # One more blocking call should fail.
             with self.assertRaises(NoAvailableConnectionsInPoolError) as e:
                 yield from connection.delete([ 'my-list-one-more' ])
                 yield from connection.blpop(['my-list-one-more'])
-            self.assertIn('No available connections in the pool', e.exception.args[0])
+            self.assertIn('No available connections for blocking commands in the pool', e.exception.args[0])
 
-            connection.close()
+            stats = connection.lane_stats
+            self.assertEqual(stats['blocking']['in_use'], 10)
+            self.assertEqual(stats['blocking']['rejected'], 1)
+            self.assertEqual(stats['commands']['rejected'], 0)
 
-            # Consume this futures (which now contain ConnectionLostError)
-            with self.assertRaises(ConnectionLostError):
-                yield from asyncio.gather(*futures)
+            # When the calls return, up to `poolsize` idle connections are kept.
+            for i in range(0, 10):
+                yield from connection.rpush('my-list-%i' % i, ['value'])
+            yield from asyncio.gather(*futures)
+
+            self.assertEqual(connection.blocking_connections_in_use, 0)
+            self.assertEqual(connection.blocking_connections, 2)
+            self.assertEqual(connection.lane_stats['blocking']['calls'], 10)
+
+            connection.close()
 
         self.loop.run_until_complete(test())
 
-    def test_lua_script_in_pool(self):
+    def test_concurrent_blocking_calls(self):
+        """
+        Blocking calls that start at the same time don't open more than
+        `max_blocking_connections` connections.
+        """
         @asyncio.coroutine
         def test():
-            # Create connection
-            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=3)
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=1, max_blocking_connections=2)
 
-            # Register script
-            script = yield from connection.register_script("return 100")
-            self.assertIsInstance(script, Script)
+            results = yield from asyncio.gather(
+                    *[ connection.blpop(['my-empty-list-%i' % i], timeout=1) for i in range(3) ],
+                    loop=self.loop, return_exceptions=True)
 
-            # Run script
-            scriptreply = yield from script.run()
-            result = yield from scriptreply.return_value()
-            self.assertEqual(result, 100)
+            self.assertEqual(len([ r for r in results if isinstance(r, NoAvailableConnectionsInPoolError) ]), 1)
+            self.assertLessEqual(connection.lane_stats['blocking']['opened'], 2)
 
             connection.close()
 
         self.loop.run_until_complete(test())
 
-    def test_transactions(self):
+    def test_transaction(self):
+        @asyncio.coroutine
+        def test():
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=10)
+            yield from connection.set('counter', '0')
+
+            @asyncio.coroutine
+            def increment(protocol, writes):
+                value = yield from protocol.get('counter')
+                yield from asyncio.sleep(.01)
+                writes.set('counter', str(int(value) + 1))
+
+            # Concurrent transactions on the same key are retried, each of
+            # them on a connection of its own.
+            replies = yield from asyncio.gather(*[
+                        connection.transaction(increment, ['counter'], retries=100) for i in range(10) ])
+            self.assertEqual((yield from connection.get('counter')), '10')
+            self.assertGreater(sum(r.retries for r in replies), 0)
+            self.assertEqual(connection.connections_in_use, 0)
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_transaction_retry_keeps_connection(self):
         """
-        Do several transactions in parallel.
+        The connection of a transaction can't be taken during the delay
+        between the retries.
         """
         @asyncio.coroutine
         def test():
-            # Create connection
-            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=3)
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
+            other = yield from Connection.create(host=HOST, port=PORT)
+            yield from connection.set('counter', '0')
 
-            t1 = yield from connection.multi()
-            t2 = yield from connection.multi()
-            yield from connection.multi()
+            calls = []
 
-            # Fourth transaction should fail. (Pool is full)
-            with self.assertRaises(NoAvailableConnectionsInPoolError) as e:
-                yield from connection.multi()
-            self.assertIn('No available connections in the pool', e.exception.args[0])
+            @asyncio.coroutine
+            def increment(protocol, writes):
+                value = yield from protocol.get('counter')
 
-            # Run commands in transaction
-            yield from t1.set(u'key', u'value')
-            yield from t2.set(u'key2', u'value2')
+                # Modify the watched key during the first attempt.
+                if not calls:
+                    yield from other.set('counter', '10')
 
-            # Commit.
-            yield from t1.exec()
-            yield from t2.exec()
+                calls.append(value)
+                writes.set('counter', str(int(value) + 1))
 
-            # Check
-            result1 = yield from connection.get(u'key')
-            result2 = yield from connection.get(u'key2')
+            f = asyncio.async(connection.transaction(increment, ['counter'], backoff=.2), loop=self.loop)
+            yield from asyncio.sleep(0, loop=self.loop)
 
-            self.assertEqual(result1, u'value')
-            self.assertEqual(result2, u'value2')
+            while not f.done():
+                with self.assertRaises(NoAvailableConnectionsInPoolError):
+                    yield from connection.start_subscribe()
+                yield from asyncio.sleep(.001, loop=self.loop)
+
+            reply = yield from f
+            self.assertEqual(reply.retries, 1)
+            self.assertEqual((yield from connection.get('counter')), '11')
+            self.assertEqual(connection.connections_in_use, 0)
 
             connection.close()
+            other.close()
 
         self.loop.run_until_complete(test())
 
-    def test_connection_reconnect(self):
-        """
-        Test whether the connection reconnects.
-        (needs manual interaction.)
-        """
+    def test_pipelined(self):
         @asyncio.coroutine
         def test():
             connection = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
-            yield from connection.set('key', 'value')
+            protocol = connection._connections[0].protocol
 
-            # Try the reconnect cycle several times. (Be sure that the
-            # `connection_lost` callback doesn't set variables that avoid
-            # reconnection a second time.)
-            for i in range(3):
-                transport = connection._connections[0].transport
-                transport.close()
+            writes = []
+            write = protocol.transport.write
+            protocol.transport.write = lambda data: (writes.append(data), write(data))
 
-                yield from asyncio.sleep(1, loop=self.loop) # Give asyncio time to reconnect.
+            # Other commands, which are started at the same time, are not
+            # written in between.
+            gets = [ asyncio.async(connection.get('my-key'), loop=self.loop) for i in range(5) ]
+            results = yield from connection.pipelined(('set', ('my-key', 'value'), {}), ('get', ('my-key', ), {}))
+            self.assertEqual(results, [ StatusReply('OK'), 'value' ])
+            self.assertIn(b'*3\r\n$3\r\nset\r\n$6\r\nmy-key\r\n$5\r\nvalue\r\n*2\r\n$3\r\nget\r\n$6\r\nmy-key\r\n', writes)
+            yield from asyncio.gather(*gets, loop=self.loop)
 
-                # Test get/set
-                yield from connection.set('key', 'value')
+            # Exceptions are returned, and the other commands are still sent.
+            results = yield from connection.pipelined(('get', (1, ), {}), ('get', ('my-key', ), {}))
+            self.assertIsInstance(results[0], TypeError)
+            self.assertEqual(results[1], 'value')
 
             connection.close()
 
         self.loop.run_until_complete(test())
 
-    def test_connection_lost(self):
-        """
-        When the transport is closed, any further commands should raise
-        NotConnectedError. (Unless the transport would be auto-reconnecting and
-        have established a new connection.)
-        """
+    def test_coalesce_reads(self):
         @asyncio.coroutine
         def test():
-            # Create connection
-            transport, protocol = yield from connect(self.loop, RedisProtocol)
-            yield from protocol.set('key', 'value')
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=2, coalesce_reads=True)
+            yield from connection.delete([ 'key', 'key2', 'set' ])
+            yield from connection.set('key', 'value')
+
+            # Identical reads in flight share one request.
+            results = yield from asyncio.gather(*[ connection.get('key') for i in range(10) ])
+            self.assertEqual(results, [ 'value' ] * 10)
+            self.assertEqual(connection.coalesced_calls, 9)
+
+            # Different arguments, or streaming replies, are not coalesced.
+            yield from asyncio.gather(connection.get('key'), connection.get('key2'))
+            yield from asyncio.gather(connection.smembers('set'), connection.smembers('set'))
+            self.assertEqual(connection.coalesced_calls, 9)
+
+            # Reads after a write don't join reads from before the write.
+            f = asyncio.async(connection.get('key'))
+            yield from connection.set('key', 'value2')
+            result = yield from connection.get('key')
+            self.assertEqual(result, 'value2')
+            yield from f
+            self.assertEqual(connection.coalesced_calls, 9)
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_pubsub_hub(self):
+        @asyncio.coroutine
+        def test():
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
+            hub = yield from connection.get_pubsub_hub(connections=2)
+            self.assertIsInstance(hub, PubSubHub)
+            self.assertIs((yield from connection.get_pubsub_hub()), hub)
+
+            subscription1 = yield from hub.start_subscribe()
+            subscription2 = yield from hub.start_subscribe(max_messages=1, overflow=OverflowPolicy.DROP_OLDEST)
+            self.assertIsInstance(subscription1, HubSubscription)
+
+            yield from subscription1.subscribe(['channel1', 'channel2'])
+            yield from subscription2.subscribe(['channel1'])
+            yield from subscription2.psubscribe(['chan*'])
+            self.assertEqual(hub.channels, { 'channel1': 2, 'channel2': 1 })
+            self.assertEqual(hub.patterns, { 'chan*': 1 })
+            yield from asyncio.sleep(.5)
+
+            # The pool connection is still available for other commands.
+            result = yield from connection.publish('channel1', 'message1')
+            self.assertEqual(result, 2) # Two receivers: the channel and the pattern.
+            yield from connection.publish('channel2', 'message2')
+            yield from asyncio.sleep(.5)
+
+            # (The channels can be served by different connections, so the
+            # order is not defined.)
+            results = yield from subscription1.next_published_batch()
+            self.assertEqual(sorted(r.value for r in results), [ 'message1', 'message2' ])
+
+            # Three messages for subscription2, only the last one is kept.
+            results = yield from subscription2.next_published_batch()
+            self.assertEqual(len(results), 1)
+            self.assertEqual(subscription2.dropped_messages, 2)
+
+            # Unsubscribe when the last local subscription leaves.
+            subscription1.close()
+            yield from asyncio.sleep(.5)
+            self.assertEqual(hub.channels, { 'channel1': 1 })
+            result = yield from connection.pubsub_numsub_asdict(['channel2'])
+            self.assertEqual(int(result['channel2']), 0)
+
+            with self.assertRaises(Error):
+                yield from subscription1.next_published()
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_publish_many_in_pool(self):
+        @asyncio.coroutine
+        def test():
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=3)
+            subscriber = yield from Connection.create(host=HOST, port=PORT)
+            subscription = yield from subscriber.start_subscribe()
+            yield from subscription.subscribe([ 'channel%i' % i for i in range(5) ])
+            yield from asyncio.sleep(.5)
+
+            messages = [ ('channel%i' % (i % 10), 'message%i' % i) for i in range(100) ]
+            result = yield from connection.publish_many(messages)
+            self.assertEqual(result, [ 1 if i % 10 < 5 else 0 for i in range(100) ])
+
+            # Messages for one channel stay in order.
+            results = []
+            while len(results) < 50:
+                results.extend((yield from subscription.next_published_batch()))
+
+            for i in range(5):
+                self.assertEqual([ r.value for r in results if r.channel == 'channel%i' % i ],
+                                 [ 'message%i' % j for j in range(i, 100, 10) ])
+
+            subscriber.close()
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_lua_script_in_pool(self):
+        @asyncio.coroutine
+        def test():
+            # Create connection
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=3)
+
+            # Register script
+            script = yield from connection.register_script("return 100")
+            self.assertIsInstance(script, Script)
+
+            # Run script
+            scriptreply = yield from script.run()
+            result = yield from scriptreply.return_value()
+            self.assertEqual(result, 100)
+
+            # All connections know the script, for when they reconnect.
+            for c in connection._connections:
+                self.assertIn(script.sha, c.protocol._scripts)
+
+            # Flushing costs one extra round trip.
+            yield from connection.script_flush()
+            scriptreply = yield from script.run()
+            result = yield from scriptreply.return_value()
+            self.assertEqual(result, 100)
+
+            # Run many
+            results = yield from script.run_many([ ([], []) ] * 10)
+            self.assertEqual(results, [ 100 ] * 10)
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_transactions(self):
+        """
+        Do several transactions in parallel.
+        """
+        @asyncio.coroutine
+        def test():
+            # Create connection
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=3)
+
+            t1 = yield from connection.multi()
+            t2 = yield from connection.multi()
+            yield from connection.multi()
+
+            # Fourth transaction should fail. (Pool is full)
+            with self.assertRaises(NoAvailableConnectionsInPoolError) as e:
+                yield from connection.multi()
+            self.assertIn('No available connections in the pool', e.exception.args[0])
+
+            # Run commands in transaction
+            yield from t1.set(u'key', u'value')
+            yield from t2.set(u'key2', u'value2')
+
+            # Commit.
+            yield from t1.exec()
+            yield from t2.exec()
+
+            # Check
+            result1 = yield from connection.get(u'key')
+            result2 = yield from connection.get(u'key2')
+
+            self.assertEqual(result1, u'value')
+            self.assertEqual(result2, u'value2')
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_connection_reconnect(self):
+        """
+        Test whether the connection reconnects.
+        (needs manual interaction.)
+        """
+        @asyncio.coroutine
+        def test():
+            connection = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
+            yield from connection.set('key', 'value')
+
+            # Try the reconnect cycle several times. (Be sure that the
+            # `connection_lost` callback doesn't set variables that avoid
+            # reconnection a second time.)
+            for i in range(3):
+                transport = connection._connections[0].transport
+                transport.close()
+
+                yield from asyncio.sleep(1, loop=self.loop) # Give asyncio time to reconnect.
+
+                # Test get/set
+                yield from connection.set('key', 'value')
+
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_connection_lost(self):
+        """
+        When the transport is closed, any further commands should raise
+        NotConnectedError. (Unless the transport would be auto-reconnecting and
+        have established a new connection.)
+        """
+        @asyncio.coroutine
+        def test():
+            # Create connection
+            transport, protocol = yield from connect(self.loop, RedisProtocol)
+            yield from protocol.set('key', 'value')
 
             # Close transport
             self.assertEqual(protocol.is_connected, True)
@@ -2242,6 +3034,680 @@ class RedisPoolTest(TestCase):
         self.loop.run_until_complete(test())
 
 
+class HashRingTest(TestCase):
+    """ Test the consistent hash ring. (No Redis server required.) """
+    def test_distribution(self):
+        ring = HashRing({ 'a': 1, 'b': 1, 'c': 1, 'd': 2 })
+        counts = { 'a': 0, 'b': 0, 'c': 0, 'd': 0 }
+
+        for i in range(10000):
+            counts[ring.get_node(('key-%i' % i).encode('ascii'))] += 1
+
+        # Every node gets its share, the node with weight 2 about twice as much.
+        for name in 'abc':
+            self.assertGreater(counts[name], 1400)
+            self.assertLess(counts[name], 2600)
+        self.assertGreater(counts['d'], 3000)
+
+    def test_remapping(self):
+        ring = HashRing({ 'a': 1, 'b': 1, 'c': 1 })
+        keys = [ ('key-%i' % i).encode('ascii') for i in range(10000) ]
+        before = { k: ring.get_node(k) for k in keys }
+
+        # Adding a fourth node moves about 1/4 of the keys, and only to the new node.
+        ring.add_node('d')
+        moved = [ k for k in keys if ring.get_node(k) != before[k] ]
+        self.assertLess(len(moved), 3500)
+        self.assertTrue(all(ring.get_node(k) == 'd' for k in moved))
+
+        # Removing it again restores the original mapping.
+        ring.remove_node('d')
+        self.assertTrue(all(ring.get_node(k) == before[k] for k in keys))
+
+    def test_hashtag(self):
+        ring = HashRing({ 'a': 1, 'b': 1, 'c': 1 })
+
+        nodes = set(ring.get_node(('user:{1000}:%i' % i).encode('ascii')) for i in range(100))
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(HashRing.hash_key(b'user:{1000}:x'), HashRing.hash_key(b'1000'))
+
+        # Empty braces are not a hashtag.
+        self.assertNotEqual(HashRing.hash_key(b'a{}b'), HashRing.hash_key(b''))
+
+    def test_no_nodes(self):
+        with self.assertRaises(Error):
+            HashRing().get_node(b'key')
+
+
+class QueueConsumerTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_queue_consumer(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
+            yield from pool.delete([ 'jobs', 'jobs:processing', 'jobs:deadlines', 'jobs:attempts', 'jobs:failed' ])
+
+            handled = []
+            @asyncio.coroutine
+            def handler(job):
+                handled.append(job)
+                if job.startswith('fail'):
+                    raise Exception('Failure')
+                yield from asyncio.sleep(.05)
+
+            consumer = yield from QueueConsumer.create(pool, 'jobs', handler, concurrency=4, max_attempts=2)
+            yield from pool.lpush('jobs', [ 'job%i' % i for i in range(20) ] + [ 'fail' ])
+            yield from asyncio.sleep(1)
+
+            # The blocking calls use the connections for blocking commands.
+            self.assertEqual(pool.connections_in_use, 0)
+            self.assertEqual(pool.blocking_connections_in_use, 4)
+
+            # Failed jobs are retried, then moved to the failed list.
+            self.assertEqual(sorted(handled), sorted([ 'job%i' % i for i in range(20) ] + [ 'fail', 'fail' ]))
+            self.assertEqual(consumer.processed, 20)
+            self.assertEqual(consumer.failed, 2)
+            self.assertGreater(consumer.throughput, 0)
+            self.assertGreaterEqual(consumer.max_latency, .05)
+            self.assertEqual((yield from pool.lrange_aslist('jobs:failed')), [ 'fail' ])
+            self.assertEqual((yield from pool.llen('jobs:processing')), 0)
+
+            # A job of a consumer that crashed is recovered after its deadline.
+            yield from consumer.stop()
+            yield from pool.lpush('jobs:processing', [ 'stalled' ])
+            yield from pool.zadd('jobs:deadlines', { 'stalled': time.time() - 1 })
+
+            consumer = yield from QueueConsumer.create(pool, 'jobs', handler)
+            result = yield from consumer.recover_stalled_jobs()
+            self.assertEqual(result, 1)
+            yield from asyncio.sleep(.5)
+            self.assertIn('stalled', handled)
+
+            yield from consumer.stop()
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+
+class StreamGroupConsumerTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_stream_group_consumer(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from Pool.create(host=HOST, port=PORT, poolsize=1)
+            yield from pool.delete([ 'events' ])
+
+            handled = []
+            @asyncio.coroutine
+            def handler(entries):
+                if any(fields.get('fail') for id, fields in entries):
+                    raise Exception('Failure')
+                handled.extend(fields['i'] for id, fields in entries)
+
+            consumer = yield from StreamGroupConsumer.create(pool, 'events', 'group', 'consumer', handler,
+                                                             count=10, block=100, claim_idle_time=0, max_deliveries=2)
+
+            for i in range(25):
+                yield from pool.xadd('events', { 'i': str(i) })
+            yield from asyncio.sleep(.5)
+
+            # Handled in batches, and acknowledged.
+            self.assertEqual(handled, [ str(i) for i in range(25) ])
+            self.assertEqual(consumer.processed, 25)
+            self.assertGreaterEqual(consumer.batches, 3)
+            self.assertEqual((yield from pool.xpending('events', 'group'))[0], 0)
+
+            # A failing entry stays pending, is claimed, and dropped after `max_deliveries`.
+            yield from pool.xadd('events', { 'fail': '1' })
+            yield from asyncio.sleep(.5)
+            self.assertEqual(consumer.failed, 1)
+            self.assertEqual((yield from pool.xpending('events', 'group'))[0], 1)
+
+            result = yield from consumer.claim_stale_entries()
+            self.assertEqual(result, 1)
+            self.assertEqual(consumer.failed, 2)
+
+            result = yield from consumer.claim_stale_entries()
+            self.assertEqual(result, 0)
+            self.assertEqual(consumer.dropped, 1)
+            self.assertEqual((yield from pool.xpending('events', 'group'))[0], 0)
+
+            yield from consumer.stop()
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_claim_with_bytes_encoder(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from Pool.create(host=HOST, port=PORT, poolsize=1, encoder=BytesEncoder())
+            yield from pool.delete([ b'bytes-events' ])
+
+            @asyncio.coroutine
+            def handler(entries):
+                raise Exception('Failure')
+
+            consumer = yield from StreamGroupConsumer.create(pool, b'bytes-events', b'group', b'consumer', handler,
+                                                             count=1, block=100, claim_idle_time=0)
+            yield from pool.xadd(b'bytes-events', { b'i': b'1' })
+            yield from pool.xadd(b'bytes-events', { b'i': b'2' })
+            yield from asyncio.sleep(.5)
+
+            # Pages through the pending entries, one at a time.
+            result = yield from consumer.claim_stale_entries()
+            self.assertEqual(result, 2)
+
+            yield from consumer.stop()
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+
+class KeyspaceMigrationTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_migration(self):
+        @asyncio.coroutine
+        def test():
+            source = yield from Pool.create(host=HOST, port=PORT, poolsize=2, db=4)
+            destination = yield from Pool.create(host=HOST, port=PORT, poolsize=2, db=5)
+            yield from source.flushdb()
+            yield from destination.flushdb()
+
+            yield from source.bulk_load(('set', 'key-%i' % i, str(i)) for i in range(500))
+            yield from source.hmset('hash', { 'a': '1' })
+            yield from source.expire('hash', 100)
+            yield from destination.set('key-0', 'existing')
+
+            migration = KeyspaceMigration(source, destination, count=50, checkpoint_key='checkpoint')
+            result = yield from migration.run()
+
+            # The existing key failed, without `replace`.
+            self.assertEqual(result, 500)
+            self.assertEqual(migration.migrated, 500)
+            self.assertEqual(migration.failed, 1)
+            self.assertEqual(migration.position, 0)
+            self.assertEqual((yield from destination.get('key-0')), 'existing')
+            self.assertEqual((yield from destination.get('key-499')), '499')
+            self.assertEqual((yield from destination.hgetall_asdict('hash')), { 'a': '1' })
+            self.assertGreater((yield from destination.pttl('hash')), 0)
+            self.assertFalse((yield from destination.exists('checkpoint')))
+
+            # Resume from a checkpoint.
+            cursor = yield from source.scan()
+            cursor.count = 50
+            yield from cursor.fetchmany()
+            yield from destination.set('checkpoint', str(cursor.position))
+
+            migration = KeyspaceMigration(source, destination, count=50, replace=True, checkpoint_key='checkpoint')
+            result = yield from migration.run()
+            self.assertLess(result, 501)
+            self.assertEqual(migration.failed, 0)
+
+            source.close()
+            destination.close()
+
+        self.loop.run_until_complete(test())
+
+
+class NearCacheTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_near_cache(self):
+        @asyncio.coroutine
+        def test():
+            cache = yield from NearCache.create(host=HOST, port=PORT)
+            pool = yield from Pool.create(host=HOST, port=PORT, poolsize=2, near_cache=cache)
+            other = yield from Connection.create(host=HOST, port=PORT)
+            self.assertTrue(cache.active)
+
+            yield from other.set('cached-key', 'value')
+
+            # First read is a miss, then hits.
+            for i in range(3):
+                result = yield from pool.get('cached-key')
+                self.assertEqual(result, 'value')
+            self.assertEqual(cache.misses, 1)
+            self.assertEqual(cache.hits, 2)
+            self.assertEqual(len(cache), 1)
+            self.assertGreater(cache.memory, 0)
+
+            # A write from another client invalidates the key.
+            yield from other.set('cached-key', 'value2')
+            yield from asyncio.sleep(.1)
+            self.assertGreaterEqual(cache.invalidations, 1)
+            self.assertEqual(len(cache), 0)
+
+            result = yield from pool.get('cached-key')
+            self.assertEqual(result, 'value2')
+            self.assertEqual(cache.misses, 2)
+
+            # Other commands are not cached.
+            yield from pool.strlen('cached-key')
+            self.assertEqual(cache.misses, 2)
+
+            pool.close()
+            other.close()
+            cache.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_eviction(self):
+        @asyncio.coroutine
+        def test():
+            cache = yield from NearCache.create(host=HOST, port=PORT, max_entries=2)
+            connection = yield from Connection.create(host=HOST, port=PORT, near_cache=cache)
+
+            for k in ('a', 'b', 'a', 'c'):
+                yield from connection.get(k)
+
+            # 'b' was the least recently used.
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.evictions, 1)
+            self.assertEqual(sorted(k[2] for k in cache._entries), [ b'a', b'c' ])
+
+            connection.close()
+            cache.close()
+
+        self.loop.run_until_complete(test())
+
+
+class TTLCacheTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_ttl_cache(self):
+        @asyncio.coroutine
+        def test():
+            cache = TTLCache({ 'ttl-cached-*': .2, 'small-*': (10, 1) })
+            connection = yield from Connection.create(host=HOST, port=PORT, near_cache=cache)
+            other = yield from Connection.create(host=HOST, port=PORT)
+
+            # (The cache is used, even while it's empty.)
+            self.assertEqual(len(cache), 0)
+
+            yield from connection.set('ttl-cached-key', 'value')
+            yield from connection.set('uncached-key', 'value')
+
+            # Only keys that match a pattern are cached.
+            for i in range(3):
+                yield from connection.get('ttl-cached-key')
+                yield from connection.get('uncached-key')
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(cache.misses, 1)
+            self.assertEqual(cache.hits, 2)
+
+            # Writes through the same client invalidate.
+            yield from connection.set('ttl-cached-key', 'value2')
+            result = yield from connection.get('ttl-cached-key')
+            self.assertEqual(result, 'value2')
+            self.assertEqual(cache.misses, 2)
+
+            # Writes of other clients are seen after the TTL.
+            yield from other.set('ttl-cached-key', 'value3')
+            result = yield from connection.get('ttl-cached-key')
+            self.assertEqual(result, 'value2')
+            yield from asyncio.sleep(.3)
+            result = yield from connection.get('ttl-cached-key')
+            self.assertEqual(result, 'value3')
+
+            # Concurrent misses share one request.
+            yield from connection.delete([ 'ttl-cached-key' ])
+            misses = cache.misses
+            results = yield from asyncio.gather(*[ connection.get('ttl-cached-key') for i in range(5) ])
+            self.assertEqual(results, [ None ] * 5)
+            self.assertEqual(cache.misses, misses + 1)
+            self.assertEqual(cache.coalesced, 4)
+
+            # Maximum size per pattern.
+            yield from connection.get('small-1')
+            yield from connection.get('small-2')
+            self.assertEqual(cache.evictions, 1)
+
+            connection.close()
+            other.close()
+
+        self.loop.run_until_complete(test())
+
+
+class SentinelTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    @unittest.skipIf(not PORT, 'Requires a TCP connection.')
+    def test_follow_primary(self):
+        """
+        Connections ask the sentinel for the address on every reconnect.
+        (Without a sentinel server, a stub gives the address.)
+        """
+        class StubSentinel:
+            address = (HOST, PORT)
+            registered = set()
+
+            @asyncio.coroutine
+            def get_primary_address(self):
+                return self.address
+
+            def _forget_primary_address(self, host, port):
+                pass
+
+            def _register(self, connection):
+                self.registered.add(connection)
+
+            def _unregister(self, connection):
+                self.registered.discard(connection)
+
+        @asyncio.coroutine
+        def test():
+            sentinel = StubSentinel()
+            pool = yield from Pool.create(host='unused', port=1, poolsize=2, sentinel=sentinel)
+            self.assertEqual(len(sentinel.registered), 2)
+
+            yield from pool.set('key', 'value')
+            self.assertEqual(pool._connections[0].host, HOST)
+
+            # On a reconnect, the new address is used.
+            sentinel.address = ('127.0.0.1', PORT)
+            for c in pool._connections:
+                c.transport.close()
+            yield from asyncio.sleep(.5)
+
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value')
+            self.assertEqual(pool._connections[0].host, '127.0.0.1')
+
+            pool.close()
+            self.assertEqual(len(sentinel.registered), 0)
+
+        self.loop.run_until_complete(test())
+
+    @unittest.skipIf(not SENTINEL_PORT, 'REDIS_SENTINEL_PORT not set.')
+    def test_sentinel(self):
+        @asyncio.coroutine
+        def test():
+            sentinel = yield from Sentinel.create([ ('localhost', 1), ('localhost', SENTINEL_PORT) ], 'mymaster')
+            self.assertEqual(sentinel.primary_address[1], PORT)
+
+            pool = yield from sentinel.create_pool(poolsize=2)
+            yield from pool.set('key', 'value')
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value')
+
+            pool.close()
+            sentinel.close()
+
+        self.loop.run_until_complete(test())
+
+
+class ReplicaPoolTest(TestCase):
+    """
+    The primary acts as its own replica here: reads and writes go to different
+    pools of the same server.
+    """
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_role(self):
+        @asyncio.coroutine
+        def test():
+            connection = yield from Connection.create(host=HOST, port=PORT)
+            result = yield from connection.role()
+            self.assertIsInstance(result, RoleReply)
+            self.assertEqual(result.role, 'master')
+            self.assertIsInstance(result.offset, int)
+
+            result = yield from connection.wait(0, 10)
+            self.assertEqual(result, 0)
+            connection.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_routing(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from ReplicaPool.create(primary=(HOST, PORT), replicas=[ (HOST, PORT) ])
+            replica = list(pool.replicas.values())[0]
+            self.assertEqual(pool.healthy_replicas, list(pool.replicas))
+
+            # Reads go to the replica, writes to the primary.
+            self.assertIs(pool._get_read_pool(), replica)
+            self.assertIn(pool.get.__self__, [ c.protocol for c in replica._connections ])
+            self.assertIn(pool.set.__self__, [ c.protocol for c in pool.primary._connections ])
+
+            yield from pool.set('key', 'value')
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value')
+
+            # Without healthy replicas, reads fail unless the policy falls back to the primary.
+            pool._latencies = { name: None for name in pool._latencies }
+            with self.assertRaises(NoAvailableConnectionsInPoolError):
+                yield from pool.get('key')
+
+            pool._read_policy = ReadPolicy.PRIMARY_FALLBACK
+            self.assertIs(pool._get_read_pool(), pool.primary)
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value')
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_read_your_writes(self):
+        @asyncio.coroutine
+        def test():
+            # WAIT after every write.
+            pool = yield from ReplicaPool.create(primary=(HOST, PORT), replicas=[ (HOST, PORT) ],
+                            read_your_writes=ReadYourWrites.WAIT, wait_replicas=0)
+            result = yield from pool.set('key', 'value')
+            self.assertEqual(result, StatusReply('OK'))
+
+            # Blocking commands run on a blocking connection of the primary,
+            # without WAIT.
+            yield from pool.delete([ 'my-list' ])
+            yield from pool.rpush('my-list', [ 'value' ])
+            result = yield from pool.blpop([ 'my-list' ], timeout=1)
+            self.assertEqual(result.value, 'value')
+            self.assertEqual(pool.primary.lane_stats['blocking']['calls'], 1)
+            pool.close()
+
+            # Replication offsets.
+            pool = yield from ReplicaPool.create(primary=(HOST, PORT), replicas=[ (HOST, PORT) ],
+                            read_your_writes=ReadYourWrites.OFFSET)
+            replica = list(pool.replicas.values())[0]
+
+            yield from pool.set('key', 'value2')
+
+            # The replica didn't report this offset yet, so read from the primary.
+            pool._offsets = { name: -1 for name in pool._offsets }
+            self.assertIs(pool._get_read_pool(), pool.primary)
+
+            yield from pool._check_replicas()
+            self.assertIs(pool._get_read_pool(), replica)
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value2')
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+
+class ShardedPoolTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_sharded_pool(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from ShardedPool.create(nodes=[ (HOST, PORT) ], poolsize=2)
+
+            # Single key commands.
+            yield from pool.set('key', 'value')
+            result = yield from pool.get('key')
+            self.assertEqual(result, 'value')
+
+            yield from pool.hmset('hash', { 'a': 'b' })
+            result = yield from pool.hgetall_asdict(key='hash')
+            self.assertEqual(result, { 'a': 'b' })
+
+            # Commands without key can't be routed.
+            with self.assertRaises(Error):
+                yield from pool.ping()
+
+            # But they can run on a node directly.
+            result = yield from pool.get_pool('key').ping()
+            self.assertEqual(result, StatusReply('PONG'))
+
+            # Scripts run on the node of their keys.
+            script = yield from pool.register_script("return redis.call('get', KEYS[1])")
+            reply = yield from script.run(keys=['key'])
+            result = yield from reply.return_value()
+            self.assertEqual(result, 'value')
+
+            results = yield from script.run_many([ (['key'], []), (['unknown-key'], []) ])
+            self.assertEqual(results, [ 'value', None ])
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+    @unittest.skipIf(not PORT, 'Requires a TCP connection.')
+    def test_multi_key_commands(self):
+        """
+        Multi-key commands are split over the nodes. (The two nodes are the
+        same server, reached through two different addresses.)
+        """
+        @asyncio.coroutine
+        def test():
+            pool = yield from ShardedPool.create(nodes=[ ('localhost', PORT), ('127.0.0.1', PORT) ])
+            keys = [ 'key-%i' % i for i in range(20) ]
+
+            # Make sure that the keys are really spread over both nodes.
+            nodes = set(pool.ring.get_node(k.encode('ascii')) for k in keys)
+            self.assertEqual(len(nodes), 2)
+
+            yield from pool.delete(keys)
+            yield from pool.mset({ k: 'value-%s' % k for k in keys })
+
+            result = yield from pool.mget_aslist(keys + [ 'unknown' ])
+            self.assertEqual(result, [ 'value-%s' % k for k in keys ] + [ None ])
+
+            # Sets.
+            yield from pool.sadd('set-a', ['1', '2', '3'])
+            yield from pool.sadd('set-b', ['2', '3', '4'])
+            yield from pool.sadd('set-c', ['3', '5'])
+            set_keys = ['set-a', 'set-b', 'set-c']
+
+            self.assertEqual((yield from pool.sinter_asset(set_keys)), { '3' })
+            self.assertEqual((yield from pool.sunion_asset(set_keys)), { '1', '2', '3', '4', '5' })
+            self.assertEqual((yield from pool.sdiff_asset(set_keys)), { '1' })
+
+            # Without keys, they fail like any command without a key.
+            for method in (pool.sinter_asset, pool.sunion_asset, pool.sdiff_asset):
+                with self.assertRaises(Error):
+                    yield from method([ ])
+
+            result = yield from pool.delete(keys + set_keys)
+            self.assertEqual(result, 23)
+
+            # When one node is down, the errors and results are reported per node.
+            pool.nodes['127.0.0.1:%i' % PORT].close()
+
+            with self.assertRaises(PartialFailureError) as e:
+                yield from pool.mget_aslist(keys)
+            self.assertEqual(list(e.exception.errors), [ '127.0.0.1:%i' % PORT ])
+            self.assertIsInstance(e.exception.errors['127.0.0.1:%i' % PORT], NoAvailableConnectionsInPoolError)
+            self.assertEqual(list(e.exception.results), [ 'localhost:%i' % PORT ])
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+
+class KeySlotTest(TestCase):
+    """ Test the cluster hash slot calculation. (No Redis server required.) """
+    def test_key_slot(self):
+        self.assertEqual(key_slot(b'123456789'), 12739)
+        self.assertEqual(key_slot(b'foo'), 12182)
+        self.assertEqual(key_slot(b''), 0)
+
+    def test_hashtag(self):
+        self.assertEqual(key_slot(b'{user1000}.following'), key_slot(b'user1000'))
+        self.assertEqual(key_slot(b'foo{bar}{zap}'), key_slot(b'bar'))
+
+        # Empty hashtag: the whole key is hashed.
+        self.assertEqual(key_slot(b'foo{}{bar}'), key_slot(b'foo{}{bar}'))
+        self.assertNotEqual(key_slot(b'foo{}{bar}'), key_slot(b'bar'))
+
+
+@unittest.skipIf(not CLUSTER_PORTS, 'REDIS_CLUSTER_PORTS not set.')
+class ClusterPoolTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+
+    def test_cluster_pool(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from ClusterPool.create(nodes=[ ('localhost', CLUSTER_PORTS[0]) ])
+            self.assertEqual(len(pool.nodes), len(CLUSTER_PORTS))
+
+            # Keys in all slots.
+            for i in range(100):
+                yield from pool.set('key-%i' % i, 'value-%i' % i)
+
+            for i in range(100):
+                result = yield from pool.get('key-%i' % i)
+                self.assertEqual(result, 'value-%i' % i)
+
+            # Multi-key commands are split by slot.
+            keys = [ 'key-%i' % i for i in range(100) ] + [ 'unknown' ]
+            result = yield from pool.mget_aslist(keys)
+            self.assertEqual(result, [ 'value-%i' % i for i in range(100) ] + [ None ])
+
+            result = yield from pool.delete(keys)
+            self.assertEqual(result, 100)
+
+            yield from pool.mset({ k: 'value' for k in keys })
+            result = yield from pool.mget_aslist(keys)
+            self.assertEqual(result, [ 'value' ] * len(keys))
+            yield from pool.delete(keys)
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+    def test_moved(self):
+        @asyncio.coroutine
+        def test():
+            pool = yield from ClusterPool.create(nodes=[ ('localhost', p) for p in CLUSTER_PORTS ])
+
+            # Corrupt the slot map: everything on one node. The MOVED replies
+            # should bring us to the right node and refresh the map.
+            correct = list(pool._slots)
+            pool._slots = [ correct[0] ] * len(correct)
+
+            for i in range(100):
+                yield from pool.set('key-%i' % i, 'value')
+
+            yield from pool.refresh_slots()
+            self.assertEqual(pool._slots, correct)
+
+            # Slots that are not served by any node.
+            pool._slots[key_slot(b'key-0')] = None
+            with self.assertRaises(Error) as e:
+                yield from pool.mget_aslist([ 'key-0', 'key-1' ])
+            self.assertIn('is not served by any node', e.exception.args[0])
+
+            pool.close()
+
+        self.loop.run_until_complete(test())
+
+
 class NoGlobalLoopTest(TestCase):
     """
     If we set the global loop variable to None, everything should still work.
@@ -2332,6 +3798,52 @@ def _start_redis_server(loop):
     return redis_srv
 
 
+def _start_redis_cluster(loop):
+    """
+    Start a Redis Cluster on localhost, one master for each of the
+    REDIS_CLUSTER_PORTS, and divide the hash slots between them.
+    """
+    print('Running Redis cluster REDIS_CLUSTER_PORTS=%r...' % (CLUSTER_PORTS, ))
+    directory = tempfile.mkdtemp()
+    servers = []
+
+    for port in CLUSTER_PORTS:
+        servers.append(loop.run_until_complete(
+                asyncio.create_subprocess_exec(
+                    'redis-server',
+                    '--port', str(port),
+                    '--cluster-enabled', 'yes',
+                    '--cluster-config-file', 'nodes-%i.conf' % port,
+                    '--dir', directory,
+                    '--save', '""',
+                    '--loglevel', 'warning',
+                    loop=loop,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL)))
+    loop.run_until_complete(asyncio.sleep(.5, loop=loop))
+
+    @asyncio.coroutine
+    def setup():
+        connections = []
+        for port in CLUSTER_PORTS:
+            connections.append((yield from Connection.create(host='127.0.0.1', port=port, loop=loop)))
+
+        # Divide the slots and let the nodes meet each other.
+        per_node = 16384 // len(connections) + 1
+        for i, c in enumerate(connections):
+            yield from c.cluster_addslots(list(range(i * per_node, min(16384, (i + 1) * per_node))))
+            yield from c.cluster_meet('127.0.0.1', CLUSTER_PORTS[0])
+
+        # Wait for the cluster to become available.
+        for c in connections:
+            while 'cluster_state:ok' not in (yield from c.cluster_info()):
+                yield from asyncio.sleep(.1, loop=loop)
+            c.close()
+
+    loop.run_until_complete(setup())
+    return servers
+
+
 @unittest.skipIf(hiredis == None, 'Hiredis not found.')
 class HiRedisProtocolTest(RedisProtocolTest):
     def setUp(self):
@@ -2350,9 +3862,16 @@ if __name__ == '__main__':
     if START_REDIS_SERVER:
         redis_srv = _start_redis_server(asyncio.get_event_loop())
 
+    if START_REDIS_CLUSTER:
+        cluster_srvs = _start_redis_cluster(asyncio.get_event_loop())
+
     try:
         unittest.main()
     finally:
         if START_REDIS_SERVER:
             redis_srv.terminate()
 
+        if START_REDIS_CLUSTER:
+            for srv in cluster_srvs:
+                srv.terminate()
+